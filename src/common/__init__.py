@@ -0,0 +1,6 @@
+"""
+Shared infrastructure for the LO generation, evaluation and collection scripts.
+
+Scripts in the sibling folders are run directly (not installed), so each one
+puts ``src/`` on ``sys.path`` before importing from this package.
+"""
@@ -0,0 +1,210 @@
+"""
+Benchmark: the per-script JSON parsers vs. common/json_extract.extract_json
+
+Replays a corpus of captured LLM replies through the four parsers the scripts
+used before json_extract existed and through extract_json, and compares time
+per reply and how many replies each one turns into JSON. The corpus is every
+response in the LLM response cache (LLM_CACHE_PATH) plus any --corpus files
+(JSONL with a "text"/"response" field per line, or one reply per .txt file);
+with --synthetic (or an empty corpus) generated replies are used instead.
+
+Run from src/:  python -m common.benchmark_json_extract [--corpus FILE ...]
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.json_extract import extract_json
+from common.llm_cache import DEFAULT_CACHE_PATH
+
+# ==================== CONFIGURATION ====================
+SYNTHETIC_SIZE = 2000
+DEFAULT_REPEATS = 5
+
+
+# ==================== LEGACY PARSERS ====================
+# Reference copies of the parsers extract_json replaced, kept only for comparison
+def legacy_graph(text: str):
+    """iteration2 graph: extract_json_from_response"""
+    if "```json" in text:
+        start = text.find("```json") + 7
+        json_str = text[start:text.find("```", start)].strip()
+    elif "```" in text:
+        start = text.find("```") + 3
+        json_str = text[start:text.find("```", start)].strip()
+    else:
+        json_str = text.strip()
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        start_idx = json_str.find('{')
+        end_idx = json_str.rfind('}') + 1
+        if start_idx != -1 and end_idx > start_idx:
+            return json.loads(json_str[start_idx:end_idx])
+        raise
+
+
+def legacy_simple(text: str):
+    """iteration2 simple_*: parse_json_response"""
+    text = text.strip()
+    if "```" in text:
+        idx = text.find("```")
+        lines = text[idx:].split("\n")[1:]
+        json_lines = []
+        for line in lines:
+            if line.strip() == "```":
+                break
+            json_lines.append(line)
+        text = "\n".join(json_lines).strip()
+    if not text.startswith("{") and not text.startswith("["):
+        for i, char in enumerate(text):
+            if char in ("{", "["):
+                text = text[i:]
+                break
+    return json.loads(text.strip())
+
+
+def legacy_taxonomies(text: str):
+    """preprocessing/assign_taxonomies: extract_json"""
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0]
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0]
+    return json.loads(text)
+
+
+def legacy_desc(text: str):
+    """iteration1 generate_los_from_desc: greedy [...] regex"""
+    match = re.search(r'\[.*\]', text, re.DOTALL)
+    return json.loads(match.group(0) if match else text)
+
+
+PARSERS: Dict[str, Callable[[str], object]] = {
+    "legacy_graph": legacy_graph,
+    "legacy_simple": legacy_simple,
+    "legacy_taxonomies": legacy_taxonomies,
+    "legacy_desc": legacy_desc,
+    "extract_json": extract_json,
+}
+
+
+# ==================== CORPUS ====================
+def load_cache_corpus(path: str) -> List[str]:
+    if not os.path.exists(path):
+        return []
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute("SELECT value FROM responses")]
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+
+
+def load_file_corpus(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        if not path.endswith(".jsonl"):
+            return [f.read()]
+        texts = []
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                texts.append(record.get("text") or record.get("response") if isinstance(record, dict) else str(record))
+        return [text for text in texts if text]
+
+
+def synthetic_corpus(size: int, seed: int = 0) -> List[str]:
+    """Replies in the shapes seen in practice: bare, fenced, with prose around, and long."""
+    rng = random.Random(seed)
+    texts = []
+    for i in range(size):
+        concepts = [{"name": f"Concept {i}-{j}", "description": f"Covers {{braces}} and [brackets] #{j}",
+                     "importance": rng.randint(1, 10), "slide_numbers": [j, j + 1]}
+                    for j in range(rng.choice([3, 10, 60]))]
+        body = json.dumps({"concepts": concepts, "relationships": []}, indent=rng.choice([None, 2]))
+        los = json.dumps([f"Students will be able to explain topic {j} [core]." for j in range(6)])
+        texts.append(rng.choice([
+            body,
+            f"```json\n{body}\n```",
+            f"Here is the JSON you asked for:\n\n```json\n{body}\n```\nLet me know if [anything] should change.",
+            f"Sure! {body} I hope this helps.",
+            f"Here are the outcomes [draft]:\n{los}\nNote: see [1].",
+        ]))
+    return texts
+
+
+# ==================== BENCHMARK ====================
+def run_parser(parse: Callable[[str], object], corpus: List[str], repeats: int) -> Dict:
+    ok = 0
+    outputs: List[Optional[object]] = []
+    for text in corpus:
+        try:
+            outputs.append(parse(text))
+            ok += 1
+        except Exception:
+            outputs.append(None)
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for text in corpus:
+            try:
+                parse(text)
+            except Exception:
+                pass
+        best = min(best, time.perf_counter() - start)
+    return {"parsed": ok, "seconds": best, "us_per_reply": best / len(corpus) * 1e6, "outputs": outputs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured LLM replies through the JSON parsers")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="LLM response cache to replay")
+    parser.add_argument("--corpus", nargs="*", default=[], help="Extra .jsonl / .txt reply files")
+    parser.add_argument("--synthetic", action="store_true", help="Use generated replies only")
+    parser.add_argument("--size", type=int, default=SYNTHETIC_SIZE, help="Synthetic corpus size")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="Timed passes (best is kept)")
+    parser.add_argument("--output", default=None, help="Optional JSON report path")
+    args = parser.parse_args()
+
+    corpus: List[str] = []
+    if not args.synthetic:
+        corpus = load_cache_corpus(args.cache)
+        for path in args.corpus:
+            corpus.extend(load_file_corpus(path))
+    source = "captured"
+    if not corpus:
+        print("ℹ️  No captured replies found, using a synthetic corpus")
+        corpus, source = synthetic_corpus(args.size), "synthetic"
+
+    print(f"\n📚 {len(corpus)} {source} replies, {sum(map(len, corpus)) / 1e6:.1f} MB")
+    results = {name: run_parser(parse, corpus, args.repeats) for name, parse in PARSERS.items()}
+    reference = results["extract_json"]["outputs"]
+
+    print(f"\n{'='*70}")
+    print("  JSON EXTRACTION BENCHMARK")
+    print(f"{'='*70}")
+    print(f"  {'parser':<20}{'parsed':>10}{'µs/reply':>12}{'agrees w/ new':>16}")
+    report = {"source": source, "replies": len(corpus), "parsers": {}}
+    for name, result in results.items():
+        agree = sum(1 for a, b in zip(result["outputs"], reference) if a is not None and a == b)
+        report["parsers"][name] = {"parsed": result["parsed"], "seconds": round(result["seconds"], 4),
+                                   "us_per_reply": round(result["us_per_reply"], 2), "agrees_with_extract_json": agree}
+        print(f"  {name:<20}{result['parsed']:>10}{result['us_per_reply']:>12.1f}{agree:>16}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✅ Saved benchmark: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
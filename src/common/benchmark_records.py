@@ -0,0 +1,117 @@
+"""
+Benchmark: slotted records (common/records.py) vs. plain dicts
+
+Decodes a synthetic course collection, in the schema the collectors and the
+Kaggle processor write, once into dicts and once into Course records. It
+compares the memory each one keeps (tracemalloc, after the decoded dicts have
+been dropped), the bytes per course and the conversion time. It also checks
+that to_dict() gives back the original records.
+
+Run from src/:  python -m common.benchmark_records [--courses 200000]
+"""
+
+import argparse
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.checkpoint import atomic_write_json
+from common.records import courses_from_dicts, to_dicts
+from common.serialization import dumps, loads
+
+# ==================== CONFIGURATION ====================
+DEFAULT_COURSES = 100000
+
+SOURCES = ["coursera", "edx", "udemy", "oxford", "harvard", "alison", "mit"]
+INSTITUTIONS = [f"University {i}" for i in range(300)]
+LEVELS = ["Beginner", "Intermediate", "Advanced", None]
+CATEGORIES = ["Computer Science", "Data Science", "Business", "Humanities", "Mathematics", None]
+LANGUAGES = ["English", "English", "English", "Spanish", "French", "Chinese"]
+
+
+# ==================== DATA ====================
+def synthetic_collection(n: int, seed: int = 0) -> bytes:
+    """Encoded course list; decoding it gives fresh strings per record, like loading a real file."""
+    rng = random.Random(seed)
+    collected = datetime(2026, 1, 1).isoformat()  # kaggle_processor.make_record stamps one time per run
+    courses = []
+    for i in range(n):
+        source = rng.choice(SOURCES)
+        courses.append({
+            "id": f"{source}_{i:010x}",
+            "source": source,
+            "course_code": None,
+            "title": f"Course {i}: {rng.choice(CATEGORIES) or 'General'} topics",
+            "description": " ".join(f"Covers topic {j}." for j in range(rng.randint(8, 30))),
+            "learning_outcomes": [f"Apply skill {k}" for k in range(rng.choice([0, 0, 3, 6, 10]))],
+            "metadata": {
+                "institution": rng.choice(INSTITUTIONS),
+                "level": rng.choice(LEVELS),
+                "category": rng.choice(CATEGORIES),
+                "language": rng.choice(LANGUAGES),
+                "date_collected": collected,
+                "url": f"https://example.org/{source}/{i}",
+            },
+        })
+    return dumps(courses, "compact")
+
+
+# ==================== BENCHMARK ====================
+def measure(build: Callable[[], List]) -> Tuple[List, int, float]:
+    """(result, bytes still allocated once build() returns, seconds)."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, retained, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare memory of Course records with plain dicts")
+    parser.add_argument("--courses", type=int, default=DEFAULT_COURSES, help="Courses in the collection")
+    parser.add_argument("--output", default=None, help="Optional JSON report path")
+    args = parser.parse_args()
+
+    payload = synthetic_collection(args.courses)
+    print(f"\n📚 {args.courses:,} courses, {len(payload) / 1e6:.1f} MB encoded")
+
+    dicts, dict_bytes, dict_s = measure(lambda: loads(payload))
+    records, record_bytes, record_s = measure(lambda: courses_from_dicts(loads(payload)))
+    round_trip_ok = to_dicts(records) == dicts
+    del dicts
+
+    n = max(1, args.courses)
+    print(f"\n{'='*70}")
+    print("  RECORD MEMORY BENCHMARK")
+    print(f"{'='*70}")
+    print(f"  {'representation':<20}{'retained MB':>14}{'bytes/course':>14}{'load s':>10}")
+    print(f"  {'dict':<20}{dict_bytes / 1e6:>14.1f}{dict_bytes / n:>14.0f}{dict_s:>10.2f}")
+    print(f"  {'Course (slots)':<20}{record_bytes / 1e6:>14.1f}{record_bytes / n:>14.0f}{record_s:>10.2f}")
+    saving = 1 - record_bytes / dict_bytes if dict_bytes else 0
+    print(f"\n  Memory saved: {saving:.0%}   round trip: {'✓' if round_trip_ok else '✗'}")
+
+    if args.output:
+        report = {
+            "courses": args.courses,
+            "dict": {"bytes": dict_bytes, "bytes_per_course": round(dict_bytes / n), "load_s": round(dict_s, 3)},
+            "course_records": {"bytes": record_bytes, "bytes_per_course": round(record_bytes / n),
+                               "load_s": round(record_s, 3)},
+            "memory_saved": round(saving, 3),
+            "round_trip_ok": round_trip_ok,
+        }
+        atomic_write_json(args.output, report, fmt="pretty")
+        print(f"\n✅ Saved benchmark: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark: output formats (common/serialization.py)
+
+Writes and reads back a synthetic course collection, shaped like the
+collectors' output files, in every registered format. For each format it
+reports write time, read time and the size on disk. The round-trip check also
+covers NaN (read back as null) and integers beyond 64 bits. zstd is skipped when the
+zstandard package isn't installed.
+
+Run from src/:  python -m common.benchmark_serialization [--courses 20000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.checkpoint import atomic_write_json
+from common.serialization import FORMATS, read_output
+
+# ==================== CONFIGURATION ====================
+DEFAULT_COURSES = 20000
+DEFAULT_REPEATS = 3
+
+LEVELS = ["Beginner", "Intermediate", "Advanced", "Mixed"]
+SUBJECTS = ["Data Science", "Computer Science", "Business", "Mathématiques", "Physics", "数据科学"]
+
+
+# ==================== DATA ====================
+def synthetic_courses(n: int, seed: int = 0) -> List[Dict]:
+    """Course records with the fields and text lengths the collectors produce."""
+    rng = random.Random(seed)
+    courses = []
+    for i in range(n):
+        subject = rng.choice(SUBJECTS)
+        courses.append({
+            "id": f"course-{i}",
+            "title": f"{subject} {rng.choice(LEVELS)} Course {i}",
+            "description": " ".join(f"Learn topic {j} of {subject} in depth." for j in range(rng.randint(5, 40))),
+            "syllabus": [f"Week {w}: {subject} module {w}" for w in range(rng.randint(4, 12))],
+            "learning_outcomes": [f"Students will be able to apply concept {k}." for k in range(rng.randint(3, 8))],
+            "level": rng.choice(LEVELS),
+            "rating": round(rng.uniform(3.0, 5.0), 2),
+            "enrolled": rng.randint(0, 500000),
+            "platform": "Coursera",
+            "url": f"https://www.coursera.org/learn/course-{i}",
+        })
+    return courses
+
+
+def edge_cases() -> tuple:
+    """(data, what every format must read back): NaN as from a blank CSV cell, integers beyond 64 bits."""
+    data = {"level": float("nan"), "score": float("inf"), "big": 2 ** 70, "low": -(2 ** 63) - 1,
+            "max_u64": 2 ** 64 - 1, "ids": [12345678901234567890123], "title": "Données"}
+    expected = {"level": None, "score": None, "big": 2 ** 70, "low": -(2 ** 63) - 1,
+                "max_u64": 2 ** 64 - 1, "ids": [12345678901234567890123], "title": "Données"}
+    return data, expected
+
+
+# ==================== BENCHMARK ====================
+def run_format(fmt: str, courses: List[Dict], directory: str, repeats: int) -> Dict:
+    path = os.path.join(directory, f"courses_{fmt}.json")
+    write_s = read_s = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        written = atomic_write_json(path, courses, fmt=fmt, fsync=False)
+        write_s = min(write_s, time.perf_counter() - start)
+        start = time.perf_counter()
+        loaded = read_output(written)
+        read_s = min(read_s, time.perf_counter() - start)
+    edge_data, edge_expected = edge_cases()
+    edge_path = atomic_write_json(os.path.join(directory, f"edge_{fmt}.json"), edge_data, fmt=fmt, fsync=False)
+    return {"write_s": write_s, "read_s": read_s, "bytes": os.path.getsize(written),
+            "round_trip_ok": loaded == courses and read_output(edge_path) == edge_expected}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare output formats on a synthetic course collection")
+    parser.add_argument("--courses", type=int, default=DEFAULT_COURSES, help="Courses in the collection")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="Timed passes (best is kept)")
+    parser.add_argument("--output", default=None, help="Optional JSON report path")
+    args = parser.parse_args()
+
+    courses = synthetic_courses(args.courses)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for fmt in FORMATS:
+            try:
+                results[fmt] = run_format(fmt, courses, directory, args.repeats)
+            except ImportError as e:
+                print(f"ℹ️  Skipping {fmt}: {e}")
+
+    print(f"\n{'='*70}")
+    print(f"  OUTPUT FORMAT BENCHMARK ({len(courses):,} courses)")
+    print(f"{'='*70}")
+    print(f"  {'format':<12}{'write ms':>12}{'read ms':>12}{'size MB':>12}{'vs pretty':>12}{'round trip':>12}")
+    baseline = results["pretty"]["bytes"]
+    report = {"courses": len(courses), "formats": {}}
+    for fmt, result in results.items():
+        ratio = result["bytes"] / baseline
+        report["formats"][fmt] = {"write_s": round(result["write_s"], 4), "read_s": round(result["read_s"], 4),
+                                  "bytes": result["bytes"], "size_vs_pretty": round(ratio, 3),
+                                  "round_trip_ok": result["round_trip_ok"]}
+        print(f"  {fmt:<12}{result['write_s'] * 1000:>12.1f}{result['read_s'] * 1000:>12.1f}"
+              f"{result['bytes'] / 1e6:>12.2f}{ratio:>12.2f}{'✓' if result['round_trip_ok'] else '✗':>12}")
+
+    if args.output:
+        atomic_write_json(args.output, report, fmt="pretty")
+        print(f"\n✅ Saved benchmark: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
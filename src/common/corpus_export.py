@@ -0,0 +1,294 @@
+"""
+Partitioned Parquet export of the course corpus, and vectorised scans over it.
+
+Analytics over the collection (LO coverage, length distributions, source mix)
+only need a few columns of every course. A JSON array has to be parsed whole
+to get them, while Parquet reads just those columns. The export writes the
+corpus database (common/corpus_store.py), or given JSON batch files, as a
+Hive-partitioned dataset:
+
+    parquet/source=edx/collected=2026-10-18/part-0.parquet
+
+- one row per course, `learning_outcomes` as a list<string> column;
+- precomputed `n_los` and `description_chars` columns, so coverage and length
+  statistics never read the text itself;
+- `collection` (the corpus partition: coursera, kaggle, ...) and `dedup_key`
+  columns for grouping and distinct counts.
+
+Courses are streamed EXPORT_BATCH at a time. Each export is a full snapshot,
+written next to the target and swapped in with a rename, so readers never see
+a half-written dataset or stale partitions.
+
+scan_stats() computes the check_progress statistics with pyarrow.compute over
+the needed columns only, optionally grouped (by collection, source, ...).
+Needs the optional pyarrow package (`pip install pyarrow`).
+
+    python -m common.corpus_export export                     # corpus -> CORPUS_PARQUET_DIR
+    python -m common.corpus_export export --from-json kaggle_processed_20260101.json --collection kaggle
+    python -m common.corpus_export stats --by source
+"""
+
+import argparse
+import os
+import re
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.corpus_store import DEFAULT_CORPUS_DB, CorpusStore, dedup_key
+from common.records import Course
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = pc = ds = None
+
+# ==================== CONFIGURATION ====================
+DEFAULT_PARQUET_DIR = os.getenv(
+    "CORPUS_PARQUET_DIR",
+    str(Path(__file__).resolve().parents[2] / "datasets" / "large_scale_collection" / "parquet")
+)
+EXPORT_BATCH = int(os.getenv("CORPUS_EXPORT_BATCH", "50000"))  # Courses per record batch in memory
+
+PARTITION_KEYS = ("source", "collected")
+_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+
+def _require():
+    if pa is None:
+        raise ImportError("Parquet export and scans need the pyarrow package (pip install pyarrow)")
+
+
+def schema() -> "pa.Schema":
+    _require()
+    return pa.schema([
+        ("id", pa.string()),
+        ("collection", pa.string()),
+        ("source", pa.string()),
+        ("course_code", pa.string()),
+        ("title", pa.string()),
+        ("dedup_key", pa.string()),
+        ("description", pa.string()),
+        ("description_chars", pa.int32()),
+        ("learning_outcomes", pa.list_(pa.string())),
+        ("n_los", pa.int32()),
+        ("institution", pa.string()),
+        ("level", pa.string()),
+        ("category", pa.string()),
+        ("language", pa.string()),
+        ("date_collected", pa.string()),
+        ("collected", pa.string()),
+        ("url", pa.string()),
+    ])
+
+
+def partitioning() -> "ds.Partitioning":
+    _require()
+    return ds.partitioning(pa.schema([(key, pa.string()) for key in PARTITION_KEYS]), flavor="hive")
+
+
+def collected_day(date_collected: Optional[str]) -> str:
+    """Date partition of a course: the day of its ISO date_collected, or 'unknown'."""
+    if date_collected and _DATE.match(date_collected):
+        return date_collected[:10]
+    return "unknown"
+
+
+# ==================== EXPORT ====================
+def to_record_batch(courses: List[Course], collections: List[str]) -> "pa.RecordBatch":
+    """One column per field; `collections[i]` is the corpus partition of `courses[i]`."""
+    _require()
+    return pa.RecordBatch.from_pydict({
+        "id": [c.id for c in courses],
+        "collection": collections,
+        "source": [c.source or "unknown" for c in courses],
+        "course_code": [c.course_code for c in courses],
+        "title": [c.title for c in courses],
+        "dedup_key": [dedup_key(c.title) for c in courses],
+        "description": [c.description for c in courses],
+        "description_chars": [len(c.description) for c in courses],
+        "learning_outcomes": [list(c.learning_outcomes) for c in courses],
+        "n_los": [len(c.learning_outcomes) for c in courses],
+        "institution": [c.institution for c in courses],
+        "level": [c.level for c in courses],
+        "category": [c.category for c in courses],
+        "language": [c.language for c in courses],
+        "date_collected": [c.date_collected for c in courses],
+        "collected": [collected_day(c.date_collected) for c in courses],
+        "url": [c.url for c in courses],
+    }, schema=schema())
+
+
+def _batches(courses: Iterable[tuple], batch_size: int) -> Iterator["pa.RecordBatch"]:
+    """(collection, Course) pairs -> record batches of batch_size rows."""
+    records: List[Course] = []
+    collections: List[str] = []
+    for collection, course in courses:
+        records.append(course)
+        collections.append(collection)
+        if len(records) >= batch_size:
+            yield to_record_batch(records, collections)
+            records, collections = [], []
+    if records:
+        yield to_record_batch(records, collections)
+
+
+def corpus_courses(store: CorpusStore) -> Iterator[tuple]:
+    """(collection, Course) for every course in the corpus, streamed."""
+    for collection in store.counts():
+        for course in store.iter_courses(partition=collection):
+            yield collection, course
+
+
+def json_courses(paths: List[str], collection: str) -> Iterator[tuple]:
+    """(collection, Course) for every course in JSON batch files, one file in memory at a time."""
+    from common.serialization import read_output
+
+    for path in paths:
+        data = read_output(path)
+        for item in (data.get("courses", []) if isinstance(data, dict) else data):
+            yield collection, Course.from_dict(item)
+
+
+def export_parquet(courses: Iterable[tuple], out_dir: str = DEFAULT_PARQUET_DIR,
+                   batch_size: int = EXPORT_BATCH) -> Dict:
+    """
+    Write (collection, Course) pairs as a source/date-partitioned Parquet
+    dataset that replaces `out_dir` as a whole. Returns {rows, files, seconds}.
+    """
+    _require()
+    start = time.time()
+    out_dir = os.path.abspath(out_dir)
+    staging, previous = out_dir + ".tmp", out_dir + ".old"
+    for leftover in (staging, previous):
+        if os.path.exists(leftover):
+            shutil.rmtree(leftover)
+
+    rows = 0
+    files = []
+
+    def count(batches: Iterator["pa.RecordBatch"]) -> Iterator["pa.RecordBatch"]:
+        nonlocal rows
+        for batch in batches:
+            rows += batch.num_rows
+            yield batch
+
+    ds.write_dataset(
+        count(_batches(courses, batch_size)), staging, schema=schema(), format="parquet",
+        partitioning=partitioning(), basename_template="part-{i}.parquet",
+        file_visitor=lambda written: files.append(written.path),
+    )
+    if not os.path.exists(staging):
+        os.makedirs(staging)  # Nothing to export: still replace the old snapshot
+    # Swap the new snapshot in: readers see the old or the new dataset (between the renames, none), never a mix
+    if os.path.exists(out_dir):
+        os.replace(out_dir, previous)
+    os.replace(staging, out_dir)
+    if os.path.exists(previous):
+        shutil.rmtree(previous)
+    return {"rows": rows, "files": len(files), "seconds": round(time.time() - start, 2)}
+
+
+# ==================== SCANS ====================
+def open_dataset(path: str = DEFAULT_PARQUET_DIR) -> "ds.Dataset":
+    _require()
+    return ds.dataset(path, schema=schema(), format="parquet", partitioning=partitioning())
+
+
+def _filter(collection):
+    if isinstance(collection, (list, tuple)):
+        return ds.field("collection").isin(list(collection))
+    return ds.field("collection") == collection if collection is not None else None
+
+
+def _stats(total: int, with_los: int, with_description: int, total_los: int, unique: int) -> Dict:
+    """Same keys as check_progress.calculate_stats / CorpusStore.stats."""
+    return {
+        'total': total,
+        'with_los': with_los,
+        'with_description': with_description,
+        'lo_coverage': round(with_los / total * 100, 2) if total > 0 else 0,
+        'avg_los_per_course': round(total_los / total, 2) if total > 0 else 0,
+        'unique_titles': unique,
+    }
+
+
+def scan_stats(path: str = DEFAULT_PARQUET_DIR, by: Optional[str] = None,
+               collection=None) -> Dict:
+    """
+    check_progress statistics from a vectorised scan of the n_los,
+    description_chars and dedup_key columns (plus `by`). With `by`, returns
+    {value: stats}; `collection` restricts the scan to one corpus partition (or a list).
+    """
+    columns = ["n_los", "description_chars", "dedup_key"] + ([by] if by else [])
+    table = open_dataset(path).to_table(columns=columns, filter=_filter(collection))
+    has_los = pc.cast(pc.greater(table["n_los"], 0), pa.int64())
+    has_description = pc.cast(pc.greater(table["description_chars"], 50), pa.int64())
+
+    if by is None:
+        return _stats(table.num_rows, pc.sum(has_los).as_py() or 0, pc.sum(has_description).as_py() or 0,
+                      pc.sum(table["n_los"]).as_py() or 0, pc.count_distinct(table["dedup_key"]).as_py())
+
+    grouped = (table.append_column("has_los", has_los).append_column("has_description", has_description)
+               .group_by(by).aggregate([("n_los", "count"), ("has_los", "sum"), ("has_description", "sum"),
+                                        ("n_los", "sum"), ("dedup_key", "count_distinct")]))
+    result = {}
+    for row in grouped.to_pylist():
+        result[row[by]] = _stats(row["n_los_count"], row["has_los_sum"], row["has_description_sum"],
+                                 row["n_los_sum"], row["dedup_key_count_distinct"])
+    return dict(sorted(result.items(), key=lambda item: -item[1]["total"]))
+
+
+def length_quantiles(path: str = DEFAULT_PARQUET_DIR, column: str = "description_chars",
+                     quantiles: tuple = (0.1, 0.25, 0.5, 0.75, 0.9)) -> Dict[float, float]:
+    """Distribution of a length column (description_chars or n_los)."""
+    values = open_dataset(path).to_table(columns=[column])[column]
+    if len(values) == 0:
+        return {}
+    return dict(zip(quantiles, pc.quantile(values, q=list(quantiles)).to_pylist()))
+
+
+# ==================== CLI ====================
+def main():
+    parser = argparse.ArgumentParser(description="Export the course corpus to Parquet and scan it")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Write a source/date-partitioned Parquet snapshot")
+    export.add_argument("--out", default=DEFAULT_PARQUET_DIR, help="Dataset directory (default: CORPUS_PARQUET_DIR)")
+    export.add_argument("--db", default=DEFAULT_CORPUS_DB, help="Corpus database to export (default: CORPUS_DB)")
+    export.add_argument("--from-json", nargs="+", default=None, help="Export these JSON batch files instead")
+    export.add_argument("--collection", default="json", help="Collection name for --from-json courses")
+    stats = sub.add_parser("stats", help="Coverage, source mix and length distribution from a vectorised scan")
+    stats.add_argument("path", nargs="?", default=DEFAULT_PARQUET_DIR)
+    stats.add_argument("--by", default="collection", help="Column to group by (collection, source, language, ...)")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        if args.from_json:
+            courses = json_courses(args.from_json, args.collection)
+        else:
+            if not os.path.exists(args.db):
+                print(f"❌ No corpus at {args.db}")
+                return
+            courses = corpus_courses(CorpusStore(args.db))
+        result = export_parquet(courses, args.out)
+        print(f"✅ Exported {result['rows']:,} courses to {args.out} ({result['files']} files, {result['seconds']}s)")
+    elif args.command == "stats":
+        overall = scan_stats(args.path)
+        print(f"📊 {args.path}")
+        print(f"   {'ALL':<20} {overall['total']:>9,} courses  {overall['unique_titles']:>9,} unique  "
+              f"{overall['lo_coverage']:5.1f}% with LOs  {overall['avg_los_per_course']:.2f} LOs/course")
+        for value, row in scan_stats(args.path, by=args.by).items():
+            print(f"   {str(value):<20} {row['total']:>9,} courses  {row['unique_titles']:>9,} unique  "
+                  f"{row['lo_coverage']:5.1f}% with LOs  {row['avg_los_per_course']:.2f} LOs/course")
+        quantiles = length_quantiles(args.path)
+        if quantiles:
+            print("   Description chars: " + "  ".join(f"p{int(q * 100)}={v:,.0f}" for q, v in quantiles.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+"""
+Local course corpus: one SQLite database for every collected course.
+
+The collectors and the Kaggle processor upsert their standardised courses here,
+in addition to writing their JSON batch files. Consumers stream or query the
+corpus instead of loading every batch file whole:
+
+- partitions: each course belongs to the collection it came from (`coursera`,
+  `udemy`, `universities`, `kaggle`), next to its own `source` field (e.g.
+  `edx` within `kaggle`). Both are indexed.
+- incremental upserts: courses are keyed by `id`. A course that is collected
+  again is rewritten only when its content changed (a hash over everything but
+  `date_collected`), so re-running a collector costs reads, not writes.
+- dedup keys: the normalised title, as in the Kaggle processor's
+  deduplicate(). iter_courses(unique=True) and stats() use it to treat courses
+  listed by several sources as one.
+- batch files: import_files() upserts JSON batch files (e.g. collected before
+  the corpus existed, or by a collector that doesn't write here) and records
+  each file's size and mtime, so a file is only read again once it changes.
+- full-text search: an FTS5 index (porter stemming) over title, description and
+  learning outcomes, kept in sync by triggers. Results are ranked by BM25, with
+  title matches weighted highest.
+
+Courses come back as slotted Course records (common/records.py). The database
+is in WAL mode, so readers never block a collector that is writing.
+
+    python -m common.corpus_store import kaggle ../datasets/large_scale_collection/raw/kaggle/kaggle_processed_*.json
+    python -m common.corpus_store stats
+    python -m common.corpus_store search "linear regression" --limit 10
+    python -m common.corpus_store export out.json --partition coursera --unique
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.records import Course
+
+# ==================== CONFIGURATION ====================
+DEFAULT_CORPUS_DB = os.getenv(
+    "CORPUS_DB",
+    str(Path(__file__).resolve().parents[2] / "datasets" / "large_scale_collection" / "corpus.sqlite3")
+)
+UPSERT_BATCH = 500       # Courses per existence lookup / executemany
+STREAM_BATCH = 1000      # Rows fetched at a time by iter_courses
+FTS_WEIGHTS = (10.0, 1.0, 3.0)  # BM25 weights: title, description, learning outcomes
+
+_COLUMNS = ("id", "partition", "source", "course_code", "title", "description", "learning_outcomes", "n_los",
+            "institution", "level", "category", "language", "date_collected", "url", "extra",
+            "dedup_key", "content_hash", "updated")
+_HASH = _COLUMNS.index("content_hash")
+_SELECT = ("id, source, course_code, title, description, learning_outcomes, institution, level, category, "
+           "language, date_collected, url, extra")
+
+
+def dedup_key(title: str) -> str:
+    """Normalised title: lower case, whitespace collapsed."""
+    return re.sub(r"\s+", " ", (title or "").lower()).strip()
+
+
+def content_hash(course: Course) -> str:
+    """Hash of a course's content; a re-collected, unchanged course (new date_collected) hashes the same."""
+    data = course.to_dict()
+    data["metadata"].pop("date_collected", None)
+    return hashlib.sha1(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+# ==================== CORPUS STORE ====================
+class CorpusStore:
+    """Courses table with partition/source/dedup indexes and an FTS5 index, shared by collectors and consumers."""
+
+    def __init__(self, db_path: str = DEFAULT_CORPUS_DB):
+        self.db_path = str(db_path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS courses (
+                    seq INTEGER PRIMARY KEY,
+                    id TEXT NOT NULL UNIQUE,
+                    partition TEXT NOT NULL,
+                    source TEXT,
+                    course_code TEXT,
+                    title TEXT NOT NULL,
+                    description TEXT NOT NULL,
+                    learning_outcomes TEXT NOT NULL,
+                    n_los INTEGER NOT NULL,
+                    institution TEXT,
+                    level TEXT,
+                    category TEXT,
+                    language TEXT,
+                    date_collected TEXT,
+                    url TEXT,
+                    extra TEXT,
+                    dedup_key TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_courses_partition ON courses(partition, source)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_courses_dedup ON courses(dedup_key, seq)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS imported_files (
+                    path TEXT PRIMARY KEY,
+                    partition TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    courses INTEGER NOT NULL,
+                    imported REAL NOT NULL
+                )
+            """)
+            self.fts = self._create_fts(conn)
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None so that BEGIN IMMEDIATE below is the only transaction
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    @staticmethod
+    def _create_fts(conn: sqlite3.Connection) -> bool:
+        """External-content FTS5 index over the courses table; False when SQLite lacks FTS5."""
+        try:
+            conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS courses_fts USING fts5(
+                    title, description, learning_outcomes,
+                    content='courses', content_rowid='seq', tokenize='porter unicode61'
+                )
+            """)
+        except sqlite3.OperationalError:
+            print("⚠️ SQLite was built without FTS5; corpus search falls back to LIKE")
+            return False
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS courses_fts_insert AFTER INSERT ON courses BEGIN
+                INSERT INTO courses_fts (rowid, title, description, learning_outcomes)
+                VALUES (new.seq, new.title, new.description, new.learning_outcomes);
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS courses_fts_delete AFTER DELETE ON courses BEGIN
+                INSERT INTO courses_fts (courses_fts, rowid, title, description, learning_outcomes)
+                VALUES ('delete', old.seq, old.title, old.description, old.learning_outcomes);
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS courses_fts_update AFTER UPDATE ON courses BEGIN
+                INSERT INTO courses_fts (courses_fts, rowid, title, description, learning_outcomes)
+                VALUES ('delete', old.seq, old.title, old.description, old.learning_outcomes);
+                INSERT INTO courses_fts (rowid, title, description, learning_outcomes)
+                VALUES (new.seq, new.title, new.description, new.learning_outcomes);
+            END
+        """)
+        return True
+
+    # ---------- writing ----------
+    @staticmethod
+    def _row(course: Course, partition: str, digest: str, now: float) -> tuple:
+        extra = None
+        if course.extra or course.metadata_extra:
+            extra = json.dumps({"extra": course.extra, "metadata_extra": course.metadata_extra}, ensure_ascii=False)
+        course_id = course.id or f"{course.source}_{hashlib.md5(dedup_key(course.title).encode()).hexdigest()[:10]}"
+        return (course_id, partition, course.source, course.course_code, course.title, course.description,
+                json.dumps(list(course.learning_outcomes), ensure_ascii=False), len(course.learning_outcomes),
+                course.institution, course.level, course.category, course.language, course.date_collected,
+                course.url, extra, dedup_key(course.title), digest, now)
+
+    def upsert(self, courses: Iterable, partition: str) -> Dict[str, int]:
+        """
+        Insert new courses and rewrite changed ones (dicts in the standard schema
+        or Course records). Unchanged courses are left alone. Each batch of
+        UPSERT_BATCH courses is one transaction. Returns {inserted, updated, unchanged}.
+        """
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+        placeholders = ", ".join("?" for _ in _COLUMNS)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in _COLUMNS if c != "id")
+        sql = (f"INSERT INTO courses ({', '.join(_COLUMNS)}) VALUES ({placeholders}) "
+               f"ON CONFLICT(id) DO UPDATE SET {updates}")
+
+        def flush(batch: List[tuple]):
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                ids = [row[0] for row in batch]
+                existing = dict(conn.execute(
+                    f"SELECT id, content_hash FROM courses WHERE id IN ({', '.join('?' for _ in ids)})", ids
+                ).fetchall())
+                changed = {}
+                for row in batch:  # Last occurrence of a repeated id wins
+                    changed[row[0]] = row
+                rows = []
+                for course_id, row in changed.items():
+                    if course_id not in existing:
+                        counts["inserted"] += 1
+                    elif existing[course_id] != row[_HASH]:
+                        counts["updated"] += 1
+                    else:
+                        counts["unchanged"] += 1
+                        continue
+                    rows.append(row)
+                conn.executemany(sql, rows)
+                conn.execute("COMMIT")
+
+        now = time.time()
+        batch = []
+        for course in courses:
+            if isinstance(course, dict):
+                course = Course.from_dict(course)
+            batch.append(self._row(course, partition, content_hash(course), now))
+            if len(batch) >= UPSERT_BATCH:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+        return counts
+
+    def import_files(self, paths: Iterable[str], partition: str) -> Dict[str, int]:
+        """
+        Upsert JSON batch files (any output format) into `partition`, skipping
+        files unchanged since their last import. Returns summed upsert counts plus
+        how many files were read.
+        """
+        from common.serialization import read_output  # Only needed when importing
+
+        totals = {"files": 0, "inserted": 0, "updated": 0, "unchanged": 0}
+        for path in paths:
+            path = os.path.abspath(str(path))
+            if path.endswith("_stats.json") or not os.path.exists(path):
+                continue
+            size, mtime = os.path.getsize(path), os.path.getmtime(path)
+            with self._connect() as conn:
+                seen = conn.execute("SELECT size, mtime, partition FROM imported_files WHERE path = ?",
+                                    (path,)).fetchone()
+            if seen == (size, mtime, partition):
+                continue
+            data = read_output(path)
+            courses = data.get("courses", []) if isinstance(data, dict) else data
+            counts = self.upsert(courses, partition)
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO imported_files (path, partition, size, mtime, courses, imported) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", (path, partition, size, mtime, len(courses), time.time())
+                )
+            totals["files"] += 1
+            for key, value in counts.items():
+                totals[key] += value
+        return totals
+
+    def delete_partition(self, partition: str) -> int:
+        """Drop every course of one partition, e.g. before a full re-import."""
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM courses WHERE partition = ?", (partition,)).rowcount
+
+    # ---------- reading ----------
+    @staticmethod
+    def _course(row: tuple) -> Course:
+        (course_id, source, course_code, title, description, los, institution, level, category,
+         language, date_collected, url, extra) = row
+        extra = json.loads(extra) if extra else {}
+        return Course(id=course_id, source=source, course_code=course_code, title=title, description=description,
+                      learning_outcomes=json.loads(los), institution=institution, level=level, category=category,
+                      language=language, date_collected=date_collected, url=url,
+                      extra=extra.get("extra"), metadata_extra=extra.get("metadata_extra"))
+
+    @staticmethod
+    def _where(partition: Union[str, Sequence[str], None], source: Optional[str], unique: bool = False) -> tuple:
+        clauses, params = [], []
+        if isinstance(partition, (list, tuple)):
+            clauses.append(f"partition IN ({', '.join('?' for _ in partition)})")
+            params.extend(partition)
+        elif partition is not None:
+            clauses.append("partition = ?")
+            params.append(partition)
+        if source is not None:
+            clauses.append("source = ?")
+            params.append(source)
+        if unique:
+            # First-stored course per dedup key, across all partitions
+            clauses.append("seq IN (SELECT MIN(seq) FROM courses GROUP BY dedup_key)")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def iter_courses(self, partition: str = None, source: str = None, unique: bool = False,
+                     batch_size: int = STREAM_BATCH) -> Iterator[Course]:
+        """Stream courses in insertion order, batch_size rows in memory at a time."""
+        where, params = self._where(partition, source, unique)
+        conn = self._connect()
+        try:
+            cursor = conn.execute(f"SELECT {_SELECT} FROM courses{where} ORDER BY seq", params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._course(row)
+        finally:
+            conn.close()
+
+    def get(self, course_id: str) -> Optional[Course]:
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {_SELECT} FROM courses WHERE id = ?", (course_id,)).fetchone()
+        return self._course(row) if row else None
+
+    def search(self, query: str, limit: int = 20, partition: str = None) -> List[Course]:
+        """
+        Courses matching an FTS5 query (e.g. `regression`, `"neural network"`,
+        `title:python AND learning_outcomes:debug`), best match first. Text that
+        isn't valid query syntax (`c++`, `node.js`) is searched as a phrase.
+        """
+        with self._connect() as conn:
+            if self.fts:
+                sql = (f"SELECT {', '.join('c.' + c.strip() for c in _SELECT.split(','))} "
+                       f"FROM courses_fts JOIN courses c ON c.seq = courses_fts.rowid WHERE courses_fts MATCH ?")
+                params: List = []
+                if partition is not None:
+                    sql += " AND c.partition = ?"
+                    params.append(partition)
+                sql += f" ORDER BY bm25(courses_fts, {', '.join(map(str, FTS_WEIGHTS))}) LIMIT ?"
+                try:
+                    rows = conn.execute(sql, [query] + params + [limit]).fetchall()
+                except sqlite3.OperationalError as e:
+                    # fts5 syntax errors, a stray quote, or `word:` naming a column that doesn't exist
+                    if not str(e).startswith(("fts5:", "unterminated string", "no such column")):
+                        raise
+                    phrase = '"' + query.replace('"', '""') + '"'
+                    rows = conn.execute(sql, [phrase] + params + [limit]).fetchall()
+            else:
+                where, params = self._where(partition, None)
+                sql = (f"SELECT {_SELECT} FROM courses{where}{' AND' if where else ' WHERE'} "
+                       f"(title LIKE ? OR description LIKE ? OR learning_outcomes LIKE ?) ORDER BY seq LIMIT ?")
+                params += [f"%{query}%"] * 3
+                rows = conn.execute(sql, params + [limit]).fetchall()
+        return [self._course(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """{partition: courses}."""
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT partition, COUNT(*) FROM courses GROUP BY partition ORDER BY partition"))
+
+    def source_counts(self, partition: str = None) -> Dict[str, int]:
+        """{source: courses}, optionally within one partition."""
+        where, params = self._where(partition, None)
+        with self._connect() as conn:
+            return dict(conn.execute(
+                f"SELECT source, COUNT(*) FROM courses{where} GROUP BY source ORDER BY COUNT(*) DESC", params
+            ))
+
+    def stats(self, partition: Union[str, Sequence[str], None] = None) -> Dict:
+        """check_progress statistics computed in SQL, without loading any course (one partition, several, or all)."""
+        where, params = self._where(partition, None)
+        with self._connect() as conn:
+            total, with_los, with_description, total_los, unique = conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(n_los > 0), 0), COALESCE(SUM(length(description) > 50), 0), "
+                f"COALESCE(SUM(n_los), 0), COUNT(DISTINCT dedup_key) FROM courses{where}", params
+            ).fetchone()
+        return {
+            'total': total,
+            'with_los': with_los,
+            'with_description': with_description,
+            'lo_coverage': round(with_los / total * 100, 2) if total > 0 else 0,
+            'avg_los_per_course': round(total_los / total, 2) if total > 0 else 0,
+            'unique_titles': unique,
+        }
+
+
+# ==================== CLI ====================
+def main():
+    # Imported here: serialization/checkpoint are only needed by the CLI
+    from common.checkpoint import atomic_write_json
+    from common.serialization import FORMATS
+
+    parser = argparse.ArgumentParser(description="Import, inspect, search and export the course corpus")
+    parser.add_argument("--db", default=DEFAULT_CORPUS_DB, help="Corpus database file (default: CORPUS_DB)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="Upsert collected JSON batch files into a partition")
+    imp.add_argument("partition", help="coursera, udemy, universities, kaggle, ...")
+    imp.add_argument("files", nargs="+")
+    sub.add_parser("stats", help="Courses, LO coverage and unique titles per partition")
+    search = sub.add_parser("search", help="Full-text search over title, description and learning outcomes")
+    search.add_argument("query")
+    search.add_argument("--limit", type=int, default=20)
+    search.add_argument("--partition", default=None)
+    export = sub.add_parser("export", help="Write courses back out in the JSON batch schema")
+    export.add_argument("output")
+    export.add_argument("--partition", default=None)
+    export.add_argument("--source", default=None)
+    export.add_argument("--unique", action="store_true", help="One course per dedup key")
+    export.add_argument("--format", choices=sorted(FORMATS), default=None)
+    args = parser.parse_args()
+
+    store = CorpusStore(args.db)
+    if args.command == "import":
+        counts = store.import_files(args.files, args.partition)
+        print(f"✓ {counts['files']} files read: {counts['inserted']} new, {counts['updated']} updated, "
+              f"{counts['unchanged']} unchanged")
+    elif args.command == "stats":
+        print(f"📚 {args.db}")
+        for partition in list(store.counts()) + [None]:
+            stats = store.stats(partition)
+            print(f"   {partition or 'ALL':<14} {stats['total']:>9,} courses  {stats['unique_titles']:>9,} unique  "
+                  f"{stats['lo_coverage']:5.1f}% with LOs  {stats['avg_los_per_course']:.2f} LOs/course")
+    elif args.command == "search":
+        for course in store.search(args.query, args.limit, args.partition):
+            print(f"   [{course.source}] {course.title} ({course.institution}) {course.id}")
+    elif args.command == "export":
+        courses = [c.to_dict() for c in store.iter_courses(args.partition, args.source, args.unique)]
+        written = atomic_write_json(args.output, courses, fmt=args.format)
+        print(f"✓ Exported {len(courses):,} courses to {written}")
+
+
+if __name__ == "__main__":
+    main()
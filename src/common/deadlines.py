@@ -0,0 +1,118 @@
+"""
+Request deadlines for LLM API calls.
+
+Every call gets separate connect and read timeouts. The connect timeout is
+short; the read timeout is sized from the call's expected output (time to
+first token plus generation at the slowest acceptable rate), so a hung or
+crawling connection is cancelled and retried instead of blocking a pipeline.
+
+A stage (e.g. concept extraction, deck summaries) can also have an overall
+deadline. While one is running, per-call timeouts never reach past it and
+call_with_retry() stops retrying once it has passed, raising
+StageDeadlineExceeded rather than sleeping through a backoff that would end
+after it.
+"""
+
+import os
+import threading
+import time
+from typing import Optional, Tuple, Union
+
+# ==================== CONFIGURATION ====================
+CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))                # Seconds to establish a connection
+FIRST_TOKEN_TIMEOUT = float(os.getenv("LLM_FIRST_TOKEN_TIMEOUT", "20"))        # Queueing + prompt processing allowance
+MIN_TOKENS_PER_SECOND = float(os.getenv("LLM_MIN_TOKENS_PER_SECOND", "15"))    # Slowest generation rate worth waiting for
+OUTPUT_SAFETY_FACTOR = float(os.getenv("LLM_DEADLINE_SAFETY_FACTOR", "2"))     # Headroom over the expected output size
+MAX_READ_TIMEOUT = float(os.getenv("LLM_MAX_READ_TIMEOUT", "300"))             # Cap on any single call
+
+# Seconds, or (connect, read) as accepted by requests
+Timeout = Union[float, Tuple[float, float]]
+
+
+class StageDeadlineExceeded(Exception):
+    """A stage's overall deadline has passed; no further calls or retries are made for it."""
+
+
+# ==================== PER-CALL TIMEOUTS ====================
+def call_deadline(expected_output_tokens: int, max_tokens: Optional[int] = None) -> float:
+    """
+    Seconds one call may take: first-token allowance plus the expected output
+    (with headroom, but never more than `max_tokens`) at MIN_TOKENS_PER_SECOND.
+    """
+    tokens = expected_output_tokens * OUTPUT_SAFETY_FACTOR
+    if max_tokens:
+        tokens = min(tokens, max_tokens)
+    return min(FIRST_TOKEN_TIMEOUT + tokens / MIN_TOKENS_PER_SECOND, MAX_READ_TIMEOUT)
+
+
+def request_timeout(expected_output_tokens: int, max_tokens: Optional[int] = None) -> Tuple[float, float]:
+    """
+    (connect, read) timeout for requests, clipped to the current stage
+    deadline. Raises StageDeadlineExceeded if that deadline has already passed.
+    """
+    connect, read = CONNECT_TIMEOUT, call_deadline(expected_output_tokens, max_tokens)
+    remaining = remaining_time()
+    if remaining is not None:
+        if remaining <= 0:
+            raise StageDeadlineExceeded(f"Stage '{_stage.name}' deadline passed")
+        connect, read = min(connect, remaining), min(read, remaining)
+    return connect, read
+
+
+def total_timeout(expected_output_tokens: int, max_tokens: Optional[int] = None) -> float:
+    """One overall timeout, for SDK clients that take no (connect, read) pair."""
+    connect, read = request_timeout(expected_output_tokens, max_tokens)
+    remaining = remaining_time()
+    return min(connect + read, remaining) if remaining is not None else connect + read
+
+
+# ==================== STAGE DEADLINES ====================
+class StageDeadline:
+    """Wall-clock budget for one pipeline stage."""
+
+    def __init__(self, name: str, seconds: float):
+        self.name = name
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.expires - time.monotonic()
+
+
+_stage: Optional[StageDeadline] = None
+_stage_lock = threading.Lock()
+
+
+def stage_seconds(stage: str) -> Optional[float]:
+    """Configured deadline for `stage`: LLM_STAGE_DEADLINE_<STAGE>, else LLM_STAGE_DEADLINE, else none."""
+    value = os.getenv(f"LLM_STAGE_DEADLINE_{stage.upper()}") or os.getenv("LLM_STAGE_DEADLINE")
+    return float(value) if value else None
+
+
+def set_stage_deadline(stage: str, seconds: Optional[float] = None) -> Optional[StageDeadline]:
+    """
+    Start `stage`'s overall deadline (`seconds`, or the configured one), replacing
+    the previous stage's; without either the stage has none. Stages run one
+    after another, so there is one current deadline per process.
+    """
+    global _stage
+    seconds = seconds if seconds is not None else stage_seconds(stage)
+    deadline = StageDeadline(stage, seconds) if seconds else None
+    with _stage_lock:
+        _stage = deadline
+    if deadline is not None:
+        print(f"   ⏱  Stage '{stage}' deadline: {seconds:.0f}s")
+    return deadline
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current stage deadline, or None without one."""
+    stage = _stage
+    return stage.remaining() if stage is not None else None
+
+
+def check_deadline():
+    """Raise StageDeadlineExceeded if the current stage deadline has passed."""
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        raise StageDeadlineExceeded(f"Stage '{_stage.name}' deadline of {_stage.seconds:.0f}s passed")
@@ -0,0 +1,155 @@
+"""
+Append-only JSONL journal for resumable pipeline progress.
+
+Rewriting a whole progress file after every step costs I/O that grows with
+everything done so far, and a crash mid-write leaves a file that no longer
+parses. A journal only ever appends one small record per completed step:
+
+- each append is written and flushed to the OS immediately, so a crash of the
+  process loses nothing;
+- fsync (durability against an OS crash or power loss) is batched: after every
+  JOURNAL_SYNC_EVERY records or JOURNAL_SYNC_INTERVAL seconds, and on close;
+- replay() returns every complete record. A torn last line (the process died
+  mid-append) is cut off, so the next append starts on a clean line.
+
+The first record is a header describing the inputs; opening a journal whose
+header doesn't match starts a fresh one, so progress from a different input
+set is never replayed. Callers compact the records into their final output and
+then remove() the journal.
+"""
+
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+# ==================== CONFIGURATION ====================
+SYNC_EVERY = int(os.getenv("JOURNAL_SYNC_EVERY", "8"))              # Records between fsyncs
+SYNC_INTERVAL = float(os.getenv("JOURNAL_SYNC_INTERVAL", "2.0"))    # Max seconds an appended record goes un-fsynced
+
+try:
+    import orjson
+
+    def _dumps(record: Dict) -> bytes:
+        return orjson.dumps(record)
+
+    _loads = orjson.loads
+    _DECODE_ERRORS = (orjson.JSONDecodeError, UnicodeDecodeError)
+except ImportError:
+    def _dumps(record: Dict) -> bytes:
+        return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    _loads = json.loads
+    _DECODE_ERRORS = (json.JSONDecodeError, UnicodeDecodeError)
+
+
+# ==================== JOURNAL ====================
+class Journal:
+    """One JSON record per line, appended and fsync'd in groups."""
+
+    def __init__(self, path: str, header: Optional[Dict] = None, sync_every: int = SYNC_EVERY,
+                 sync_interval: float = SYNC_INTERVAL):
+        self.path = path
+        self.header = header
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.stats = {"appended": 0, "fsyncs": 0, "bytes": 0}
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    # ---------- reading ----------
+    def _read(self) -> List[Dict]:
+        """Complete records on disk; a torn or corrupt tail is truncated away."""
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        good_end = 0
+        with open(self.path, "rb") as f:
+            data = f.read()
+        pos = 0
+        while pos < len(data):
+            end = data.find(b"\n", pos)
+            if end == -1:
+                break  # No newline: the last append was cut off
+            line = data[pos:end]
+            if line.strip():
+                try:
+                    records.append(_loads(line))
+                except _DECODE_ERRORS:
+                    break
+            pos = good_end = end + 1
+        if good_end < len(data):
+            print(f"   ⚠️  Journal {os.path.basename(self.path)}: dropped {len(data) - good_end} bytes "
+                  f"of an incomplete record at the end")
+            with open(self.path, "r+b") as f:
+                f.truncate(good_end)
+        return records
+
+    def replay(self) -> List[Dict]:
+        """
+        Records appended so far, header excluded. With a header given, a
+        journal that starts with a different one is discarded (and [] returned).
+        """
+        records = self._read()
+        if self.header is None:
+            return records
+        if records and records[0] == {"header": self.header}:
+            return records[1:]
+        if records:
+            stale = self.path + ".stale"
+            os.replace(self.path, stale)
+            print(f"   ⚠️  Journal {os.path.basename(self.path)} was written for different inputs; "
+                  f"moved it to {os.path.basename(stale)} and starting fresh")
+        return []
+
+    # ---------- writing ----------
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            self._file = open(self.path, "ab")
+            if new and self.header is not None:
+                self._write({"header": self.header})
+
+    def _write(self, record: Dict):
+        line = _dumps(record) + b"\n"
+        self._file.write(line)
+        self._file.flush()
+        self.stats["bytes"] += len(line)
+        self._unsynced += 1
+
+    def append(self, record: Dict):
+        """Append one record; it survives a process crash at once and an OS crash after the next fsync."""
+        self._open()
+        self._write(record)
+        self.stats["appended"] += 1
+        if self._unsynced >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        """fsync everything appended so far."""
+        if self._file is not None and self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.stats["fsyncs"] += 1
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """Delete the journal once its records have been compacted into the final output."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self) -> "Journal":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
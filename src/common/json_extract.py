@@ -0,0 +1,207 @@
+"""
+One JSON extraction routine for every LLM reply.
+
+Models wrap JSON in markdown fences, lead-ins ("Here is the JSON:") or
+trailing notes. extract_json() finds the first complete JSON value in such
+text. Bare JSON, and the common case of one value with text around it, are
+decoded in a single pass from the first opening bracket to the last closing
+one; otherwise a bracket-matching scan that skips over string literals (so
+braces inside strings don't count) finds each candidate span, jumping between
+structural characters with compiled regexes. orjson is used for decoding when
+installed. extract_json_partial() additionally repairs replies cut off by
+max_tokens, keeping every complete element. benchmark_json_extract.py replays
+captured replies through this and the parsers it replaced.
+"""
+
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+from common.retry import BadOutputError
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+    _DECODE_ERRORS: Tuple[type, ...] = (orjson.JSONDecodeError, json.JSONDecodeError)
+except ImportError:
+    _loads = json.loads
+    _DECODE_ERRORS = (json.JSONDecodeError,)
+
+_OPENERS = {None: re.compile(r"[\[{]"), dict: re.compile(r"\{"), list: re.compile(r"\[")}
+_STRUCTURAL = re.compile(r'[\[\]{}"]')
+_STRUCTURAL_OR_COMMA = re.compile(r'[\[\]{}",]')
+_CLOSERS = {"[": "]", "{": "}"}
+_STRING_LITERAL = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+
+
+class JSONExtractionError(BadOutputError, ValueError):
+    """No complete JSON value (of the expected type) could be found in a reply."""
+
+    def __init__(self, message: str, truncated: bool = False, start: Optional[int] = None):
+        super().__init__(message)
+        self.truncated = truncated
+        self.start = start  # Where the unclosed value begins, when truncated
+
+
+def matching_end(text: str, start: int) -> Optional[int]:
+    """
+    Index just past the bracket that closes the one at text[start], or None
+    if the text ends first (an unterminated string counts as unclosed).
+    """
+    depth = 0
+    pos = start
+    while True:
+        match = _STRUCTURAL.search(text, pos)
+        if match is None:
+            return None
+        char, index = match.group(), match.start()
+        if char == '"':
+            literal = _STRING_LITERAL.match(text, index)
+            if literal is None:
+                return None
+            pos = literal.end()
+            continue
+        if char in "[{":
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return index + 1
+        pos = index + 1
+
+
+def loads(text: str) -> Any:
+    """Decode a bare JSON document with the fast decoder."""
+    return _loads(text)
+
+
+def extract_json(text: Optional[str], expect: Optional[type] = None) -> Any:
+    """
+    Return the first complete JSON value in `text` (of type `expect`, dict or
+    list, if given). Raises JSONExtractionError when there is none; its
+    `truncated` flag is set when a value starts but never closes.
+    """
+    if not text:
+        raise JSONExtractionError("Empty response")
+
+    stripped = text.strip()
+    if stripped[:1] in ("{", "["):
+        try:
+            value = _loads(stripped)
+            if expect is None or isinstance(value, expect):
+                return value
+        except _DECODE_ERRORS:
+            pass
+
+    opener = _OPENERS[expect]
+    # Usual shape: one value with a fence or prose around it. Decoding from the
+    # first opener to the last matching closer avoids the Python-level scan.
+    first = opener.search(text)
+    if first is not None:
+        last = text.rfind("}" if text[first.start()] == "{" else "]")
+        if last > first.start():
+            try:
+                value = _loads(text[first.start():last + 1])
+                if expect is None or isinstance(value, expect):
+                    return value
+            except _DECODE_ERRORS:
+                pass
+
+    pos = 0
+    truncated_at = None
+    while True:
+        match = opener.search(text, pos)
+        if match is None:
+            break
+        start = match.start()
+        end = matching_end(text, start)
+        if end is None:
+            truncated_at = start
+            break
+        try:
+            value = _loads(text[start:end])
+        except _DECODE_ERRORS:
+            # e.g. "[note]" in a lead-in: try the next opening bracket
+            pos = start + 1
+            continue
+        if expect is None or isinstance(value, expect):
+            return value
+        pos = end
+
+    kind = {dict: "object", list: "array"}.get(expect, "value")
+    if truncated_at is not None:
+        raise JSONExtractionError(f"Response ends inside a JSON {kind} (truncated?)", truncated=True,
+                                  start=truncated_at)
+    raise JSONExtractionError(f"No JSON {kind} found in response")
+
+
+# ==================== TRUNCATION REPAIR ====================
+def _cut_points(text: str, start: int) -> List[Tuple[int, str]]:
+    """
+    (end, closers) pairs at which text[start:end] + closers is a complete value:
+    after each complete element (before a comma, after a closing bracket) and
+    right after each opening bracket (an empty container). An array element is
+    kept whole or not at all, so there are no cuts inside one.
+    """
+    stack: List[str] = []
+    atomic_depth = None  # Depth of the outermost open container that is an array element
+    cuts: List[Tuple[int, str]] = []
+    pos = start
+    while True:
+        match = _STRUCTURAL_OR_COMMA.search(text, pos)
+        if match is None:
+            return cuts
+        char, index = match.group(), match.start()
+        if char == '"':
+            literal = _STRING_LITERAL.match(text, index)
+            if literal is None:
+                # Cut off inside a string: the element it belongs to is incomplete
+                return cuts
+            pos = literal.end()
+            continue
+        if char in "[{":
+            if atomic_depth is None and stack and stack[-1] == "]":
+                atomic_depth = len(stack)
+            stack.append(_CLOSERS[char])
+        elif char == "]" or char == "}":
+            stack.pop()
+            if not stack:
+                return cuts
+            if atomic_depth == len(stack):
+                atomic_depth = None
+        if atomic_depth is None:
+            cut = index if char == "," else index + 1
+            cuts.append((cut, "".join(reversed(stack))))
+        pos = index + 1
+
+
+def repair_truncated_json(text: str, start: int = 0) -> Any:
+    """
+    Close a JSON value that starts at text[start] but was cut off (e.g. by
+    max_tokens). Everything after the last complete element is dropped - a
+    half-written string, number or key/value pair is not kept - and the open
+    strings, arrays and objects around it are closed. Raises JSONExtractionError
+    if not even an empty container can be recovered.
+    """
+    for end, closers in reversed(_cut_points(text, start)):
+        try:
+            return _loads(text[start:end] + closers)
+        except _DECODE_ERRORS:
+            # e.g. a cut right after `"key":` - fall back to an earlier element
+            continue
+    raise JSONExtractionError("Truncated JSON could not be repaired", truncated=True, start=start)
+
+
+def extract_json_partial(text: Optional[str], expect: Optional[type] = None) -> Tuple[Any, bool]:
+    """
+    extract_json(), but a reply that was cut off mid-value is repaired instead
+    of rejected. Returns (value, partial); `partial` is True when the value was
+    repaired and so may be missing trailing elements.
+    """
+    try:
+        return extract_json(text, expect), False
+    except JSONExtractionError as e:
+        if not e.truncated:
+            raise
+        return repair_truncated_json(text, e.start), True
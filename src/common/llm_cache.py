@@ -0,0 +1,154 @@
+"""
+Disk-backed cache for LLM responses.
+
+Responses are keyed by provider, model, a hash of the full prompt and system
+text, and the sampling parameters, and stored in a local SQLite key-value file.
+Old entries are dropped after `max_age_days`, and least-recently-used entries
+are evicted once the file grows past `max_bytes`.
+
+Set LLM_CACHE_BYPASS=1 (or pass bypass=True) for intentionally stochastic
+repeated runs: lookups then always miss, but fresh responses are still stored.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# ==================== CONFIGURATION ====================
+DEFAULT_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "dynamic-chunking", "llm_responses.sqlite3")
+)
+DEFAULT_MAX_BYTES = int(float(os.getenv("LLM_CACHE_MAX_MB", "512")) * 1024 * 1024)
+DEFAULT_MAX_AGE_DAYS = float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30"))
+EVICT_EVERY_N_PUTS = 100
+
+
+def env_flag(name: str) -> bool:
+    """True if an environment variable is set to a truthy value."""
+    return os.getenv(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+# ==================== CACHE KEYS ====================
+def make_cache_key(provider: str, model: str, prompt: Any, system: Optional[str] = None,
+                   params: Optional[Dict] = None) -> str:
+    """
+    Hash everything that determines a response.
+
+    `prompt` may be a string or a message list; `params` holds sampling and
+    output settings (temperature, max_tokens, response format, ...).
+    """
+    payload = {
+        "provider": provider,
+        "model": model,
+        "system": system,
+        "prompt": prompt,
+        "params": params or {},
+    }
+    blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+# ==================== RESPONSE CACHE ====================
+class ResponseCache:
+    """SQLite key-value store with size- and age-based eviction."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age_days: float = DEFAULT_MAX_AGE_DAYS, bypass: Optional[bool] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.bypass = env_flag("LLM_CACHE_BYPASS") if bypass is None else bypass
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_evict = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+        self._conn.commit()
+        # One connection is shared by every worker thread; it and the counters stay behind this lock
+        self._lock = threading.Lock()
+        self.evict()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response text, or None on a miss (always None when bypassing)."""
+        with self._lock:
+            if self.bypass:
+                self.misses += 1
+                return None
+
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            now = time.time()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str):
+        """Store a response. Callers should only store responses that parsed successfully."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now)
+            )
+            self._conn.commit()
+
+            self._puts_since_evict += 1
+            if self._puts_since_evict >= EVICT_EVERY_N_PUTS:
+                self._evict()
+
+    def evict(self):
+        """Drop expired entries, then least-recently-used ones until under max_bytes."""
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        self._puts_since_evict = 0
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,))
+
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total > self.max_bytes:
+            excess = total - self.max_bytes
+            victims = []
+            for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed ASC"):
+                victims.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self._conn.commit()
+
+
+_response_cache: Optional[ResponseCache] = None
+_registry_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Process-wide cache instance, opened lazily on first use."""
+    global _response_cache
+    with _registry_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
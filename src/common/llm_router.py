@@ -0,0 +1,343 @@
+"""
+Latency-aware routing of OpenAI-style chat requests across LLM providers.
+
+Backends are grouped into model-equivalence classes (models we are happy to
+treat as interchangeable for a stage). For each request the router picks the
+healthy backend in the class with the lowest smoothed latency, falls through
+to the next one on failure, and benches a backend for a cooldown period after
+repeated errors. Backends whose provider circuit breaker (common/retry.py) is
+open are skipped, and provider failures seen here count towards it.
+
+Every backend's base URL can be overridden through an environment variable
+(e.g. TOGETHER_BASE_URL=http://127.0.0.1:8001), which is how the router is
+pointed at local stand-in servers for testing. A JSON file named by
+LLM_ROUTER_CONFIG can replace the default backend and class tables.
+"""
+
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from common.deadlines import Timeout, request_timeout
+from common.retry import FATAL, TransientError, classify_error, get_circuit_breaker
+from common.schemas import gemini_response_schema, openai_response_format, schema_from_response_format, strip_extensions
+
+# ==================== CONFIGURATION ====================
+# kind: "openai" = /chat/completions, "gemini" = :generateContent, "ollama" = /api/chat
+# schema_style (openai kind): how a JSON-schema response_format is sent, see
+# common/schemas.openai_response_format (None = JSON mode only, validated locally)
+DEFAULT_BACKENDS = {
+    "together": {
+        "kind": "openai",
+        "base_url": "https://api.together.xyz/v1",
+        "base_url_env": "TOGETHER_BASE_URL",
+        "api_key_env": "TOGETHER_API_KEY",
+        "schema_style": "together",
+    },
+    "groq": {
+        "kind": "openai",
+        "base_url": "https://api.groq.com/openai/v1",
+        "base_url_env": "GROQ_BASE_URL",
+        "api_key_env": "GROQ_API_KEY",
+        "schema_style": None,
+    },
+    "huggingface": {
+        "kind": "openai",
+        "base_url": "https://router.huggingface.co/v1",
+        "base_url_env": "HUGGINGFACE_BASE_URL",
+        "api_key_env": "HUGGINGFACE_API_KEY",
+        "schema_style": "json_schema",
+    },
+    "ollama": {
+        "kind": "ollama",
+        "base_url": "https://ollama.com",
+        "base_url_env": "OLLAMA_API_URL",
+        "api_key_env": "OLLAMA_API_KEY",
+    },
+    "gemini": {
+        "kind": "gemini",
+        "base_url": "https://generativelanguage.googleapis.com/v1beta",
+        "base_url_env": "GEMINI_BASE_URL",
+        "api_key_env": "GEMINI_API_KEY",
+    },
+}
+
+# Model-equivalence classes: class name -> [(backend, model), ...]
+DEFAULT_MODEL_CLASSES = {
+    "llama-70b": [
+        ("together", "meta-llama/Meta-Llama-3-70B-Instruct-Turbo"),
+        ("groq", "llama-3.3-70b-versatile"),
+    ],
+    "mid-size-json": [
+        ("ollama", "gpt-oss:20b-cloud"),
+        ("gemini", "gemini-2.5-flash"),
+        ("groq", "llama-3.3-70b-versatile"),
+    ],
+}
+
+EWMA_ALPHA = 0.3                # Weight of the newest observation in smoothed stats
+FAILURES_BEFORE_COOLDOWN = 2    # Consecutive failures that bench a backend
+COOLDOWN_SECONDS = 120
+DEFAULT_EXPECTED_OUTPUT_TOKENS = 1000  # Sizes the read timeout when a request sets no max_tokens
+
+
+class RoutingError(TransientError):
+    """Raised when every backend in a model class failed or is unavailable, but one may recover."""
+
+
+class FatalRoutingError(Exception):
+    """Raised when no backend is configured, or every one failed fatally (e.g. 401, 400)."""
+
+
+# ==================== BACKEND HEALTH ====================
+class BackendStats:
+    """Smoothed latency / error rate and cooldown state for one (backend, model)."""
+
+    def __init__(self):
+        self.latency_ewma: Optional[float] = None
+        self.error_rate_ewma = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def record_success(self, latency: float):
+        self.calls += 1
+        self.consecutive_failures = 0
+        self.error_rate_ewma = (1 - EWMA_ALPHA) * self.error_rate_ewma
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency_ewma
+
+    def record_failure(self):
+        self.calls += 1
+        self.errors += 1
+        self.consecutive_failures += 1
+        self.error_rate_ewma = EWMA_ALPHA + (1 - EWMA_ALPHA) * self.error_rate_ewma
+        if self.consecutive_failures >= FAILURES_BEFORE_COOLDOWN:
+            self.cooldown_until = time.time() + COOLDOWN_SECONDS
+
+    def is_healthy(self) -> bool:
+        return time.time() >= self.cooldown_until
+
+    def score(self) -> float:
+        """Lower is better. Untried backends score 0 so they get explored once."""
+        if self.latency_ewma is None:
+            # Never succeeded: explore if untried, otherwise only as a last resort
+            return 0.0 if self.calls == 0 else float("inf")
+        # Penalise flaky backends: expected latency including a retry elsewhere
+        return self.latency_ewma * (1 + self.error_rate_ewma)
+
+    def to_dict(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "latency_ewma_s": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "error_rate_ewma": round(self.error_rate_ewma, 3),
+            "healthy": self.is_healthy(),
+        }
+
+
+# ==================== WIRE FORMATS ====================
+def _split_system(messages: List[Dict]) -> Tuple[Optional[str], List[Dict]]:
+    system = "\n\n".join(m["content"] for m in messages if m["role"] == "system") or None
+    return system, [m for m in messages if m["role"] != "system"]
+
+
+def _call_openai(base_url: str, api_key: Optional[str], model: str, messages: List[Dict],
+                 params: Dict, timeout: Timeout) -> Tuple[str, Dict]:
+    headers = {"Content-Type": "application/json"}
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    payload = {"model": model, "messages": messages, **params}
+    response = requests.post(f"{base_url}/chat/completions", headers=headers, json=payload, timeout=timeout)
+    response.raise_for_status()
+    result = response.json()
+    return result["choices"][0]["message"]["content"], result.get("usage", {})
+
+
+def _call_ollama(base_url: str, api_key: Optional[str], model: str, messages: List[Dict],
+                 params: Dict, timeout: Timeout) -> Tuple[str, Dict]:
+    headers = {"Content-Type": "application/json"}
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    options = {}
+    if "temperature" in params:
+        options["temperature"] = params["temperature"]
+    if "top_p" in params:
+        options["top_p"] = params["top_p"]
+    if "max_tokens" in params:
+        options["num_predict"] = params["max_tokens"]
+    payload = {"model": model, "messages": messages, "stream": False, "options": options}
+    schema = schema_from_response_format(params.get("response_format"))
+    if schema:
+        payload["format"] = strip_extensions(schema)
+    elif params.get("response_format", {}).get("type") == "json_object":
+        payload["format"] = "json"
+    response = requests.post(f"{base_url}/api/chat", headers=headers, json=payload, timeout=timeout)
+    response.raise_for_status()
+    result = response.json()
+    usage = {
+        "prompt_tokens": result.get("prompt_eval_count"),
+        "completion_tokens": result.get("eval_count"),
+    }
+    return result["message"]["content"], usage
+
+
+def _call_gemini(base_url: str, api_key: Optional[str], model: str, messages: List[Dict],
+                 params: Dict, timeout: Timeout) -> Tuple[str, Dict]:
+    system, turns = _split_system(messages)
+    payload = {
+        "contents": [
+            {"role": "model" if m["role"] == "assistant" else "user", "parts": [{"text": m["content"]}]}
+            for m in turns
+        ],
+        "generationConfig": {},
+    }
+    if system:
+        payload["systemInstruction"] = {"parts": [{"text": system}]}
+    config = payload["generationConfig"]
+    if "temperature" in params:
+        config["temperature"] = params["temperature"]
+    if "top_p" in params:
+        config["topP"] = params["top_p"]
+    if "max_tokens" in params:
+        config["maxOutputTokens"] = params["max_tokens"]
+    if params.get("response_format", {}).get("type") in ("json_object", "json_schema"):
+        config["responseMimeType"] = "application/json"
+    schema = schema_from_response_format(params.get("response_format"))
+    if schema:
+        config["responseSchema"] = gemini_response_schema(schema)
+
+    url = f"{base_url}/models/{model}:generateContent"
+    response = requests.post(url, params={"key": api_key} if api_key else None,
+                             headers={"Content-Type": "application/json"}, json=payload, timeout=timeout)
+    response.raise_for_status()
+    result = response.json()
+    if not result.get("candidates"):
+        raise ValueError("No candidates in Gemini response")
+    meta = result.get("usageMetadata", {})
+    usage = {
+        "prompt_tokens": meta.get("promptTokenCount"),
+        "completion_tokens": meta.get("candidatesTokenCount"),
+        "cached_tokens": meta.get("cachedContentTokenCount"),
+    }
+    return result["candidates"][0]["content"]["parts"][0]["text"], usage
+
+
+_CALLERS = {"openai": _call_openai, "ollama": _call_ollama, "gemini": _call_gemini}
+
+
+# ==================== ROUTER ====================
+class LLMRouter:
+    """Routes chat requests to the fastest healthy backend in a model class."""
+
+    def __init__(self, backends: Optional[Dict] = None, model_classes: Optional[Dict] = None):
+        if backends is None and model_classes is None and os.getenv("LLM_ROUTER_CONFIG"):
+            with open(os.getenv("LLM_ROUTER_CONFIG"), "r", encoding="utf-8") as f:
+                config = json.load(f)
+            backends = config.get("backends")
+            model_classes = config.get("model_classes")
+        self.backends = backends or DEFAULT_BACKENDS
+        self.model_classes = {
+            name: [tuple(member) for member in members]
+            for name, members in (model_classes or DEFAULT_MODEL_CLASSES).items()
+        }
+        self.stats: Dict[Tuple[str, str], BackendStats] = {}
+
+    def _base_url(self, backend: str) -> str:
+        config = self.backends[backend]
+        return os.getenv(config.get("base_url_env", ""), config["base_url"]).rstrip("/")
+
+    def _is_configured(self, backend: str) -> bool:
+        """Usable if its API key is set, or its base URL was overridden (local stand-in)."""
+        config = self.backends.get(backend)
+        if config is None:
+            return False
+        return bool(os.getenv(config.get("api_key_env", ""))) or bool(os.getenv(config.get("base_url_env", "")))
+
+    def candidates(self, model_class: str) -> List[Tuple[str, str]]:
+        """Configured members of a class, best first (healthy ones by score, then benched ones)."""
+        if model_class not in self.model_classes:
+            raise ValueError(f"Unknown model class: {model_class}")
+        members = [m for m in self.model_classes[model_class] if self._is_configured(m[0])]
+        for member in members:
+            self.stats.setdefault(member, BackendStats())
+        healthy = sorted((m for m in members if self.stats[m].is_healthy()), key=lambda m: self.stats[m].score())
+        benched = sorted((m for m in members if not self.stats[m].is_healthy()),
+                         key=lambda m: self.stats[m].cooldown_until)
+        return healthy + benched
+
+    def chat(self, model_class: str, messages: List[Dict], timeout: Optional[Timeout] = None,
+             **params) -> Tuple[str, Dict]:
+        """
+        Send an OpenAI-style chat request to the best backend in `model_class`.
+
+        `params` are OpenAI-style sampling/output settings (temperature, top_p,
+        max_tokens, response_format). A JSON-schema response_format is
+        translated into each backend's structured-output form. Returns (content, info) where info names
+        the backend and model used, the latency and any usage counts.
+        Without an explicit `timeout`, each attempt gets a (connect, read)
+        timeout sized from max_tokens and clipped to the stage deadline.
+        """
+        errors = []
+        retriable = False
+        for backend, model in self.candidates(model_class):
+            config = self.backends[backend]
+            stats = self.stats[(backend, model)]
+            breaker = get_circuit_breaker(backend)
+            if not breaker.allow():
+                errors.append(f"{backend}/{model}: circuit open")
+                retriable = True
+                continue
+            call_params = params
+            schema = schema_from_response_format(params.get("response_format"))
+            if schema and config["kind"] == "openai":
+                call_params = {**params, "response_format": openai_response_format(
+                    schema, params["response_format"].get("json_schema", {}).get("name", "response"),
+                    config.get("schema_style"))}
+            # Recomputed per backend, so a fallback never runs past the stage deadline
+            call_timeout = timeout or request_timeout(params.get("max_tokens") or DEFAULT_EXPECTED_OUTPUT_TOKENS,
+                                                      params.get("max_tokens"))
+            start = time.monotonic()
+            try:
+                content, usage = _CALLERS[config["kind"]](
+                    self._base_url(backend), os.getenv(config.get("api_key_env", "")),
+                    model, messages, call_params, call_timeout
+                )
+            except Exception as e:
+                stats.record_failure()
+                breaker.record_error(e)
+                retriable = retriable or classify_error(e)[0] != FATAL
+                errors.append(f"{backend}/{model}: {type(e).__name__}: {str(e)[:200]}")
+                print(f"   ⚠️  {backend} failed ({type(e).__name__}), trying next backend...")
+                continue
+
+            latency = time.monotonic() - start
+            stats.record_success(latency)
+            breaker.record_success()
+            return content, {"backend": backend, "model": model, "latency_s": round(latency, 3), "usage": usage}
+
+        if not errors:
+            raise FatalRoutingError(f"No configured backends for model class '{model_class}'")
+        error_type = RoutingError if retriable else FatalRoutingError
+        raise error_type(f"All backends failed for '{model_class}': " + " | ".join(errors))
+
+    def report(self) -> Dict:
+        """Per-backend health snapshot, e.g. for run metadata."""
+        return {f"{backend}/{model}": stats.to_dict() for (backend, model), stats in self.stats.items()}
+
+
+_router: Optional[LLMRouter] = None
+
+
+def get_router() -> LLMRouter:
+    """Process-wide router, so health stats accumulate across calls."""
+    global _router
+    if _router is None:
+        _router = LLMRouter()
+    return _router
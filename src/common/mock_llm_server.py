@@ -0,0 +1,550 @@
+"""
+Local stand-in LLM server for offline load tests and benchmarks.
+
+Speaks the wire formats the pipelines use:
+  - POST .../chat/completions          (Together, Groq, Hugging Face router; `n` choices)
+  - POST .../models/<model>:generateContent and .../cachedContents  (Gemini; candidateCount)
+  - POST /api/generate, /api/chat      (Ollama, streaming NDJSON or not)
+
+Responses are JSON built from the "Output Format" example in the prompt itself
+(placeholders like <1-5> filled in, "..." entries dropped), or canned replies
+from a rules file. Latency, 429/500 errors and truncated replies can be
+injected at configurable rates, so concurrency, retry and throughput behaviour
+can be exercised without paid APIs.
+
+Usage:
+    python mock_llm_server.py --port 8800 --latency-ms 800 --latency-dist lognormal \\
+        --rate-429 0.05 --rate-500 0.02 --truncate-rate 0.02
+
+Then point the scripts at it by base URL (any API key value is accepted):
+    TOGETHER_BASE_URL=http://127.0.0.1:8800/v1
+    GROQ_BASE_URL=http://127.0.0.1:8800/openai/v1
+    HUGGINGFACE_BASE_URL=http://127.0.0.1:8800/v1
+    GEMINI_BASE_URL=http://127.0.0.1:8800/v1beta
+    OLLAMA_API_URL=http://127.0.0.1:8800
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+# ==================== CONFIGURATION ====================
+DEFAULT_PORT = 8800
+PLAIN_TEXT_REPLY = (
+    "This course introduces the core principles of the subject and develops them through "
+    "lectures, worked examples and hands-on assignments. Students build a working understanding "
+    "of the key techniques and learn to apply them to realistic problems."
+)
+# Rough characters-per-token ratio used for usage counts
+CHARS_PER_TOKEN = 4
+
+# "Output Format", "Format:", "in exactly this schema", "Structure:" ... followed by a JSON example
+_OUTPUT_FORMAT_HEADER = re.compile(r"\b(?:format|schema|schema items|structure)\b[^\n\[{]*", re.IGNORECASE)
+_JSON_LIST_REQUEST = re.compile(r"json (?:array|list)", re.IGNORECASE)
+_EXACT_COUNT = re.compile(r'exactly (\d+) entries in "(\w+)"')
+_PLACEHOLDER = re.compile(r"<([^<>\n]*)>")
+_RANGE = re.compile(r"(\d+(?:\.\d+)?)\s*-\s*(\d+(?:\.\d+)?)")
+_ELLIPSIS_LINE = re.compile(r"^\s*\.\.\.[^\n]*$", re.MULTILINE)
+_TRAILING_COMMA = re.compile(r",(\s*[\]}])")
+
+
+# ==================== RESPONSE TEMPLATES ====================
+def _extract_balanced(text: str, start: int) -> Optional[str]:
+    """Return the bracket-balanced value starting at text[start], or None if unclosed."""
+    closers = {"{": "}", "[": "]"}
+    stack = []
+    in_string = escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in closers:
+            stack.append(closers[char])
+        elif char in "}]":
+            if not stack or stack.pop() != char:
+                return None
+            if not stack:
+                return text[start:i + 1]
+    return None
+
+
+def _fill_placeholder(match: re.Match, rng: random.Random) -> str:
+    """<1-5> -> random int in range; other placeholders -> a plausible number."""
+    bounds = _RANGE.search(match.group(1))
+    if bounds:
+        low, high = float(bounds.group(1)), float(bounds.group(2))
+        if low.is_integer() and high.is_integer():
+            return str(rng.randint(int(low), int(high)))
+        return str(round(rng.uniform(low, high), 2))
+    return str(rng.randint(3, 4))
+
+
+def _parse_example(example: str, rng: random.Random) -> Optional[Any]:
+    """Turn a prompt's illustrative JSON (placeholders, "..." entries) into valid JSON."""
+    # Prompts are f-strings, so literal braces may still be doubled
+    example = example.replace("{{", "{").replace("}}", "}")
+    example = _ELLIPSIS_LINE.sub("", example)
+    example = example.replace("[...]", "[]").replace("{...}", "{}").replace('"..."', '"mock"')
+    example = re.sub(r",\s*\.\.\.", "", example)
+    example = _PLACEHOLDER.sub(lambda m: _fill_placeholder(m, rng), example)
+    example = _TRAILING_COMMA.sub(r"\1", example)
+    try:
+        return json.loads(example)
+    except json.JSONDecodeError:
+        return None
+
+
+def template_from_prompt(prompt: str, rng: random.Random) -> Optional[Any]:
+    """Build a schema-shaped value from the JSON example that follows the prompt's output-format header."""
+    value = None
+    # Input data comes before the output instructions, so try the last header first
+    for header in reversed(list(_OUTPUT_FORMAT_HEADER.finditer(prompt))):
+        start = header.end()
+        if start < len(prompt) and prompt[start] in "{[":
+            example = _extract_balanced(prompt, start)
+        else:
+            openers = [i for i in (prompt.find("{", start), prompt.find("[", start)) if i != -1]
+            example = _extract_balanced(prompt, min(openers)) if openers else None
+        if example:
+            value = _parse_example(example, rng)
+        if value is not None:
+            break
+
+    if value is None:
+        if _JSON_LIST_REQUEST.search(prompt):
+            return [f"CO-{i}: Students will analyze mock topic {i} using provided examples." for i in range(1, 7)]
+        return None
+
+    # Batched prompts ask for "exactly N entries in <key>": replicate the example entry
+    count = _EXACT_COUNT.search(prompt)
+    if count and isinstance(value, dict) and isinstance(value.get(count.group(2)), list) and value[count.group(2)]:
+        entry = value[count.group(2)][0]
+        entries = []
+        for number in range(1, int(count.group(1)) + 1):
+            copy = json.loads(json.dumps(entry))
+            if isinstance(copy, dict) and "objective_number" in copy:
+                copy["objective_number"] = number
+            entries.append(copy)
+        value[count.group(2)] = entries
+    return value
+
+
+def instance_from_schema(schema: Dict, rng: random.Random, key: str = "value") -> Any:
+    """Build a value matching a JSON schema (JSON-Schema or Gemini-style upper-case types)."""
+    kind = str(schema.get("type", "string")).lower()
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    if kind == "object":
+        return {name: instance_from_schema(sub, rng, name) for name, sub in schema.get("properties", {}).items()}
+    if kind == "array":
+        count = max(schema.get("minItems", 1), 1)
+        return [instance_from_schema(schema.get("items", {}), rng, f"{key} {i + 1}") for i in range(count)]
+    if kind in ("integer", "number"):
+        low, high = schema.get("minimum", 1), schema.get("maximum", max(schema.get("minimum", 1), 5))
+        return rng.randint(int(low), int(high)) if kind == "integer" else round(rng.uniform(low, high), 2)
+    if kind == "boolean":
+        return rng.random() < 0.5
+    return f"mock {key}"
+
+
+def requested_schema(body: Dict) -> Optional[Dict]:
+    """JSON schema a request constrains its output to (OpenAI / Together / Gemini / Ollama forms)."""
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        return response_format.get("json_schema", {}).get("schema")
+    if response_format.get("schema"):
+        return response_format["schema"]
+    if body.get("generationConfig", {}).get("responseSchema"):
+        return body["generationConfig"]["responseSchema"]
+    return body["format"] if isinstance(body.get("format"), dict) else None
+
+
+class ResponseFactory:
+    """Chooses the reply text for a prompt: canned rule, prompt template, or plain text."""
+
+    def __init__(self, rules: Optional[List[Dict]] = None, seed: Optional[int] = None):
+        self.rules = [(re.compile(rule["match"], re.IGNORECASE | re.DOTALL), rule["response"]) for rule in rules or []]
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def reply(self, prompt: str, want_json: bool, schema: Optional[Dict] = None) -> str:
+        for pattern, response in self.rules:
+            if pattern.search(prompt):
+                return response if isinstance(response, str) else json.dumps(response, ensure_ascii=False)
+        with self.lock:
+            value = template_from_prompt(prompt, self.rng)
+            if value is None and schema:
+                value = instance_from_schema(schema, self.rng)
+        if value is not None:
+            return json.dumps(value, ensure_ascii=False, indent=2)
+        return json.dumps({"response": PLAIN_TEXT_REPLY}) if want_json else PLAIN_TEXT_REPLY
+
+
+# ==================== FAULT / LATENCY INJECTION ====================
+class Behaviour:
+    """Latency distribution and error/truncation injection rates."""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, dist: str = "fixed",
+                 tokens_per_second: float = 0, rate_429: float = 0, rate_500: float = 0,
+                 truncate_rate: float = 0, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.dist = dist
+        self.tokens_per_second = tokens_per_second
+        self.rate_429 = rate_429
+        self.rate_500 = rate_500
+        self.truncate_rate = truncate_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def latency(self) -> float:
+        """Seconds to wait before the first token."""
+        with self.lock:
+            if self.dist == "uniform":
+                ms = self.rng.uniform(self.latency_ms - self.jitter_ms, self.latency_ms + self.jitter_ms)
+            elif self.dist == "normal":
+                ms = self.rng.gauss(self.latency_ms, self.jitter_ms)
+            elif self.dist == "lognormal" and self.latency_ms > 0:
+                # Parameterised by mean and standard deviation of the latency itself
+                sigma2 = math.log(1 + (self.jitter_ms / self.latency_ms) ** 2)
+                ms = self.rng.lognormvariate(math.log(self.latency_ms) - sigma2 / 2, math.sqrt(sigma2))
+            else:
+                ms = self.latency_ms
+        return max(ms, 0) / 1000
+
+    def fault(self) -> Optional[int]:
+        """HTTP status to fail this request with, or None."""
+        with self.lock:
+            roll = self.rng.random()
+        if roll < self.rate_429:
+            return 429
+        if roll < self.rate_429 + self.rate_500:
+            return 500
+        return None
+
+    def truncate(self, text: str) -> Tuple[str, bool]:
+        """Cut the reply short (as if max_tokens were hit) at the configured rate."""
+        with self.lock:
+            if len(text) < 2 or self.rng.random() >= self.truncate_rate:
+                return text, False
+            cut = self.rng.randint(1, len(text) - 1)
+        return text[:cut], True
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def _chunks(text: str, size: int = CHARS_PER_TOKEN * 4) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+# ==================== HTTP HANDLER ====================
+class MockLLMHandler(BaseHTTPRequestHandler):
+    server_version = "MockLLM/1.0"
+    protocol_version = "HTTP/1.1"
+
+    # ---- plumbing ----
+    def log_message(self, fmt, *args):
+        if not self.server.quiet:
+            super().log_message(fmt, *args)
+
+    def _send_json(self, status: int, body: Dict, headers: Optional[Dict] = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_fault(self, status: int):
+        self.server.count(f"http_{status}")
+        message = "Rate limit exceeded" if status == 429 else "Internal server error (injected)"
+        headers = {"Retry-After": "1"} if status == 429 else None
+        self._send_json(status, {"error": {"code": status, "message": message}}, headers)
+
+    def _start_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, obj: Dict):
+        data = (json.dumps(obj) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _token_delay(self):
+        if self.server.behaviour.tokens_per_second > 0:
+            time.sleep(4 / self.server.behaviour.tokens_per_second)
+
+    # ---- routing ----
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path in ("/", "/health"):
+            self._send_json(200, {"status": "ok"})
+        elif path == "/stats":
+            self._send_json(200, self.server.snapshot())
+        elif path == "/api/tags":
+            self._send_json(200, {"models": []})
+        else:
+            self._send_json(404, {"error": f"unknown path {path}"})
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": "request body is not JSON"})
+            return
+
+        if path.endswith("/cachedContents"):
+            self._gemini_create_cache(body)
+            return
+
+        handlers = {
+            "chat/completions": self._openai_chat,
+            ":generateContent": self._gemini_generate,
+            "/api/generate": self._ollama_generate,
+            "/api/chat": self._ollama_chat,
+        }
+        handler = next((h for suffix, h in handlers.items() if path.endswith(suffix)), None)
+        if handler is None:
+            self._send_json(404, {"error": f"unknown path {path}"})
+            return
+
+        self.server.count("requests")
+        status = self.server.behaviour.fault()
+        time.sleep(self.server.behaviour.latency())
+        if status:
+            self._send_fault(status)
+            return
+        handler(body)
+
+    # ---- OpenAI-style (Together / Groq / HF router) ----
+    def _openai_chat(self, body: Dict):
+        messages = body.get("messages", [])
+        prompt = "\n\n".join(str(m.get("content", "")) for m in messages)
+        want_json = body.get("response_format", {}).get("type") in ("json_object", "json_schema")
+        choices = []
+        for index in range(int(body.get("n") or 1)):
+            text, truncated = self.server.behaviour.truncate(
+                self.server.responses.reply(prompt, want_json, requested_schema(body)))
+            self.server.count("truncated" if truncated else "completed")
+            choices.append({
+                "index": index,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "length" if truncated else "stop",
+            })
+        completion_tokens = sum(_tokens(c["message"]["content"]) for c in choices)
+        self._send_json(200, {
+            "id": f"mock-{self.server.count('ids')}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": choices,
+            "usage": {
+                "prompt_tokens": _tokens(prompt),
+                "completion_tokens": completion_tokens,
+                "total_tokens": _tokens(prompt) + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": 0},
+            },
+        })
+
+    # ---- Gemini ----
+    def _gemini_create_cache(self, body: Dict):
+        system = " ".join(p.get("text", "") for p in body.get("systemInstruction", {}).get("parts", []))
+        name = "cachedContents/mock-" + hashlib.sha256(system.encode("utf-8")).hexdigest()[:16]
+        with self.server.lock:
+            self.server.gemini_caches[name] = system
+        self.server.count("cached_contents")
+        self._send_json(200, {"name": name, "model": body.get("model"), "usageMetadata": {"totalTokenCount": _tokens(system)}})
+
+    def _gemini_generate(self, body: Dict):
+        cached_system = ""
+        if body.get("cachedContent"):
+            with self.server.lock:
+                cached_system = self.server.gemini_caches.get(body["cachedContent"])
+            if cached_system is None:
+                self._send_json(404, {"error": {"code": 404, "message": "CachedContent not found"}})
+                return
+        system = " ".join(p.get("text", "") for p in body.get("systemInstruction", {}).get("parts", []))
+        turns = " ".join(p.get("text", "") for c in body.get("contents", []) for p in c.get("parts", []))
+        prompt = "\n\n".join(part for part in (cached_system, system, turns) if part)
+        want_json = body.get("generationConfig", {}).get("responseMimeType") == "application/json"
+
+        candidates = []
+        for index in range(int(body.get("generationConfig", {}).get("candidateCount", 1))):
+            text, truncated = self.server.behaviour.truncate(
+                self.server.responses.reply(prompt, want_json, requested_schema(body)))
+            self.server.count("truncated" if truncated else "completed")
+            candidates.append({
+                "index": index,
+                "content": {"role": "model", "parts": [{"text": text}]},
+                "finishReason": "MAX_TOKENS" if truncated else "STOP",
+            })
+        self._send_json(200, {
+            "candidates": candidates,
+            "usageMetadata": {
+                "promptTokenCount": _tokens(prompt),
+                "cachedContentTokenCount": _tokens(cached_system) if cached_system else 0,
+                "candidatesTokenCount": sum(_tokens(c["content"]["parts"][0]["text"]) for c in candidates),
+            },
+        })
+
+    # ---- Ollama ----
+    def _ollama_reply(self, body: Dict, prompt: str) -> Tuple[str, bool]:
+        want_json = bool(body.get("format"))
+        text, truncated = self.server.behaviour.truncate(
+            self.server.responses.reply(prompt, want_json, requested_schema(body)))
+        self.server.count("truncated" if truncated else "completed")
+        return text, truncated
+
+    def _ollama_done(self, body: Dict, prompt: str, text: str, truncated: bool) -> Dict:
+        return {
+            "model": body.get("model", "mock"),
+            "done": True,
+            "done_reason": "length" if truncated else "stop",
+            "prompt_eval_count": _tokens(prompt),
+            "eval_count": _tokens(text),
+        }
+
+    def _ollama_generate(self, body: Dict):
+        prompt = "\n\n".join(part for part in (body.get("system"), body.get("prompt", "")) if part)
+        text, truncated = self._ollama_reply(body, prompt)
+        if body.get("stream", True) is False:
+            self._send_json(200, {"response": text, **self._ollama_done(body, prompt, text, truncated)})
+            return
+        self._start_stream()
+        try:
+            for chunk in _chunks(text):
+                self._write_chunk({"model": body.get("model", "mock"), "response": chunk, "done": False})
+                self._token_delay()
+            self._write_chunk({"response": "", **self._ollama_done(body, prompt, text, truncated)})
+            self._end_stream()
+        except (BrokenPipeError, ConnectionResetError):
+            # Client dropped the stream early (e.g. JSON already complete)
+            self.server.count("client_aborts")
+            self.close_connection = True
+
+    def _ollama_chat(self, body: Dict):
+        prompt = "\n\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        text, truncated = self._ollama_reply(body, prompt)
+        message = {"role": "assistant", "content": text}
+        if body.get("stream", True) is False:
+            self._send_json(200, {"message": message, **self._ollama_done(body, prompt, text, truncated)})
+            return
+        self._start_stream()
+        try:
+            for chunk in _chunks(text):
+                self._write_chunk({"message": {"role": "assistant", "content": chunk}, "done": False})
+                self._token_delay()
+            self._write_chunk({"message": {"role": "assistant", "content": ""},
+                               **self._ollama_done(body, prompt, text, truncated)})
+            self._end_stream()
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.count("client_aborts")
+            self.close_connection = True
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding the response factory, behaviour and counters."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], responses: ResponseFactory, behaviour: Behaviour,
+                 quiet: bool = True):
+        super().__init__(address, MockLLMHandler)
+        self.responses = responses
+        self.behaviour = behaviour
+        self.quiet = quiet
+        self.lock = threading.Lock()
+        self.counters: Dict[str, int] = {}
+        self.gemini_caches: Dict[str, str] = {}
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name: str) -> int:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+            return self.counters[name]
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.lock:
+            return {k: v for k, v in self.counters.items() if k != "ids"}
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, rules_file: Optional[str] = None,
+                 seed: Optional[int] = None, quiet: bool = True, **behaviour) -> MockLLMServer:
+    """Start a mock server on a background thread (port 0 = any free port); call .shutdown() to stop."""
+    rules = None
+    if rules_file:
+        with open(rules_file, "r", encoding="utf-8") as f:
+            rules = json.load(f)
+    server = MockLLMServer((host, port), ResponseFactory(rules, seed), Behaviour(seed=seed, **behaviour), quiet)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ==================== MAIN ====================
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI/Gemini/Ollama-compatible mock LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Mean time to first token")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Spread (half-width for uniform, stdev otherwise)")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "normal", "lognormal"], default="fixed")
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="Streaming speed (0 = no delay)")
+    parser.add_argument("--rate-429", type=float, default=0, help="Fraction of requests answered with 429")
+    parser.add_argument("--rate-500", type=float, default=0, help="Fraction of requests answered with 500")
+    parser.add_argument("--truncate-rate", type=float, default=0, help="Fraction of replies cut short")
+    parser.add_argument("--responses", help='JSON list of canned replies: [{"match": "<regex>", "response": ...}]')
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    server = start_server(
+        args.host, args.port, rules_file=args.responses, seed=args.seed, quiet=not args.verbose,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, dist=args.latency_dist,
+        tokens_per_second=args.tokens_per_second, rate_429=args.rate_429, rate_500=args.rate_500,
+        truncate_rate=args.truncate_rate,
+    )
+    print(f"🧪 Mock LLM server listening on {server.base_url}")
+    print(f"   TOGETHER_BASE_URL={server.base_url}/v1")
+    print(f"   GROQ_BASE_URL={server.base_url}/openai/v1")
+    print(f"   HUGGINGFACE_BASE_URL={server.base_url}/v1")
+    print(f"   GEMINI_BASE_URL={server.base_url}/v1beta")
+    print(f"   OLLAMA_API_URL={server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(f"\n📊 {server.snapshot()}")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""
+Ollama /api/generate client with optional streaming and early JSON validation.
+
+In streaming mode the response is checked as it arrives: if the model starts
+writing prose instead of `{`/`[`, opens the wrong top-level type, or closes a
+bracket that was never opened, the connection is dropped straight away so the
+caller can retry immediately instead of waiting for the full completion.
+Reading also stops as soon as the top-level JSON value is complete.
+
+Every call returns timing stats (time-to-first-token and total latency).
+
+OllamaGenerator wraps these calls in the slide scripts' full call path: the
+local response cache, single-flight coalescing of identical requests, the
+request scheduler, a tuned num_predict that is escalated when a reply is cut
+off, schema validation and usage recording.
+"""
+
+import json
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+
+from common.deadlines import Timeout, request_timeout
+from common.json_extract import JSONExtractionError, extract_json_partial
+from common.llm_cache import get_response_cache, make_cache_key
+from common.retry import BadOutputError, TransientError, call_with_retry
+from common.single_flight import coalesce
+from common.usage_tracker import estimate_tokens
+
+# Characters of non-JSON text tolerated before the opening bracket
+# (covers "```json" fences and short lead-ins like "Here is the JSON:")
+MAX_PREAMBLE_CHARS = 80
+
+_CLOSERS = {"}": "{", "]": "["}
+_TYPE_OPENERS = {dict: "{", list: "["}
+
+
+class MalformedResponseError(BadOutputError, ValueError):
+    """Raised when a streamed response is clearly not the JSON that was asked for."""
+
+    def __init__(self, message: str, stats: Optional[Dict] = None):
+        super().__init__(message)
+        self.stats = stats or {}
+
+
+class OllamaStreamError(TransientError, ValueError):
+    """The server reported an error partway through a stream (e.g. the model runner crashed)."""
+
+
+# ==================== INCREMENTAL VALIDATION ====================
+class JsonPrefixValidator:
+    """
+    Incremental, string-aware bracket scanner over a growing response.
+
+    feed() returns True once the first top-level JSON value has been closed
+    and raises MalformedResponseError as soon as the prefix cannot be valid.
+    """
+
+    def __init__(self, expect: Optional[type] = None, max_preamble_chars: int = MAX_PREAMBLE_CHARS):
+        self.expected_opener = _TYPE_OPENERS.get(expect)
+        self.max_preamble_chars = max_preamble_chars
+        self.preamble_chars = 0
+        self.stack = []
+        self.started = False
+        self.complete = False
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> bool:
+        for char in text:
+            if self.complete:
+                break
+
+            if not self.started:
+                if char in "{[":
+                    if self.expected_opener and char != self.expected_opener:
+                        raise MalformedResponseError(
+                            f"expected top-level '{self.expected_opener}' but response opened with '{char}'"
+                        )
+                    self.started = True
+                    self.stack.append(char)
+                elif self.preamble_chars or not char.isspace():
+                    self.preamble_chars += 1
+                    if self.preamble_chars > self.max_preamble_chars:
+                        raise MalformedResponseError(
+                            f"no JSON value after {self.max_preamble_chars} characters of prose"
+                        )
+                continue
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.stack.append(char)
+            elif char in _CLOSERS:
+                if not self.stack or self.stack[-1] != _CLOSERS[char]:
+                    raise MalformedResponseError(f"unbalanced '{char}' in JSON response")
+                self.stack.pop()
+                if not self.stack:
+                    self.complete = True
+
+        return self.complete
+
+
+# ==================== API CALLS ====================
+def post_generate(url: str, headers: Dict, payload: Dict, timeout: Timeout) -> Tuple[str, Dict]:
+    """Non-streaming /api/generate call. Returns (generated_text, stats)."""
+    start = time.monotonic()
+    response = requests.post(url, headers=headers, json={**payload, "stream": False}, timeout=timeout)
+    response.raise_for_status()
+    result = response.json()
+    total = time.monotonic() - start
+
+    stats = {
+        "model": payload.get("model"),
+        "streamed": False,
+        "ttft_s": None,
+        "total_s": round(total, 3),
+        "prompt_tokens": result.get("prompt_eval_count"),
+        "completion_tokens": result.get("eval_count"),
+    }
+    return result.get("response", ""), stats
+
+
+def stream_generate(url: str, headers: Dict, payload: Dict, timeout: Timeout,
+                    expect: Optional[type] = None, deadline_s: Optional[float] = None) -> Tuple[str, Dict]:
+    """
+    Streaming /api/generate call with early abort on malformed JSON.
+
+    `timeout` bounds connecting and each wait for the next chunk; `deadline_s`
+    bounds the whole stream, so a reply that keeps trickling in is cancelled
+    (as a requests Timeout, which the retry engine retries).
+
+    Returns (generated_text, stats). Raises MalformedResponseError (with
+    .stats attached) when the stream is abandoned.
+    """
+    validator = JsonPrefixValidator(expect)
+    parts = []
+    stats: Dict[str, Any] = {
+        "model": payload.get("model"),
+        "streamed": True,
+        "ttft_s": None,
+        "total_s": None,
+        "prompt_tokens": None,
+        "completion_tokens": None,
+        "stopped_early": False,
+    }
+    start = time.monotonic()
+
+    try:
+        with requests.post(url, headers=headers, json={**payload, "stream": True},
+                           timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise OllamaStreamError(f"Ollama stream error: {chunk['error']}")
+
+                if deadline_s is not None and time.monotonic() - start > deadline_s:
+                    raise requests.exceptions.ReadTimeout(f"Stream still running after its {deadline_s:.0f}s deadline")
+
+                token = chunk.get("response", "")
+                if token:
+                    if stats["ttft_s"] is None:
+                        stats["ttft_s"] = round(time.monotonic() - start, 3)
+                    parts.append(token)
+                    if validator.feed(token):
+                        # Top-level value closed; skip any trailing prose
+                        stats["stopped_early"] = not chunk.get("done", False)
+                        break
+
+                if chunk.get("done"):
+                    stats["prompt_tokens"] = chunk.get("prompt_eval_count")
+                    stats["completion_tokens"] = chunk.get("eval_count")
+                    break
+    except MalformedResponseError as e:
+        stats["total_s"] = round(time.monotonic() - start, 3)
+        stats["aborted"] = str(e)
+        e.stats = stats
+        raise
+
+    stats["total_s"] = round(time.monotonic() - start, 3)
+    return "".join(parts), stats
+
+
+# ==================== CACHED JSON CALLS ====================
+class OllamaGenerator:
+    """
+    JSON replies from one Ollama model, through the response cache, single-flight
+    coalescing, the scheduler and the token budget (the slide scripts' call path).
+    """
+
+    def __init__(self, api_url: str, api_key: str, model: str, usage, scheduler, token_budget,
+                 stream: bool = True, default_max_tokens: int = 4096, expected_tokens: int = 800,
+                 max_retries: int = 3, retry_sleep: float = 2):
+        self.url = f"{api_url}/api/generate"
+        self.headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+        self.model = model
+        self.usage = usage
+        self.scheduler = scheduler
+        self.token_budget = token_budget
+        self.stream = stream
+        self.default_max_tokens = default_max_tokens
+        self.expected_tokens = expected_tokens
+        self.max_retries = max_retries
+        self.retry_sleep = retry_sleep
+
+    def record_call(self, prompt: str, generated_text: str, stats: Dict[str, Any]) -> Dict[str, Any]:
+        """Record one call. Token counts are estimated when a stream ended before Ollama reported them."""
+        estimated = stats.get("prompt_tokens") is None
+        return self.usage.record(
+            "ollama", self.model,
+            prompt_tokens=estimate_tokens(prompt) if estimated else stats["prompt_tokens"],
+            completion_tokens=estimate_tokens(generated_text) if estimated else stats.get("completion_tokens"),
+            latency_s=stats.get("total_s"),
+            ttft_s=stats.get("ttft_s"),
+            streamed=stats.get("streamed"),
+            tokens_estimated=estimated,
+            aborted=stats.get("aborted")
+        )
+
+    def generate(self, prompt: str, use_cache: bool = True, expect: type = None, schema=None,
+                 expected_tokens: Optional[int] = None, prompt_type: Optional[str] = None) -> Any:
+        """
+        Parsed JSON reply to `prompt`.
+        `expect` (dict or list) lets the streaming path abort as soon as the
+        response opens with the wrong top-level type. `schema` (a CompiledSchema)
+        constrains decoding server-side and is validated on the parsed reply.
+        `expected_tokens` sizes the call's deadline (common/deadlines.py).
+        `num_predict` is tuned from the reply lengths seen for `prompt_type` (default:
+        the current usage stage); a reply cut off by it is re-requested with a larger one.
+        """
+        prompt_type = prompt_type or self.usage.current_stage or "ollama"
+        expected_tokens = expected_tokens or self.expected_tokens
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": self.stream,
+            "options": {
+                "temperature": 0.3,
+                "num_predict": self.token_budget.max_tokens(prompt_type, self.default_max_tokens)
+            }
+        }
+        if schema is not None:
+            payload["format"] = schema.provider_schema()
+            expect = expect or schema.expected_type
+
+        # Serve identical prompts from the local response cache
+        cache = get_response_cache()
+
+        def decode(text: Optional[str]) -> Any:
+            """A cached reply, parsed and validated like a fresh one; None (a miss) if absent or no longer valid."""
+            if text is None:
+                return None
+            try:
+                parsed = extract_json_partial(text, expect)[0]
+                return schema.validate(parsed) if schema is not None else parsed
+            except BadOutputError as e:
+                print(f"   ⚠️  Cached reply no longer valid, re-requesting: {e}")
+                return None
+
+        # Keyed on the default num_predict, not the tuned or escalated one: a budget change
+        # never orphans cached replies, and an escalated reply lands where waiters look for it
+        cache_key = make_cache_key("ollama", self.model, prompt,
+                                   params={**payload["options"], "num_predict": self.default_max_tokens})
+        cached = decode(cache.get(cache_key)) if use_cache else None
+        if cached is not None:
+            return cached
+
+        def request() -> Any:
+            self.scheduler.acquire(f"ollama:{self.model}")
+            # Connect / read timeouts sized from the expected output, never past the stage deadline
+            timeout = request_timeout(expected_tokens, payload["options"]["num_predict"])
+            try:
+                if self.stream:
+                    generated_text, call_stats = stream_generate(self.url, self.headers, payload, timeout=timeout,
+                                                                 expect=expect, deadline_s=timeout[1])
+                else:
+                    generated_text, call_stats = post_generate(self.url, self.headers, payload, timeout=timeout)
+            except MalformedResponseError as e:
+                # Stream was abandoned early; the retry engine retries it straight away
+                self.record_call(prompt, "", e.stats)
+                print(f"   ⚠️  Aborted malformed response: {e}")
+                raise
+            usage_entry = self.record_call(prompt, generated_text, call_stats)
+            if call_stats["ttft_s"] is not None:
+                print(f"   ⏱  TTFT {call_stats['ttft_s']:.1f}s, total {call_stats['total_s']:.1f}s")
+            if not generated_text:
+                raise BadOutputError("Empty response from Ollama API")
+
+            # First complete JSON value, ignoring markdown fences and preamble text. A reply cut
+            # off at num_predict keeps its complete elements if those still satisfy the schema.
+            try:
+                parsed, partial = extract_json_partial(generated_text, expect)
+                extraction_error = None
+            except JSONExtractionError as e:
+                # Still observed below: a reply cut off too early to repair is the one that needs a larger budget
+                parsed, partial, extraction_error = None, e.truncated, e
+            num_predict = payload["options"]["num_predict"]
+            truncated = self.token_budget.observe(prompt_type, usage_entry["completion_tokens"], num_predict,
+                                                  truncated=True if partial else None)
+            larger = self.token_budget.escalate(num_predict, self.default_max_tokens) if truncated else None
+            if larger:
+                print(f"   ✂️  Response was cut off at {num_predict} tokens; retrying with {larger}")
+                payload["options"]["num_predict"] = larger
+                return request()
+            if extraction_error is not None:
+                raise extraction_error
+            if schema is not None:
+                parsed = schema.validate(parsed)
+            if partial:
+                usage_entry["partial"] = True
+                print("   ✂️  Response was cut off at num_predict; kept its complete part")
+            cache.put(cache_key, generated_text)
+            return parsed
+
+        # Backoff (honouring "try again in Ns"), retry budget and circuit breaker: common/retry.py
+        def request_with_retry() -> Any:
+            return call_with_retry(request, provider="ollama", max_attempts=self.max_retries,
+                                   base_delay=self.retry_sleep)
+
+        if not use_cache:
+            return request_with_retry()
+        def decode_or_request(text: str) -> Any:
+            # A peer's reply that doesn't validate here counts as a miss
+            parsed = decode(text)
+            return parsed if parsed is not None else request_with_retry()
+
+        # The ABCD / SMART / Bloom scripts send identical deck-summary prompts: when they run
+        # side by side (or in several threads), concurrent identical requests share one call
+        return coalesce(cache_key, request_with_retry, decode=decode_or_request)
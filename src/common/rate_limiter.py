@@ -0,0 +1,75 @@
+"""
+Cross-process request log for rate limiting, backed by a small SQLite database.
+
+Every process on the machine that uses the same bucket name shares one request
+log, so a restart remembers today's usage and two concurrent scripts split the
+quota instead of each assuming they own all of it. The request scheduler
+(common/scheduler.py) grants slots against it.
+"""
+
+import os
+import sqlite3
+import time
+
+# ==================== CONFIGURATION ====================
+DEFAULT_QUOTA_DB = os.getenv(
+    "LLM_QUOTA_DB",
+    os.path.join(os.path.expanduser("~"), ".cache", "dynamic-chunking", "quota.sqlite3")
+)
+
+MINUTE = 60
+DAY = 86400
+
+
+# ==================== QUOTA STORE ====================
+class QuotaStore:
+    """SQLite request log shared by every process that opens the same file."""
+
+    def __init__(self, db_path: str = DEFAULT_QUOTA_DB):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS requests (bucket TEXT NOT NULL, ts REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_requests_bucket_ts ON requests(bucket, ts)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None so that the callers' BEGIN IMMEDIATE is the only transaction
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def slot_wait(self, conn: sqlite3.Connection, bucket: str, rpm: int, rpd: int, now: float) -> float:
+        """
+        Seconds until `bucket` has a free slot under both limits (0.0 if it has
+        one now). Runs inside the caller's transaction on `conn`.
+        """
+        conn.execute("DELETE FROM requests WHERE bucket = ? AND ts <= ?", (bucket, now - DAY))
+
+        minute_count, minute_oldest = conn.execute(
+            "SELECT COUNT(*), MIN(ts) FROM requests WHERE bucket = ? AND ts > ?",
+            (bucket, now - MINUTE)
+        ).fetchone()
+        day_count, day_oldest = conn.execute(
+            "SELECT COUNT(*), MIN(ts) FROM requests WHERE bucket = ?", (bucket,)
+        ).fetchone()
+
+        wait = 0.0
+        if day_count >= rpd:
+            wait = max(wait, day_oldest + DAY - now)
+        if minute_count >= rpm:
+            wait = max(wait, minute_oldest + MINUTE - now)
+        return wait
+
+    def usage(self, bucket: str, window: float = DAY) -> int:
+        """Number of requests recorded for a bucket within the last `window` seconds."""
+        conn = self._connect()
+        try:
+            (count,) = conn.execute(
+                "SELECT COUNT(*) FROM requests WHERE bucket = ? AND ts > ?",
+                (bucket, time.time() - window)
+            ).fetchone()
+            return count
+        finally:
+            conn.close()
+
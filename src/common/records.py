@@ -0,0 +1,238 @@
+"""
+Slotted record types for the pipeline's bulk data.
+
+Courses, slides, concepts and relationships are stored as JSON objects, and
+loading them as dicts costs a hash table per record (two for a course, whose
+metadata is nested), plus one copy of every repeated string per record.
+A million-course collection held that way takes about 2 GB. These classes
+keep the same fields in `__slots__`, with no per-instance dict, and intern the
+fields that repeat across records (`source`, `institution`, `language`,
+level/category, concept importance and Bloom level), so each distinct value is
+stored once. `date_collected` is not interned: the Kaggle processor stamps one
+time per run, but the Coursera collector stamps every record, so a course
+shares the string only when it equals the previous course's.
+
+Every class converts to and from the current JSON schema: `from_dict()` accepts
+what the scripts write, and `to_dict()` gives it back with the same keys in the
+same order. Unknown keys are kept in `extra` and written back out. Lists become
+tuples in memory and lists again in `to_dict()`. Records the scripts write come
+back unchanged; others are normalised to that schema: a missing or null title,
+description or learning_outcomes comes back as "" or [], and a missing course
+field or metadata (or metadata key) comes back as null.
+
+`python -m common.benchmark_records` compares their memory with plain dicts.
+"""
+
+import sys
+from typing import Any, Dict, Iterable, List, Optional
+
+_intern = sys.intern
+
+
+def _interned(value: Any) -> Any:
+    return _intern(value) if type(value) is str else value
+
+
+_last_collected: Optional[str] = None
+
+
+def _collected(value: Optional[str]) -> Optional[str]:
+    """The previous course's date_collected string when equal (once-per-run stamps), else `value`."""
+    global _last_collected
+    if value is not None and value == _last_collected:
+        return _last_collected
+    _last_collected = value
+    return value
+
+
+def _unknown(data: Dict, known: frozenset) -> Optional[Dict]:
+    """Keys outside the schema, or None (no dict allocated) when there are none."""
+    if len(data) <= len(known) and data.keys() <= known:
+        return None
+    extra = {k: v for k, v in data.items() if k not in known}
+    return extra or None
+
+
+# ==================== COURSES ====================
+class Course:
+    """One standardised course (collectors, Kaggle processor)."""
+
+    __slots__ = ("id", "source", "course_code", "title", "description", "learning_outcomes",
+                 "institution", "level", "category", "language", "date_collected", "url",
+                 "extra", "metadata_extra")
+
+    FIELDS = frozenset({"id", "source", "course_code", "title", "description", "learning_outcomes", "metadata"})
+    METADATA_FIELDS = frozenset({"institution", "level", "category", "language", "date_collected", "url"})
+
+    def __init__(self, id: str = None, source: str = None, title: str = "", description: str = "",
+                 learning_outcomes: Iterable[str] = (), course_code: str = None, institution: str = None,
+                 level: str = None, category: str = None, language: str = None,
+                 date_collected: str = None, url: str = None, extra: Dict = None, metadata_extra: Dict = None):
+        self.id = id
+        self.source = _interned(source)
+        self.course_code = course_code
+        self.title = title
+        self.description = description
+        self.learning_outcomes = tuple(learning_outcomes or ())
+        self.institution = _interned(institution)
+        self.level = _interned(level)
+        self.category = _interned(category)
+        self.language = _interned(language)
+        self.date_collected = _collected(date_collected)
+        self.url = url
+        self.extra = extra
+        self.metadata_extra = metadata_extra
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Course":
+        metadata = data.get("metadata") or {}
+        return cls(
+            id=data.get("id"),
+            source=data.get("source"),
+            course_code=data.get("course_code"),
+            title=data.get("title") or "",
+            description=data.get("description") or "",
+            learning_outcomes=data.get("learning_outcomes") or (),
+            institution=metadata.get("institution"),
+            level=metadata.get("level"),
+            category=metadata.get("category"),
+            language=metadata.get("language"),
+            date_collected=metadata.get("date_collected"),
+            url=metadata.get("url"),
+            extra=_unknown(data, cls.FIELDS),
+            metadata_extra=_unknown(metadata, cls.METADATA_FIELDS),
+        )
+
+    def to_dict(self) -> Dict:
+        metadata = {
+            "institution": self.institution,
+            "level": self.level,
+            "category": self.category,
+            "language": self.language,
+            "date_collected": self.date_collected,
+            "url": self.url,
+        }
+        if self.metadata_extra:
+            metadata.update(self.metadata_extra)
+        data = {
+            "id": self.id,
+            "source": self.source,
+            "course_code": self.course_code,
+            "title": self.title,
+            "description": self.description,
+            "learning_outcomes": list(self.learning_outcomes),
+            "metadata": metadata,
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __repr__(self) -> str:
+        return f"Course({self.id!r}, {self.title!r}, source={self.source!r})"
+
+
+# ==================== SLIDES ====================
+class Slide:
+    """Text of one PDF page (slide extraction)."""
+
+    __slots__ = ("slide_number", "source_file", "content")
+
+    def __init__(self, slide_number: int, source_file: str, content: str):
+        self.slide_number = slide_number
+        self.source_file = _interned(source_file)
+        self.content = content
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Slide":
+        return cls(data["slide_number"], data["source_file"], data["content"])
+
+    def to_dict(self) -> Dict:
+        return {"slide_number": self.slide_number, "source_file": self.source_file, "content": self.content}
+
+    def __repr__(self) -> str:
+        return f"Slide({self.source_file!r}, {self.slide_number})"
+
+
+# ==================== CONCEPT GRAPH ====================
+class Concept:
+    """One concept of the slide concept graph (CONCEPT_BATCH_SCHEMA)."""
+
+    __slots__ = ("name", "importance", "bloom_level", "slide_numbers", "definition", "extra")
+
+    FIELDS = frozenset({"name", "importance", "bloom_level", "slide_numbers", "definition"})
+
+    def __init__(self, name: str, importance: str = None, bloom_level: str = None,
+                 slide_numbers: Iterable[int] = (), definition: str = None, extra: Dict = None):
+        self.name = _interned(name)  # Relationships refer to concepts by name
+        self.importance = _interned(importance)
+        self.bloom_level = _interned(bloom_level)
+        self.slide_numbers = tuple(slide_numbers or ())
+        self.definition = definition
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Concept":
+        return cls(data["name"], data.get("importance"), data.get("bloom_level"),
+                   data.get("slide_numbers") or (), data.get("definition"), _unknown(data, cls.FIELDS))
+
+    def to_dict(self) -> Dict:
+        data = {"name": self.name}
+        # The model omits optional fields; don't write them back as nulls
+        if self.importance is not None:
+            data["importance"] = self.importance
+        if self.bloom_level is not None:
+            data["bloom_level"] = self.bloom_level
+        data["slide_numbers"] = list(self.slide_numbers)
+        if self.definition is not None:
+            data["definition"] = self.definition
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __repr__(self) -> str:
+        return f"Concept({self.name!r})"
+
+
+class Relationship:
+    """One edge of the slide concept graph (CONCEPT_BATCH_SCHEMA)."""
+
+    __slots__ = ("source", "target", "type", "strength", "extra")
+
+    FIELDS = frozenset({"source", "target", "type", "strength"})
+
+    def __init__(self, source: str, target: str, type: str, strength: float = None, extra: Dict = None):
+        self.source = _interned(source)
+        self.target = _interned(target)
+        self.type = _interned(type)
+        self.strength = strength
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Relationship":
+        return cls(data["source"], data["target"], data["type"], data.get("strength"), _unknown(data, cls.FIELDS))
+
+    def to_dict(self) -> Dict:
+        data = {"source": self.source, "target": self.target, "type": self.type}
+        if self.strength is not None:
+            data["strength"] = self.strength
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @property
+    def key(self) -> tuple:
+        """What merge_concepts deduplicates relationships on."""
+        return self.source, self.target, self.type
+
+    def __repr__(self) -> str:
+        return f"Relationship({self.source!r} -{self.type}-> {self.target!r})"
+
+
+# ==================== CONVERTERS ====================
+def courses_from_dicts(data: Iterable[Dict]) -> List[Course]:
+    return [Course.from_dict(d) for d in data]
+
+
+def to_dicts(records: Iterable) -> List[Dict]:
+    """Records of any type back to the JSON schema, e.g. for atomic_write_json."""
+    return [r.to_dict() for r in records]
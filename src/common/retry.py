@@ -0,0 +1,324 @@
+"""
+Shared retry engine for LLM API calls.
+
+call_with_retry() runs a call with jittered exponential backoff (never shorter
+than a server's Retry-After / "try again in" hint), draws every retry from one
+shared RetryBudget, and goes through the provider's CircuitBreaker: after
+repeated provider failures the breaker opens and calls fail fast with
+CircuitOpenError until its cooldown has passed, instead of every caller
+sleeping through its own retry loop while the provider is down. The budget
+refills at LLM_RETRY_BUDGET_REFILL retries a minute, so a long run is not
+left without retries by an early burst of failures.
+
+Errors are classified as:
+  rate_limited - 429 / quota exhausted: back off, at least the suggested delay
+  transient    - timeouts, connection errors, 5xx: back off
+  retry_now    - the provider answered but the reply was unusable (malformed
+                 JSON, stale context cache): retry at once, provider is healthy
+  fatal        - anything else (4xx, missing keys, programming errors): raise
+"""
+
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+import requests
+
+from common.deadlines import StageDeadlineExceeded, check_deadline, remaining_time
+
+# ==================== CONFIGURATION ====================
+MAX_ATTEMPTS = int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", "4"))        # Attempts per call, first one included
+BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "2"))          # Seconds; doubles per attempt
+MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "120"))          # Cap on one backoff sleep
+RETRY_BUDGET = int(os.getenv("LLM_RETRY_BUDGET", "50"))             # Retries that can be spent at once, all calls together
+RETRY_BUDGET_REFILL = float(os.getenv("LLM_RETRY_BUDGET_REFILL", "10"))  # Retries returned to the budget per minute
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))      # Consecutive provider failures that open a breaker
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "60"))   # Seconds a breaker stays open
+
+RATE_LIMITED = "rate_limited"
+TRANSIENT = "transient"
+RETRY_NOW = "retry_now"
+FATAL = "fatal"
+
+_TRANSIENT_STATUS = {408, 500, 502, 503, 504, 529}
+# google.api_core exception class names (matched by name so google libs stay optional)
+_GOOGLE_RATE_LIMITED = {"ResourceExhausted", "TooManyRequests"}
+_GOOGLE_TRANSIENT = {"ServiceUnavailable", "InternalServerError", "DeadlineExceeded",
+                     "GatewayTimeout", "BadGateway", "Aborted"}
+_TRY_AGAIN_IN = re.compile(r"try again in ([\d.]+)\s*s", re.IGNORECASE)
+
+T = TypeVar("T")
+
+
+class TransientError(Exception):
+    """A failure worth backing off and retrying (e.g. every routed backend failed)."""
+
+
+class RetryNowError(Exception):
+    """The provider answered, but the call should simply be made again."""
+
+
+class BadOutputError(RetryNowError):
+    """The reply could not be used (not JSON, wrong shape, empty)."""
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+    def __init__(self, provider: str, retry_in: float):
+        super().__init__(f"{provider} circuit open, retry in {retry_in:.0f}s")
+        self.provider = provider
+        self.retry_in = retry_in
+
+
+class RetryBudgetExhausted(Exception):
+    """Raised when a call needs a retry but the run's retry budget is spent."""
+
+
+# ==================== CLASSIFICATION ====================
+def _retry_after(exc: Exception) -> Optional[float]:
+    """Server-suggested delay in seconds, if the error carries one."""
+    response = getattr(exc, "response", None)
+    header = getattr(response, "headers", None) and response.headers.get("Retry-After")
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            pass
+    retry_delay = getattr(exc, "retry_delay", None)
+    if retry_delay:
+        return retry_delay.total_seconds() if hasattr(retry_delay, "total_seconds") else float(retry_delay)
+    # Groq / Ollama put it in the message: "Please try again in 13.335s"
+    match = _TRY_AGAIN_IN.search(f"{exc} {getattr(response, 'text', '') or ''}")
+    return float(match.group(1)) if match else None
+
+
+def classify_error(exc: Exception) -> Tuple[str, Optional[float]]:
+    """(kind, suggested delay) for an exception raised by an API call."""
+    if isinstance(exc, RetryNowError) or isinstance(exc, json.JSONDecodeError):
+        return RETRY_NOW, None
+    if isinstance(exc, TransientError):
+        return TRANSIENT, None
+
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status == 429 or type(exc).__name__ in _GOOGLE_RATE_LIMITED:
+        return RATE_LIMITED, _retry_after(exc)
+    if status in _TRANSIENT_STATUS or type(exc).__name__ in _GOOGLE_TRANSIENT:
+        return TRANSIENT, _retry_after(exc)
+    if isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                        requests.exceptions.ChunkedEncodingError, ConnectionError, TimeoutError)):
+        return TRANSIENT, None
+    return FATAL, None
+
+
+def is_provider_response(exc: Exception) -> bool:
+    """Whether `exc` is the provider's answer (an HTTP error status, an unusable reply) rather than a local error."""
+    if isinstance(exc, RetryNowError) or isinstance(exc, json.JSONDecodeError):
+        return True
+    if getattr(getattr(exc, "response", None), "status_code", None) is not None:
+        return True
+    return any(cls.__name__ == "GoogleAPICallError" for cls in type(exc).__mro__)
+
+
+def backoff_delay(attempt: int, base_delay: float = BASE_DELAY, max_delay: float = MAX_DELAY,
+                  suggested: Optional[float] = None) -> float:
+    """Jittered exponential delay before retry number `attempt` (1-based).
+
+    Half of the exponential step is fixed and half random, so concurrent
+    callers spread out but never retry immediately after a failure.
+    """
+    step = min(max_delay, base_delay * 2 ** (attempt - 1))
+    delay = step / 2 + random.uniform(0, step / 2)
+    return max(delay, suggested or 0)
+
+
+# ==================== BUDGET & BREAKERS ====================
+class RetryBudget:
+    """Token bucket of retries shared by all calls: `total` at once, refilled at `refill_per_min`."""
+
+    def __init__(self, total: int = RETRY_BUDGET, refill_per_min: float = RETRY_BUDGET_REFILL):
+        self.total = total
+        self.refill_per_min = refill_per_min
+        self.used = 0
+        self._tokens = float(total)
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.total, self._tokens + (now - self._refilled_at) * self.refill_per_min / 60)
+        self._refilled_at = now
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.used += 1
+            return True
+
+    @property
+    def remaining(self) -> int:
+        with self._lock:
+            self._refill()
+            return int(self._tokens)
+
+    def to_dict(self) -> Dict:
+        return {"total": self.total, "refill_per_min": self.refill_per_min, "used": self.used,
+                "remaining": self.remaining}
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive provider failures;
+    open -> half-open after `cooldown_s`, letting a single probe call through;
+    the probe's outcome closes the breaker again or re-opens it.
+    """
+
+    def __init__(self, provider: str, failure_threshold: int = BREAKER_FAILURES,
+                 cooldown_s: float = BREAKER_COOLDOWN):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_until = 0.0
+        self.times_opened = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() < self.opened_until:
+                    return False
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open":
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def retry_in(self) -> float:
+        return max(self.opened_until - time.monotonic(), 0.0)
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._probing = False
+
+    def release(self):
+        """Free a half-open probe slot without judging the provider (the call failed locally)."""
+        with self._lock:
+            self._probing = False
+
+    def record_error(self, exc: Exception):
+        """Count a failed call: outages and rate limits count against the provider, its own answers
+        (HTTP 4xx, unusable replies) show it is up, and local errors don't count either way."""
+        kind, _ = classify_error(exc)
+        if kind in (RATE_LIMITED, TRANSIENT):
+            self.record_failure()
+        elif is_provider_response(exc):
+            self.record_success()
+        else:
+            self.release()
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probing = False
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                    print(f"   🔌 {self.provider} circuit open for {self.cooldown_s:.0f}s "
+                          f"({self.consecutive_failures} consecutive failures)")
+                self.state = "open"
+                self.opened_until = time.monotonic() + self.cooldown_s
+
+    def to_dict(self) -> Dict:
+        return {"state": self.state, "consecutive_failures": self.consecutive_failures,
+                "times_opened": self.times_opened}
+
+
+_budget: Optional[RetryBudget] = None
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def get_retry_budget() -> RetryBudget:
+    """Process-wide retry budget for this run."""
+    global _budget
+    with _registry_lock:
+        if _budget is None:
+            _budget = RetryBudget()
+        return _budget
+
+
+def get_circuit_breaker(provider: str) -> CircuitBreaker:
+    """Process-wide breaker for one provider, shared by every caller of it."""
+    with _registry_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(provider)
+        return _breakers[provider]
+
+
+def retry_report() -> Dict:
+    """Budget use and breaker states, e.g. for run metadata."""
+    return {
+        "retry_budget": get_retry_budget().to_dict(),
+        "circuit_breakers": {name: breaker.to_dict() for name, breaker in _breakers.items()},
+    }
+
+
+# ==================== RETRY LOOP ====================
+def call_with_retry(fn: Callable[[], T], provider: str, max_attempts: Optional[int] = None,
+                    base_delay: float = BASE_DELAY, max_delay: float = MAX_DELAY) -> T:
+    """
+    Call `fn()` until it succeeds, retrying per the error classification above.
+
+    Raises the last error once attempts run out or it is fatal,
+    RetryBudgetExhausted when the run has no retries left, CircuitOpenError
+    without calling `fn` while `provider`'s breaker is open, and
+    StageDeadlineExceeded once the current stage deadline (common/deadlines.py) has
+    passed or a backoff would end after it.
+    """
+    max_attempts = max_attempts or MAX_ATTEMPTS
+    breaker = get_circuit_breaker(provider)
+    attempt = 0
+    while True:
+        attempt += 1
+        check_deadline()
+        if not breaker.allow():
+            raise CircuitOpenError(provider, breaker.retry_in())
+        try:
+            result = fn()
+        except Exception as e:
+            kind, suggested = classify_error(e)
+            breaker.record_error(e)
+            if kind == FATAL or attempt >= max_attempts:
+                raise
+            if breaker.state == "open":
+                raise CircuitOpenError(provider, breaker.retry_in()) from e
+            if not get_retry_budget().try_spend():
+                raise RetryBudgetExhausted(f"Retry budget of {get_retry_budget().total} spent "
+                                           f"(refills {get_retry_budget().refill_per_min:g}/min); "
+                                           f"last error from {provider}: {type(e).__name__}: {e}") from e
+
+            delay = 0.0 if kind == RETRY_NOW else backoff_delay(attempt, base_delay, max_delay, suggested)
+            remaining = remaining_time()
+            if remaining is not None and delay >= remaining:
+                raise StageDeadlineExceeded(f"Stage deadline leaves {max(remaining, 0):.0f}s, retry needs {delay:.0f}s; "
+                                       f"last error from {provider}: {type(e).__name__}: {e}") from e
+            print(f"\n      ⚠️  {provider} {kind} ({type(e).__name__}: {str(e)[:120]}) - "
+                  f"retry {attempt}/{max_attempts - 1} in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
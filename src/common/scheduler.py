@@ -0,0 +1,278 @@
+"""
+Priority-aware request scheduler shared by every process on the machine.
+
+Ad-hoc single-course runs and overnight batch jobs (evaluation, taxonomy
+tagging, description backfill) use the same API keys. Without coordination an
+interactive run queues behind thousands of batch calls. The scheduler owns the
+provider quotas: every process asks it for a slot before calling a provider,
+and waiting requests are served
+
+  1. by priority class: interactive before batch, so interactive work
+     overtakes any queued batch work;
+  2. by fair share within a class: the job (script) with the fewest recent
+     grants goes first, so two batch jobs split a quota instead of the first
+     one starving the second;
+  3. in arrival order.
+
+Batch requests also leave INTERACTIVE_RESERVE of each per-minute quota unused,
+so an interactive request usually starts without waiting for a slot at all.
+
+There is no daemon: quotas, the waiting queue and the request log live in the
+rate limiter's SQLite file (common/rate_limiter.py) and every waiting process
+takes part in scheduling under a write lock. Buckets without a quota are not
+queued. `python -m common.scheduler` shows queues and quotas and sets quotas.
+"""
+
+import argparse
+import json
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.deadlines import check_deadline
+from common.rate_limiter import DAY, MINUTE, QuotaStore
+
+# ==================== CONFIGURATION ====================
+PRIORITY_CLASSES = {"interactive": 0, "batch": 1}
+INTERACTIVE_RESERVE = float(os.getenv("LLM_SCHEDULER_INTERACTIVE_RESERVE", "0.25"))  # Share of rpm batch leaves free
+FAIR_SHARE_WINDOW = float(os.getenv("LLM_SCHEDULER_FAIR_WINDOW", "600"))             # Seconds of grants counted per job
+POLL_INTERVAL = float(os.getenv("LLM_SCHEDULER_POLL", "0.5"))                        # Seconds between scheduling checks
+STALE_TICKET_AFTER = 30       # Seconds without a poll before a waiting request is considered abandoned
+QUOTAS_FILE = os.getenv("LLM_SCHEDULER_QUOTAS")   # Optional {"provider:model": [rpm, rpd], ...}
+
+
+# ==================== SCHEDULER ====================
+class RequestScheduler:
+    """Grants provider request slots to queued requests from any process, by priority and fair share."""
+
+    def __init__(self, priority: str = "batch", job: Optional[str] = None, store: Optional[QuotaStore] = None):
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class '{priority}' (expected one of {sorted(PRIORITY_CLASSES)})")
+        self.priority = priority
+        self.job = job or Path(sys.argv[0]).stem or "python"
+        self.store = store or QuotaStore()
+        self.waited_s = 0.0
+        self.grants = 0
+
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS quotas (
+                    bucket TEXT PRIMARY KEY,
+                    rpm INTEGER NOT NULL,
+                    rpd INTEGER NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tickets (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    bucket TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    job TEXT NOT NULL,
+                    enqueued REAL NOT NULL,
+                    seen REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tickets_bucket ON tickets(bucket, priority, id)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS grants (bucket TEXT NOT NULL, job TEXT NOT NULL,
+                                                   priority INTEGER NOT NULL, ts REAL NOT NULL)
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_grants_bucket_ts ON grants(bucket, ts)")
+        if QUOTAS_FILE:
+            with open(QUOTAS_FILE, "r", encoding="utf-8") as f:
+                for bucket, (rpm, rpd) in json.load(f).items():
+                    self.set_quota(bucket, rpm, rpd)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.store.db_path, timeout=30, isolation_level=None)
+
+    # ---------- quotas ----------
+    def set_quota(self, bucket: str, rpm: int, rpd: int, if_missing: bool = False):
+        """
+        Set a bucket's limits for every process. With `if_missing`, a quota
+        already configured (e.g. via the CLI) is kept - for scripts' defaults.
+        """
+        verb = "INSERT OR IGNORE" if if_missing else "INSERT OR REPLACE"
+        with self._connect() as conn:
+            conn.execute(f"{verb} INTO quotas (bucket, rpm, rpd) VALUES (?, ?, ?)", (bucket, rpm, rpd))
+
+    def quota(self, bucket: str) -> Optional[Tuple[int, int]]:
+        """(rpm, rpd) of a bucket, or None if it is not rate limited."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT rpm, rpd FROM quotas WHERE bucket = ?", (bucket,)).fetchone()
+        return tuple(row) if row else None
+
+    def requests_today(self, bucket: str) -> int:
+        """Requests granted in the last 24h to every process sharing this bucket."""
+        return self.store.usage(bucket, DAY)
+
+    # ---------- scheduling ----------
+    def _head(self, conn: sqlite3.Connection, bucket: str, now: float) -> Optional[int]:
+        """Ticket that goes next: priority class, then the job with fewest recent grants, then arrival."""
+        row = conn.execute("""
+            SELECT t.id FROM tickets t
+            LEFT JOIN (SELECT job, COUNT(*) AS n FROM grants WHERE bucket = ? AND ts > ? GROUP BY job) g
+                   ON g.job = t.job
+            WHERE t.bucket = ?
+            ORDER BY t.priority, COALESCE(g.n, 0), t.id
+            LIMIT 1
+        """, (bucket, now - FAIR_SHARE_WINDOW, bucket)).fetchone()
+        return row[0] if row else None
+
+    def _try_grant(self, conn: sqlite3.Connection, ticket: int, bucket: str, rank: int,
+                   rpm: int, rpd: int) -> Tuple[bool, float]:
+        """One scheduling round for `ticket`: (granted, seconds until it could be)."""
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM tickets WHERE seen < ?", (now - STALE_TICKET_AFTER,))
+            conn.execute("UPDATE tickets SET seen = ? WHERE id = ?", (now, ticket))
+            if self._head(conn, bucket, now) != ticket:
+                return False, POLL_INTERVAL
+
+            # Batch leaves part of the per-minute quota for interactive requests
+            limit = rpm
+            if rank > PRIORITY_CLASSES["interactive"] and rpm > 1:
+                limit = max(1, rpm - math.ceil(rpm * INTERACTIVE_RESERVE))
+            wait = self.store.slot_wait(conn, bucket, limit, rpd, now)
+            if wait > 0:
+                return False, wait
+
+            conn.execute("INSERT INTO requests (bucket, ts) VALUES (?, ?)", (bucket, now))
+            conn.execute("INSERT INTO grants (bucket, job, priority, ts) VALUES (?, ?, ?, ?)",
+                         (bucket, self.job, rank, now))
+            conn.execute("DELETE FROM grants WHERE bucket = ? AND ts <= ?", (bucket, now - FAIR_SHARE_WINDOW))
+            conn.execute("DELETE FROM tickets WHERE id = ?", (ticket,))
+            return True, 0.0
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            if conn.in_transaction:
+                conn.execute("COMMIT")
+
+    def acquire(self, bucket: str, priority: Optional[str] = None) -> float:
+        """
+        Block until this process may send one request to `bucket`; returns the
+        seconds waited. Buckets without a quota return at once. Raises
+        StageDeadlineExceeded if the current stage deadline passes while queued.
+        """
+        limits = self.quota(bucket)
+        if limits is None:
+            return 0.0
+        rpm, rpd = limits
+        rank = PRIORITY_CLASSES[priority or self.priority]
+
+        start = time.monotonic()
+        conn = self._connect()
+        with conn:
+            ticket = conn.execute(
+                "INSERT INTO tickets (bucket, priority, job, enqueued, seen) VALUES (?, ?, ?, ?, ?)",
+                (bucket, rank, self.job, time.time(), time.time())
+            ).lastrowid
+        announced = False
+        try:
+            while True:
+                granted, wait = self._try_grant(conn, ticket, bucket, rank, rpm, rpd)
+                if granted:
+                    waited = time.monotonic() - start
+                    self.waited_s += waited
+                    self.grants += 1
+                    return waited
+                if not announced and wait > MINUTE:
+                    print(f"  ⚠️ DAILY LIMIT REACHED for {bucket} ({rpd} req/day); "
+                          f"next slot in {wait / 3600:.1f} hours...")
+                    announced = True
+                elif not announced and wait > POLL_INTERVAL:
+                    print(f"  ⏳ {bucket}: per-minute limit ({rpm} req/min) reached, queued as {priority or self.priority}")
+                    announced = True
+                check_deadline()
+                # Re-check at least every POLL_INTERVAL: a higher-priority request may arrive meanwhile
+                time.sleep(min(wait, POLL_INTERVAL))
+        except BaseException:
+            conn.execute("DELETE FROM tickets WHERE id = ?", (ticket,))
+            raise
+        finally:
+            conn.close()
+
+    def status(self) -> List[Dict]:
+        """Per-bucket quota, usage and queue, for every bucket with a quota."""
+        now = time.time()
+        rows = []
+        with self._connect() as conn:
+            for bucket, rpm, rpd in conn.execute("SELECT bucket, rpm, rpd FROM quotas ORDER BY bucket").fetchall():
+                queued = conn.execute(
+                    "SELECT priority, job, COUNT(*) FROM tickets WHERE bucket = ? AND seen > ? "
+                    "GROUP BY priority, job ORDER BY priority, job",
+                    (bucket, now - STALE_TICKET_AFTER)
+                ).fetchall()
+                (last_minute,) = conn.execute("SELECT COUNT(*) FROM requests WHERE bucket = ? AND ts > ?",
+                                              (bucket, now - MINUTE)).fetchone()
+                (last_day,) = conn.execute("SELECT COUNT(*) FROM requests WHERE bucket = ? AND ts > ?",
+                                           (bucket, now - DAY)).fetchone()
+                names = {rank: name for name, rank in PRIORITY_CLASSES.items()}
+                rows.append({
+                    "bucket": bucket, "rpm": rpm, "rpd": rpd,
+                    "used_last_minute": last_minute, "used_last_day": last_day,
+                    "queued": [{"priority": names.get(rank, rank), "job": job, "requests": n}
+                               for rank, job, n in queued],
+                })
+        return rows
+
+    def report(self) -> Dict:
+        """This process's class, job, grants and time spent queued, e.g. for run metadata."""
+        return {"priority": self.priority, "job": self.job, "grants": self.grants,
+                "queued_s": round(self.waited_s, 1)}
+
+
+_scheduler: Optional[RequestScheduler] = None
+_registry_lock = threading.Lock()
+
+
+def get_scheduler(default_priority: str = "batch") -> RequestScheduler:
+    """
+    Process-wide scheduler. A script passes its usual priority class; the
+    LLM_PRIORITY environment variable overrides it (and LLM_JOB the job name).
+    """
+    global _scheduler
+    with _registry_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler(os.getenv("LLM_PRIORITY") or default_priority, os.getenv("LLM_JOB"))
+        return _scheduler
+
+
+# ==================== CLI ====================
+def main():
+    parser = argparse.ArgumentParser(description="Show or configure the shared LLM request scheduler")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("status", help="Quotas, usage and queued requests per bucket")
+    set_quota = sub.add_parser("set-quota", help="Set a bucket's limits for every process")
+    set_quota.add_argument("bucket", help='e.g. "gemini:gemini-2.5-flash"')
+    set_quota.add_argument("--rpm", type=int, required=True)
+    set_quota.add_argument("--rpd", type=int, required=True)
+    args = parser.parse_args()
+
+    scheduler = RequestScheduler()
+    if args.command == "set-quota":
+        scheduler.set_quota(args.bucket, args.rpm, args.rpd)
+        print(f"✓ {args.bucket}: {args.rpm} req/min, {args.rpd} req/day")
+        return
+
+    rows = scheduler.status()
+    if not rows:
+        print("No quotas configured; requests are not queued.")
+    for row in rows:
+        print(f"\n📊 {row['bucket']}: {row['used_last_minute']}/{row['rpm']} this minute, "
+              f"{row['used_last_day']}/{row['rpd']} today")
+        for entry in row["queued"] or [{"priority": "-", "job": "(queue empty)", "requests": ""}]:
+            print(f"   {entry['priority']:<12} {entry['job']:<40} {entry['requests']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,440 @@
+"""
+JSON schemas for every structured LLM response, with precompiled validators.
+
+Each schema is sent to the provider as a structured-output constraint where
+the API supports one (Together `response_format.schema`, OpenAI-style
+`json_schema`, Gemini `responseSchema`, Ollama `format`) and is always checked
+locally on the parsed reply.
+
+Validators are compiled once per schema into nested closures, so checking a
+reply is a single walk with no schema interpretation. They also repair what
+can be repaired without guessing, so fewer replies are thrown away and
+re-requested:
+  - "5" / 5.0 -> 5 for integers, "0.9" -> 0.9 for numbers
+  - enum values matched case-insensitively ("Critical" -> "critical")
+  - array items that fail validation are dropped instead of failing the whole
+    reply when the array schema sets "x-drop-invalid-items"
+
+Keys starting with "x-" are local extensions and are stripped before a schema
+is sent to a provider.
+"""
+
+import copy
+from typing import Any, Callable, Dict, List, Optional
+
+from common.retry import BadOutputError
+
+Validator = Callable[[Any, str], Any]
+
+
+class SchemaValidationError(BadOutputError):
+    """A parsed reply does not match its response schema."""
+
+    def __init__(self, path: str, message: str):
+        super().__init__(f"{path or '$'}: {message}")
+        self.path = path
+
+
+# ==================== RESPONSE SCHEMAS ====================
+def _string_list(min_items: int = 0) -> Dict:
+    return {"type": "array", "items": {"type": "string"}, "minItems": min_items}
+
+
+def _score() -> Dict:
+    return {"type": "number", "minimum": 1, "maximum": 5}
+
+
+def _scored_criterion() -> Dict:
+    return {
+        "type": "object",
+        "properties": {"score": _score(), "evidence": {"type": "string"}, "weakness": {"type": "string"}},
+        "required": ["score"],
+    }
+
+
+def _scored_criteria(names: List[str]) -> Dict:
+    return {"type": "object", "properties": {name: _scored_criterion() for name in names}, "required": names}
+
+
+def _checklist() -> Dict:
+    return {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {"question": {"type": "string"}, "answer": {"type": "string"}, "reasoning": {"type": "string"}},
+            "required": ["question", "answer"],
+        },
+    }
+
+
+def _granular_responses() -> Dict:
+    return {
+        "type": "array",
+        "x-drop-invalid-items": True,
+        "items": {
+            "type": "object",
+            "properties": {
+                "criterion": {"type": "string"},
+                "question": {"type": "string"},
+                "score": _score(),
+                "justification": {"type": "string"},
+            },
+            "required": ["criterion", "score"],
+        },
+    }
+
+
+# Graph pipeline: concepts and relationships from one batch of slides
+CONCEPT_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "concepts": {
+            "type": "array",
+            "x-drop-invalid-items": True,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "importance": {"type": "string", "enum": ["critical", "high", "medium", "low"]},
+                    "bloom_level": {"type": "string",
+                                    "enum": ["remember", "understand", "apply", "analyze", "evaluate", "create"]},
+                    "slide_numbers": {"type": "array", "items": {"type": "integer"}, "x-drop-invalid-items": True},
+                    "definition": {"type": "string"},
+                },
+                "required": ["name"],
+            },
+        },
+        "relationships": {
+            "type": "array",
+            "x-drop-invalid-items": True,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "source": {"type": "string"},
+                    "target": {"type": "string"},
+                    "type": {"type": "string", "enum": ["prerequisite_for", "is_a", "part_of", "enables"]},
+                    "strength": {"type": "number", "minimum": 0, "maximum": 1},
+                },
+                "required": ["source", "target", "type"],
+            },
+        },
+    },
+    "required": ["concepts", "relationships"],
+}
+
+# Simple slide pipelines: compact summary of one deck
+DECK_SUMMARY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "deck": {"type": "string"},
+        "topics": _string_list(),
+        "key_concepts": _string_list(),
+        "skills": _string_list(),
+        "important_terms": _string_list(),
+    },
+    "required": ["deck", "topics", "key_concepts", "skills", "important_terms"],
+}
+
+DECK_SUMMARY_LIST_SCHEMA = {"type": "array", "items": DECK_SUMMARY_SCHEMA, "minItems": 1}
+
+
+def lo_list_schema(min_items: int = 1, max_items: Optional[int] = None) -> Dict:
+    """A JSON array of learning-objective strings."""
+    schema = {"type": "array", "items": {"type": "string", "minLength": 1}, "minItems": min_items}
+    if max_items is not None:
+        schema["maxItems"] = max_items
+    return schema
+
+
+# Judge replies (one LO)
+ABCD_JUDGEMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "overall_scores": _scored_criteria(["audience", "behavior", "condition", "degree"]),
+        "granular_responses": _granular_responses(),
+        "composite_score": _score(),
+        "overall_assessment": {"type": "string"},
+        "improvement_suggestions": _string_list(),
+    },
+    "required": ["overall_scores", "composite_score"],
+}
+
+SMART_JUDGEMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "binary_checklist": _checklist(),
+        "hard_constraints_applied": {
+            "type": "object",
+            "properties": {name: {"type": "boolean"} for name in ("uses_weak_verb", "too_generic", "unrealistic_scope")},
+        },
+        "overall_scores": _scored_criteria(["specific", "measurable", "achievable", "relevant", "time_bound"]),
+        "granular_responses": _granular_responses(),
+        "composite_score": _score(),
+        "overall_assessment": {"type": "string"},
+        "improvement_suggestions": _string_list(),
+    },
+    "required": ["overall_scores", "composite_score"],
+}
+
+BLOOMS_LEVELS = ["Remember", "Understand", "Apply", "Analyze", "Evaluate", "Create"]
+
+BLOOMS_JUDGEMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "individual_evaluations": {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "objective_number": {"type": "integer"},
+                    "objective_text": {"type": "string"},
+                    "identified_level": {"type": "string"},
+                    "binary_checklist": _checklist(),
+                    "hard_constraints_applied": {
+                        "type": "object",
+                        "properties": {"weak_verb_detected": {"type": "boolean"}, "verb_task_mismatch": {"type": "boolean"}},
+                    },
+                    "scores": _scored_criteria(["verb_accuracy", "cognitive_demand", "level_classification"]),
+                    "granular_responses": _granular_responses(),
+                    "composite_score": _score(),
+                    "improvement_suggestions": _string_list(),
+                },
+                "required": ["objective_number", "identified_level", "scores", "composite_score"],
+            },
+        },
+        "set_evaluation": {
+            "type": "object",
+            "properties": {
+                "progression_score": _scored_criterion(),
+                "level_distribution": {"type": "object",
+                                       "properties": {level: {"type": "integer", "minimum": 0} for level in BLOOMS_LEVELS}},
+                "overall_assessment": {"type": "string"},
+                "set_level_composite_score": _score(),
+            },
+            "required": ["progression_score", "level_distribution"],
+        },
+        "overall_composite_score": _score(),
+        "recommendations": _string_list(),
+    },
+    "required": ["individual_evaluations", "set_evaluation", "overall_composite_score"],
+}
+
+
+def batched_judgement_schema(per_lo_schema: Dict) -> Dict:
+    """{"evaluations": [...]} wrapper used by batched ABCD/SMART requests.
+
+    Malformed entries are dropped rather than failing the batch; the caller
+    re-asks those LOs one at a time.
+    """
+    entry = copy.deepcopy(per_lo_schema)
+    entry["properties"] = {"objective_number": {"type": "integer", "minimum": 1}, **entry["properties"]}
+    entry["required"] = ["objective_number", *entry["required"]]
+    return {
+        "type": "object",
+        "properties": {"evaluations": {"type": "array", "items": entry, "x-drop-invalid-items": True}},
+        "required": ["evaluations"],
+    }
+
+
+# ==================== VALIDATOR COMPILER ====================
+def _compile(schema: Dict) -> Validator:
+    """Turn a schema into a closure `check(value, path) -> value` (possibly coerced)."""
+    checks: List[Validator] = []
+    kind = schema.get("type")
+
+    if kind == "object":
+        properties = {name: _compile(sub) for name, sub in schema.get("properties", {}).items()}
+        required = schema.get("required", [])
+
+        def check_object(value, path):
+            if not isinstance(value, dict):
+                raise SchemaValidationError(path, f"expected object, got {type(value).__name__}")
+            for name in required:
+                if name not in value:
+                    raise SchemaValidationError(path, f"missing required key '{name}'")
+            for name, validator in properties.items():
+                if name in value:
+                    value[name] = validator(value[name], f"{path}.{name}")
+            return value
+        checks.append(check_object)
+
+    elif kind == "array":
+        item_validator = _compile(schema["items"]) if "items" in schema else None
+        drop_invalid = schema.get("x-drop-invalid-items", False)
+        min_items, max_items = schema.get("minItems"), schema.get("maxItems")
+
+        def check_array(value, path):
+            if not isinstance(value, list):
+                raise SchemaValidationError(path, f"expected array, got {type(value).__name__}")
+            if item_validator is not None:
+                kept = []
+                for i, item in enumerate(value):
+                    try:
+                        kept.append(item_validator(item, f"{path}[{i}]"))
+                    except SchemaValidationError:
+                        if not drop_invalid:
+                            raise
+                value[:] = kept
+            if min_items is not None and len(value) < min_items:
+                raise SchemaValidationError(path, f"expected at least {min_items} items, got {len(value)}")
+            if max_items is not None and len(value) > max_items:
+                raise SchemaValidationError(path, f"expected at most {max_items} items, got {len(value)}")
+            return value
+        checks.append(check_array)
+
+    elif kind == "string":
+        min_length = schema.get("minLength", 0)
+
+        def check_string(value, path):
+            if not isinstance(value, str):
+                raise SchemaValidationError(path, f"expected string, got {type(value).__name__}")
+            if len(value.strip()) < min_length:
+                raise SchemaValidationError(path, "string too short")
+            return value
+        checks.append(check_string)
+
+    elif kind in ("integer", "number"):
+        def check_number(value, path):
+            if isinstance(value, bool):
+                raise SchemaValidationError(path, f"expected {kind}, got boolean")
+            if isinstance(value, str):
+                try:
+                    value = float(value.strip())
+                except ValueError:
+                    raise SchemaValidationError(path, f"expected {kind}, got '{value[:40]}'")
+            if not isinstance(value, (int, float)):
+                raise SchemaValidationError(path, f"expected {kind}, got {type(value).__name__}")
+            if kind == "integer":
+                if value != int(value):
+                    raise SchemaValidationError(path, f"expected integer, got {value}")
+                value = int(value)
+            elif isinstance(value, float) and value.is_integer():
+                value = int(value)
+            return value
+        checks.append(check_number)
+
+        minimum, maximum = schema.get("minimum"), schema.get("maximum")
+        if minimum is not None or maximum is not None:
+            def check_range(value, path):
+                if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+                    raise SchemaValidationError(path, f"{value} outside [{minimum}, {maximum}]")
+                return value
+            checks.append(check_range)
+
+    elif kind == "boolean":
+        def check_boolean(value, path):
+            if isinstance(value, str) and value.lower() in ("true", "false"):
+                return value.lower() == "true"
+            if not isinstance(value, bool):
+                raise SchemaValidationError(path, f"expected boolean, got {type(value).__name__}")
+            return value
+        checks.append(check_boolean)
+
+    if "enum" in schema:
+        canonical = {str(option).lower(): option for option in schema["enum"]}
+
+        def check_enum(value, path):
+            match = canonical.get(str(value).strip().lower())
+            if match is None:
+                raise SchemaValidationError(path, f"'{value}' not one of {list(canonical.values())}")
+            return match
+        checks.append(check_enum)
+
+    if len(checks) == 1:
+        return checks[0]
+
+    def check_all(value, path):
+        for check in checks:
+            value = check(value, path)
+        return value
+    return check_all
+
+
+class CompiledSchema:
+    """A response schema with its validator compiled once."""
+
+    def __init__(self, schema: Dict, name: str):
+        self.schema = schema
+        self.name = name
+        self._validator = _compile(schema)
+
+    @property
+    def expected_type(self) -> Optional[type]:
+        """Top-level Python type (dict / list), e.g. for early stream validation."""
+        return {"object": dict, "array": list}.get(self.schema.get("type"))
+
+    def validate(self, value: Any) -> Any:
+        """Return `value` (coerced in place where possible) or raise SchemaValidationError."""
+        return self._validator(value, "")
+
+    def provider_schema(self) -> Dict:
+        """The schema without local "x-" extension keys."""
+        return strip_extensions(self.schema)
+
+
+_compiled: Dict[int, CompiledSchema] = {}
+
+
+def compiled(schema: Dict, name: str = "response") -> CompiledSchema:
+    """Compiled validator for `schema`, built on first use and reused afterwards."""
+    key = id(schema)
+    if key not in _compiled or _compiled[key].schema is not schema:
+        _compiled[key] = CompiledSchema(schema, name)
+    return _compiled[key]
+
+
+# ==================== PROVIDER CONSTRAINTS ====================
+def strip_extensions(schema: Any) -> Any:
+    """Copy of a schema without local "x-" keys, as sent to providers."""
+    if isinstance(schema, dict):
+        return {key: strip_extensions(value) for key, value in schema.items() if not key.startswith("x-")}
+    if isinstance(schema, list):
+        return [strip_extensions(value) for value in schema]
+    return schema
+
+
+# Keys Gemini's responseSchema (an OpenAPI subset) accepts
+_GEMINI_SCHEMA_KEYS = {"type", "format", "description", "nullable", "enum", "properties", "required",
+                       "items", "minItems", "maxItems", "minimum", "maximum"}
+
+
+def gemini_response_schema(schema: Dict) -> Dict:
+    """Translate a response schema into Gemini's `responseSchema` form."""
+    converted = {}
+    for key, value in schema.items():
+        if key not in _GEMINI_SCHEMA_KEYS:
+            continue
+        if key == "type":
+            converted[key] = value.upper()
+        elif key == "properties":
+            converted[key] = {name: gemini_response_schema(sub) for name, sub in value.items()}
+        elif key == "items":
+            converted[key] = gemini_response_schema(value)
+        else:
+            converted[key] = value
+    return converted
+
+
+def openai_response_format(schema: Dict, name: str = "response", style: Optional[str] = "json_schema") -> Dict:
+    """
+    `response_format` for OpenAI-compatible chat APIs.
+
+    style "json_schema": OpenAI / HF router form; "together": Together's
+    {"type": "json_object", "schema": ...}; None: plain JSON mode for APIs
+    without schema-constrained decoding (validated locally only).
+    """
+    if style == "json_schema":
+        return {"type": "json_schema", "json_schema": {"name": name, "schema": strip_extensions(schema)}}
+    if style == "together":
+        return {"type": "json_object", "schema": strip_extensions(schema)}
+    return {"type": "json_object"}
+
+
+def schema_from_response_format(response_format: Optional[Dict]) -> Optional[Dict]:
+    """The JSON schema carried by an OpenAI-style or Together-style response_format, if any."""
+    if not response_format:
+        return None
+    if response_format.get("type") == "json_schema":
+        return response_format.get("json_schema", {}).get("schema")
+    return response_format.get("schema")
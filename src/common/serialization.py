@@ -0,0 +1,188 @@
+"""
+Pluggable serialisers for pipeline outputs.
+
+Every output goes through one of these formats:
+
+- pretty:  stdlib json, indent=2, UTF-8 kept as-is. Readable and diffable;
+           the default, and what `export` produces for humans.
+- pretty_ascii: pretty with non-ASCII characters escaped; what
+           atomic_write_json(..., ensure_ascii=True) writes for the outputs
+           that have always been ASCII (taxonomies, concept graph, stats).
+- compact: one line, no indentation, encoded with orjson when installed
+           (stdlib json otherwise). Much faster to write, and a little
+           smaller (indentation is most of the difference).
+- zstd:    compact JSON compressed with zstandard (optional dependency,
+           `pip install zstandard`), written to `<path>.zst`.
+
+Every format reads back identically: NaN/Infinity (e.g. blank CSV cells) are
+written as null, as orjson does, and integers beyond 64 bits are decoded
+with stdlib json, which keeps them exact.
+
+OUTPUT_FORMAT picks the format for every output; scripts that write
+collection-scale files also take --format. read_output() reads any of them
+(and reads `<path>.zst` when `path` itself is missing or older), so
+consumers don't care which format a producer used. Further formats can be
+added with register_format().
+
+`python -m common.serialization export IN OUT [--format pretty]` converts a
+file between formats.
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+from typing import Any, Callable, Dict, NamedTuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# ==================== CONFIGURATION ====================
+DEFAULT_FORMAT = os.getenv("OUTPUT_FORMAT", "pretty")
+ZSTD_LEVEL = int(os.getenv("OUTPUT_ZSTD_LEVEL", "3"))  # 1 (fastest) .. 19 (smallest); 3 is zstd's default
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# 19+ digit runs may be integers orjson can't hold in 64 bits (it would return a float)
+_BIG_INT = re.compile(rb"\d{19,}")
+
+
+class Serializer(NamedTuple):
+    """How one output format turns data into bytes, and the suffix it adds to the output path."""
+    name: str
+    dumps: Callable[[Any], bytes]
+    suffix: str = ""
+
+
+# ==================== ENCODERS ====================
+def _finite(data: Any) -> Any:
+    """Copy of `data` with NaN/Infinity replaced by None (what orjson writes as null)."""
+    if isinstance(data, float):
+        return data if math.isfinite(data) else None
+    if isinstance(data, dict):
+        return {k: _finite(v) for k, v in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [_finite(v) for v in data]
+    return data
+
+
+def _stdlib_dumps(data: Any, ensure_ascii: bool = False, **kwargs) -> bytes:
+    try:
+        return json.dumps(data, ensure_ascii=ensure_ascii, allow_nan=False, **kwargs).encode("utf-8")
+    except ValueError:
+        # NaN/Infinity somewhere: not valid JSON, and orjson couldn't read it back
+        return json.dumps(_finite(data), ensure_ascii=ensure_ascii, allow_nan=False, **kwargs).encode("utf-8")
+
+
+def _pretty(data: Any) -> bytes:
+    return _stdlib_dumps(data, indent=2)
+
+
+def _pretty_ascii(data: Any) -> bytes:
+    """pretty with non-ASCII characters escaped, as json.dump(..., ensure_ascii=True) wrote it."""
+    return _stdlib_dumps(data, ensure_ascii=True, indent=2)
+
+
+def _compact(data: Any) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # e.g. integers beyond 64 bits; stdlib json handles them
+    return _stdlib_dumps(data, separators=(",", ":"))
+
+
+def _zstd(data: Any) -> bytes:
+    if zstandard is None:
+        raise ImportError("OUTPUT_FORMAT=zstd needs the zstandard package (pip install zstandard)")
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(_compact(data))
+
+
+FORMATS: Dict[str, Serializer] = {}
+
+
+def register_format(serializer: Serializer):
+    """Make a format available to OUTPUT_FORMAT / --format."""
+    FORMATS[serializer.name] = serializer
+
+
+register_format(Serializer("pretty", _pretty))
+register_format(Serializer("pretty_ascii", _pretty_ascii))
+register_format(Serializer("compact", _compact))
+register_format(Serializer("zstd", _zstd, ".zst"))
+
+
+def get_format(fmt: str = None) -> Serializer:
+    """Serializer for `fmt` (default: OUTPUT_FORMAT)."""
+    name = fmt or DEFAULT_FORMAT
+    if name not in FORMATS:
+        raise ValueError(f"Unknown output format '{name}' (expected one of {sorted(FORMATS)})")
+    return FORMATS[name]
+
+
+def dumps(data: Any, fmt: str = None) -> bytes:
+    return get_format(fmt).dumps(data)
+
+
+def output_path(path: str, fmt: str = None) -> str:
+    """Where an output for `path` is written in `fmt` (zstd appends .zst)."""
+    suffix = get_format(fmt).suffix
+    return path if not suffix or str(path).endswith(suffix) else f"{path}{suffix}"
+
+
+# ==================== DECODING ====================
+def loads(payload: bytes) -> Any:
+    """Decode any format's bytes (zstd is recognised by its magic number)."""
+    if payload[:4] == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ImportError("Reading a .zst output needs the zstandard package (pip install zstandard)")
+        payload = zstandard.ZstdDecompressor().decompressobj().decompress(payload)
+    if orjson is not None and not _BIG_INT.search(payload):
+        try:
+            return orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            pass  # e.g. NaN in a file written by plain json.dump; stdlib json accepts it
+    return json.loads(payload)
+
+
+def output_exists(path: str) -> bool:
+    """Whether an output for `path` exists in any format."""
+    return os.path.exists(str(path)) or os.path.exists(f"{path}.zst")
+
+
+def read_output(path: str) -> Any:
+    """Load an output written in any format; reads `<path>.zst` when it is the newer (or only) file."""
+    path = str(path)
+    zst = path + ".zst"
+    # Both exist after a run switched OUTPUT_FORMAT: the other one is stale
+    if os.path.exists(zst) and (not os.path.exists(path) or os.path.getmtime(zst) > os.path.getmtime(path)):
+        path = zst
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+# ==================== CLI ====================
+def main():
+    parser = argparse.ArgumentParser(description="Convert a pipeline output between formats")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Re-encode an output (e.g. compact -> pretty for reading)")
+    export.add_argument("input")
+    export.add_argument("output")
+    export.add_argument("--format", default="pretty", choices=sorted(FORMATS))
+    args = parser.parse_args()
+
+    # Imported here: checkpoint imports this module
+    from common.checkpoint import atomic_write_json
+    written = atomic_write_json(args.output, read_output(args.input), fmt=args.format)
+    print(f"✓ {args.input} -> {written} ({args.format}, {os.path.getsize(written):,} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Single-flight coalescing of identical in-flight LLM requests.
+
+When several threads or processes miss the response cache for the same key at
+the same time (e.g. the ABCD, SMART and Bloom slide scripts run side by side
+and summarise the same decks), only one of them calls the provider:
+
+- in-process: later callers wait for the first caller's call and receive its
+  result (or its exception);
+- cross-process: the caller that makes the call holds a lease row for the key
+  in the response cache's SQLite file. Other processes wait until the reply
+  appears in the cache and decode it from there; if the holder fails without
+  storing anything, its lease is released (or expires, or its process is found
+  dead) and the next waiter makes the call instead.
+
+Nothing is coalesced while the cache is bypassed: bypass runs want independent
+samples of the same prompt.
+"""
+
+import copy
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, TypeVar
+
+from common.llm_cache import ResponseCache, get_response_cache
+
+# ==================== CONFIGURATION ====================
+LEASE_TTL = float(os.getenv("LLM_SINGLE_FLIGHT_TTL", "600"))     # Seconds before another process may take over a key
+POLL_INTERVAL = float(os.getenv("LLM_SINGLE_FLIGHT_POLL", "0.5"))  # Seconds between cache checks while waiting
+
+T = TypeVar("T")
+
+_HOST = socket.gethostname()
+
+
+class SingleFlight:
+    """Coalesces calls per key within this process and, via leases, across processes."""
+
+    def __init__(self, cache: ResponseCache, lease_ttl: float = LEASE_TTL, poll_interval: float = POLL_INTERVAL):
+        self.cache = cache
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.owner = f"{_HOST}:{os.getpid()}"
+        self.stats = {"calls": 0, "coalesced_in_process": 0, "coalesced_cross_process": 0}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(cache.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS in_flight (
+                key TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+        self._db_lock = threading.Lock()
+
+    # ---------- leases ----------
+    def _holder_alive(self, owner: str) -> bool:
+        host, _, pid = owner.rpartition(":")
+        if host != _HOST:
+            return True  # Can't check another machine; rely on the TTL
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except (PermissionError, ValueError):
+            pass
+        return True
+
+    def _try_acquire(self, key: str) -> bool:
+        """Take the lease for `key` if it is free, expired or held by a dead process."""
+        now = time.time()
+        with self._db_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT owner, expires FROM in_flight WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[0] != self.owner and row[1] > now and self._holder_alive(row[0]):
+                    return False
+                self._conn.execute("INSERT OR REPLACE INTO in_flight (key, owner, expires) VALUES (?, ?, ?)",
+                                   (key, self.owner, now + self.lease_ttl))
+                return True
+            finally:
+                self._conn.commit()
+
+    def _release(self, key: str):
+        with self._db_lock:
+            self._conn.execute("DELETE FROM in_flight WHERE key = ? AND owner = ?", (key, self.owner))
+            self._conn.commit()
+
+    # ---------- coalescing ----------
+    def _call_or_wait(self, key: str, fn: Callable[[], T], decode: Callable[[str], T]) -> T:
+        """Make the call for `key`, or wait for the process that is already making it."""
+        waited = False
+        while not self._try_acquire(key):
+            if not waited:
+                print("   ⏳ Identical request in flight in another process; waiting for its reply")
+                waited = True
+            time.sleep(self.poll_interval)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.stats["coalesced_cross_process"] += 1
+                return decode(cached)
+        try:
+            if waited:
+                # The previous holder may have stored the reply just before releasing
+                cached = self.cache.get(key)
+                if cached is not None:
+                    self.stats["coalesced_cross_process"] += 1
+                    return decode(cached)
+            self.stats["calls"] += 1
+            return fn()
+        finally:
+            self._release(key)
+
+    def do(self, key: str, fn: Callable[[], T], decode: Callable[[str], T]) -> T:
+        """
+        Return fn() for `key`, sharing one call among all concurrent callers.
+        `fn` must store its reply in the response cache under `key`; `decode`
+        turns that cached text into the result for callers in other processes.
+        """
+        if self.cache.bypass:
+            return fn()
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+
+        if not leader:
+            self.stats["coalesced_in_process"] += 1
+            # Each caller gets its own copy, so one caller's edits don't leak into another's result
+            return copy.deepcopy(future.result())
+
+        try:
+            result = self._call_or_wait(key, fn, decode)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def report(self) -> Dict:
+        return dict(self.stats)
+
+
+_single_flight: Optional[SingleFlight] = None
+_registry_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Process-wide single-flight layer over the process-wide response cache."""
+    global _single_flight
+    with _registry_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight(get_response_cache())
+        return _single_flight
+
+
+def coalesce(key: str, fn: Callable[[], T], decode: Callable[[str], T]) -> T:
+    """Shortcut for get_single_flight().do(key, fn, decode)."""
+    return get_single_flight().do(key, fn, decode)
+
+
+def single_flight_report() -> Dict:
+    """Upstream calls made vs. requests served by another caller's call, e.g. for run metadata."""
+    return get_single_flight().report() if _single_flight is not None else {}
@@ -0,0 +1,213 @@
+"""
+Output-length histograms per prompt type, and max_tokens budgets tuned from them.
+
+A hard-coded max_tokens is either too large (the provider reserves and
+schedules for the whole budget, which adds latency and queueing) or too small
+(replies get cut off and have to be repaired or re-requested). Every call site
+records how many tokens each reply actually used under its prompt type
+("concept_batch", "deck_summary", ...). Once a type has enough samples, its
+budget is a high percentile of those lengths plus a margin, rounded up to a
+coarse step so response-cache keys stay stable between runs. Until then the
+call site's old hard-coded value is used.
+
+A reply that still hits its budget is recorded at the budget (its real length
+is at least that), which pushes the percentile up over time. escalate() gives
+the larger budget to retry it with right away: twice the budget, up to a
+ceiling of twice the call site's default (and at most LLM_MAX_TOKENS_CEILING).
+
+Histograms live in a small SQLite file shared by all scripts and runs;
+`python -m common.token_budget` prints them with the budgets they imply.
+"""
+
+import argparse
+import math
+import os
+import sqlite3
+import threading
+from typing import Dict, Optional
+
+# ==================== CONFIGURATION ====================
+DEFAULT_STATS_DB = os.getenv(
+    "LLM_TOKEN_STATS_DB",
+    os.path.join(os.path.expanduser("~"), ".cache", "dynamic-chunking", "output_lengths.sqlite3")
+)
+AUTOTUNE = os.getenv("LLM_MAX_TOKENS_AUTOTUNE", "1") != "0"          # 0 = always use the call site's default
+PERCENTILE = float(os.getenv("LLM_MAX_TOKENS_PERCENTILE", "0.95"))  # Share of replies the budget must fit
+MARGIN = float(os.getenv("LLM_MAX_TOKENS_MARGIN", "0.25"))          # Headroom over that percentile
+MIN_SAMPLES = int(os.getenv("LLM_MAX_TOKENS_MIN_SAMPLES", "20"))     # Replies seen before tuning a prompt type
+MAX_CEILING = int(os.getenv("LLM_MAX_TOKENS_CEILING", "8192"))       # No budget ever exceeds this
+
+BIN_TOKENS = 32         # Histogram bin width
+BUDGET_STEP = 256       # Budgets are rounded up to a multiple of this
+MIN_BUDGET = 256
+ESCALATION_FACTOR = 2   # Budget multiplier for re-requesting a truncated reply
+
+
+# ==================== TOKEN BUDGET ====================
+class TokenBudget:
+    """Persistent output-length histograms and the max_tokens budgets derived from them."""
+
+    def __init__(self, db_path: str = DEFAULT_STATS_DB):
+        self.db_path = db_path
+        self.stats = {"tuned": 0, "default": 0, "truncated": 0, "escalated": 0}
+        self._budgets: Dict[str, int] = {}
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS output_lengths (
+                prompt_type TEXT NOT NULL,
+                bin INTEGER NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                truncated INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (prompt_type, bin)
+            )
+        """)
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    # ---------- observations ----------
+    def observe(self, prompt_type: str, output_tokens: Optional[int], max_tokens: int,
+                truncated: Optional[bool] = None) -> bool:
+        """
+        Record one reply's output length. `truncated` defaults to whether the
+        reply used its whole budget; truncated replies are recorded at the
+        budget. Returns whether the reply was truncated.
+        """
+        if output_tokens is None:
+            return bool(truncated)
+        if truncated is None:
+            truncated = output_tokens >= max_tokens
+        length = max(output_tokens, max_tokens) if truncated else output_tokens
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO output_lengths (prompt_type, bin, count, truncated) VALUES (?, ?, 1, ?)
+                ON CONFLICT (prompt_type, bin) DO UPDATE SET count = count + 1, truncated = truncated + excluded.truncated
+            """, (prompt_type, length // BIN_TOKENS, int(truncated)))
+            self._conn.commit()
+        if truncated:
+            self.stats["truncated"] += 1
+        return truncated
+
+    def histogram(self, prompt_type: str) -> Dict[int, int]:
+        """{bin start (tokens): replies} for a prompt type."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT bin, count FROM output_lengths WHERE prompt_type = ? ORDER BY bin", (prompt_type,)
+            ).fetchall()
+        return {b * BIN_TOKENS: count for b, count in rows}
+
+    def percentile(self, prompt_type: str, q: float = PERCENTILE) -> Optional[int]:
+        """Output length (upper edge of its bin) that `q` of replies fit in, or None below MIN_SAMPLES."""
+        histogram = self.histogram(prompt_type)
+        total = sum(histogram.values())
+        if total < MIN_SAMPLES:
+            return None
+        seen = 0
+        for start, count in histogram.items():
+            seen += count
+            if seen >= q * total:
+                return start + BIN_TOKENS
+        return max(histogram) + BIN_TOKENS
+
+    # ---------- budgets ----------
+    @staticmethod
+    def ceiling(default: int) -> int:
+        """Largest budget for a call site whose hard-coded max_tokens was `default`."""
+        return max(min(default * ESCALATION_FACTOR, MAX_CEILING), default)
+
+    @staticmethod
+    def _round_up(observed: int) -> int:
+        return max(math.ceil(observed * (1 + MARGIN) / BUDGET_STEP) * BUDGET_STEP, MIN_BUDGET)
+
+    def max_tokens(self, prompt_type: str, default: int) -> int:
+        """max_tokens for the next `prompt_type` call: tuned from its histogram, else `default`."""
+        observed = self.percentile(prompt_type) if AUTOTUNE else None
+        if observed is None:
+            self.stats["default"] += 1
+            return default
+        budget = min(self._round_up(observed), self.ceiling(default))
+        self.stats["tuned"] += 1
+        self._budgets[prompt_type] = budget
+        return budget
+
+    def escalate(self, max_tokens: int, default: int) -> Optional[int]:
+        """Larger budget to re-request a reply truncated at `max_tokens`, or None at the ceiling."""
+        larger = min(max_tokens * ESCALATION_FACTOR, self.ceiling(default))
+        if larger <= max_tokens:
+            return None
+        self.stats["escalated"] += 1
+        return larger
+
+    def report(self) -> Dict:
+        """Calls on tuned vs. default budgets, truncations and escalations, e.g. for run metadata."""
+        return {**self.stats, "budgets": dict(self._budgets)}
+
+    def summary(self) -> Dict[str, Dict]:
+        """Per prompt type: replies, truncations, percentile and the budget it implies."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT prompt_type, SUM(count), SUM(truncated) FROM output_lengths GROUP BY prompt_type ORDER BY prompt_type"
+            ).fetchall()
+        summary = {}
+        for prompt_type, count, truncated in rows:
+            observed = self.percentile(prompt_type)
+            summary[prompt_type] = {
+                "replies": count,
+                "truncated": truncated,
+                f"p{round(PERCENTILE * 100)}": observed,
+                "budget": self._round_up(observed) if observed else None,
+            }
+        return summary
+
+    def reset(self, prompt_type: str):
+        """Forget a prompt type's histogram (e.g. after its prompt changed substantially)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM output_lengths WHERE prompt_type = ?", (prompt_type,))
+            self._conn.commit()
+
+
+_token_budget: Optional[TokenBudget] = None
+_registry_lock = threading.Lock()
+
+
+def get_token_budget() -> TokenBudget:
+    """Process-wide token budget backed by DEFAULT_STATS_DB."""
+    global _token_budget
+    with _registry_lock:
+        if _token_budget is None:
+            _token_budget = TokenBudget()
+        return _token_budget
+
+
+def token_budget_report() -> Dict:
+    """This run's budget usage, e.g. for run metadata."""
+    return _token_budget.report() if _token_budget is not None else {}
+
+
+# ==================== CLI ====================
+def main():
+    parser = argparse.ArgumentParser(description="Show output-length histograms and tuned max_tokens budgets")
+    parser.add_argument("--reset", metavar="PROMPT_TYPE", help="Forget one prompt type's histogram")
+    args = parser.parse_args()
+
+    budget = TokenBudget()
+    if args.reset:
+        budget.reset(args.reset)
+        print(f"✓ Reset output-length histogram for '{args.reset}'")
+        return
+
+    summary = budget.summary()
+    if not summary:
+        print("No output lengths recorded yet.")
+    for prompt_type, row in summary.items():
+        budget_text = f"{row['budget']} tokens" if row["budget"] else f"default (< {MIN_SAMPLES} replies)"
+        print(f"\n📊 {prompt_type}: {row['replies']} replies, {row['truncated']} truncated -> budget {budget_text}")
+        histogram = budget.histogram(prompt_type)
+        peak = max(histogram.values())
+        for start, count in histogram.items():
+            print(f"   {start:>6}-{start + BIN_TOKENS - 1:<6} {'█' * max(1, round(count / peak * 40))} {count}")
+
+
+if __name__ == "__main__":
+    main()
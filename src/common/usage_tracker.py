@@ -0,0 +1,297 @@
+"""
+Per-call token, latency and cost accounting for LLM calls.
+
+Every API wrapper records one entry per upstream call (cache hits cost nothing
+and are not recorded) with provider, model, stage, course, prompt / completion /
+cached tokens and latency. Rollups by stage, course and provider/model are
+written next to a script's output as `<output>.usage.json`; each script run is
+kept as its own entry so runs can be compared.
+
+Writing a report is a locked read-modify-write (a thread lock plus a file lock
+on `<report>.lock`), and the new file is renamed into place, so concurrent
+writers in one or several processes never lose each other's runs.
+
+SpendEstimate is the pre-flight side: it predicts a run's token spend and cost
+from prompt sizes alone, before anything is sent.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: only the in-process lock applies
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.checkpoint import atomic_write_bytes
+
+# ==================== CONFIGURATION ====================
+# USD per 1M tokens: (input, output, cached input). Free tiers / flat-rate plans are 0.
+# List prices at the time of writing; override with LLM_PRICES_FILE
+# ({"provider/model": [input, output, cached], ...}).
+DEFAULT_PRICES_PER_MTOK = {
+    "together/meta-llama/Meta-Llama-3-70B-Instruct-Turbo": (0.88, 0.88, 0.88),
+    "groq/llama-3.3-70b-versatile": (0.59, 0.79, 0.295),
+    "gemini/gemini-2.0-flash-exp": (0.10, 0.40, 0.025),
+    "gemini/gemini-2.5-flash": (0.30, 2.50, 0.075),
+    "gemini/models/gemma-3-27b-it": (0.0, 0.0, 0.0),
+    "ollama/gpt-oss:20b-cloud": (0.0, 0.0, 0.0),
+    "ollama/gpt-oss:120b-cloud": (0.0, 0.0, 0.0),
+}
+
+# Rough characters-per-token ratio for estimates and providers that report no usage
+CHARS_PER_TOKEN = 4
+
+_TOKEN_FIELDS = ("prompt_tokens", "completion_tokens", "cached_tokens")
+
+
+def load_prices() -> Dict[str, tuple]:
+    prices = dict(DEFAULT_PRICES_PER_MTOK)
+    if os.getenv("LLM_PRICES_FILE"):
+        with open(os.getenv("LLM_PRICES_FILE"), "r", encoding="utf-8") as f:
+            prices.update({key: tuple(value) for key, value in json.load(f).items()})
+    return prices
+
+
+PRICES_PER_MTOK = load_prices()
+
+
+# Serialises report writes within a process (threads, and trackers sharing a file)
+_WRITE_LOCK = threading.Lock()
+
+
+@contextmanager
+def _report_lock(path: str):
+    """Hold the in-process lock and an exclusive lock on `<path>.lock` for a report's read-modify-write."""
+    with _WRITE_LOCK:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a prompt (no tokenizer needed)."""
+    return max(1, len(text or "") // CHARS_PER_TOKEN)
+
+
+def call_cost(provider: str, model: str, prompt_tokens: int, completion_tokens: int,
+              cached_tokens: int = 0) -> Optional[float]:
+    """USD cost of one call, or None if the model has no known price."""
+    price = PRICES_PER_MTOK.get(f"{provider}/{model}")
+    if price is None:
+        return None
+    input_price, output_price, cached_price = price
+    uncached = max((prompt_tokens or 0) - (cached_tokens or 0), 0)
+    return (uncached * input_price + (cached_tokens or 0) * cached_price
+            + (completion_tokens or 0) * output_price) / 1_000_000
+
+
+def usage_path_for(output_file: str) -> str:
+    """Usage report path next to an output file: foo.json -> foo.usage.json"""
+    return os.path.splitext(output_file)[0] + ".usage.json"
+
+
+def genai_token_counts(response) -> Dict[str, Optional[int]]:
+    """prompt / completion / cached token counts from a google-generativeai response."""
+    metadata = getattr(response, "usage_metadata", None)
+    return {
+        "prompt_tokens": getattr(metadata, "prompt_token_count", None),
+        "completion_tokens": getattr(metadata, "candidates_token_count", None),
+        "cached_tokens": getattr(metadata, "cached_content_token_count", None),
+    }
+
+
+def _totals(calls: List[Dict]) -> Dict:
+    totals = {"api_calls": len(calls), **{field: 0 for field in _TOKEN_FIELDS}, "latency_s": 0.0,
+              "cost_usd": 0.0, "unpriced_calls": 0}
+    for call in calls:
+        for field in _TOKEN_FIELDS:
+            totals[field] += call.get(field) or 0
+        totals["latency_s"] += call.get("latency_s") or 0
+        if call.get("cost_usd") is None:
+            totals["unpriced_calls"] += 1
+        else:
+            totals["cost_usd"] += call["cost_usd"]
+    totals["latency_s"] = round(totals["latency_s"], 3)
+    totals["cost_usd"] = round(totals["cost_usd"], 6)
+    totals["cached_token_ratio"] = totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0
+    return totals
+
+
+def _group(calls: List[Dict], key) -> Dict[str, Dict]:
+    groups: Dict[str, List[Dict]] = {}
+    for call in calls:
+        groups.setdefault(key(call) or "unspecified", []).append(call)
+    return {name: _totals(group) for name, group in groups.items()}
+
+
+# ==================== USAGE TRACKER ====================
+class UsageTracker:
+    """Collects per-call usage records for one script run."""
+
+    def __init__(self, run_id: Optional[str] = None):
+        self.run_id = run_id or time.strftime("%Y%m%d-%H%M%S")
+        self.started = time.time()
+        self.calls: List[Dict] = []
+        self.current_stage: Optional[str] = None
+        self.current_course: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def set_context(self, stage: Optional[str] = None, course: Optional[str] = None):
+        """Default stage / course attached to calls recorded from now on."""
+        if stage is not None:
+            self.current_stage = stage
+        if course is not None:
+            self.current_course = course
+
+    @contextmanager
+    def stage(self, stage: str, course: Optional[str] = None):
+        """Temporarily attribute calls to `stage` (and `course`)."""
+        previous = (self.current_stage, self.current_course)
+        self.set_context(stage, course)
+        try:
+            yield
+        finally:
+            self.current_stage, self.current_course = previous
+
+    def record(self, provider: str, model: str, prompt_tokens: Optional[int] = None,
+               completion_tokens: Optional[int] = None, cached_tokens: Optional[int] = None,
+               latency_s: Optional[float] = None, stage: Optional[str] = None,
+               course: Optional[str] = None, **extra) -> Dict:
+        """Record one upstream call; returns the stored entry."""
+        entry = {
+            "time": round(time.time(), 3),
+            "provider": provider,
+            "model": model,
+            "stage": stage or self.current_stage,
+            "course": course or self.current_course,
+            "prompt_tokens": prompt_tokens or 0,
+            "completion_tokens": completion_tokens or 0,
+            "cached_tokens": cached_tokens or 0,
+            "latency_s": round(latency_s, 3) if latency_s is not None else None,
+            "cost_usd": call_cost(provider, model, prompt_tokens, completion_tokens, cached_tokens),
+            **extra,
+        }
+        with self._lock:
+            self.calls.append(entry)
+        return entry
+
+    def rollup(self, calls: Optional[List[Dict]] = None) -> Dict:
+        """Totals plus breakdowns by stage, course and provider/model."""
+        calls = self.calls if calls is None else calls
+        return {
+            "totals": _totals(calls),
+            "by_stage": _group(calls, lambda c: c.get("stage")),
+            "by_course": _group(calls, lambda c: c.get("course")),
+            "by_model": _group(calls, lambda c: f"{c['provider']}/{c['model']}"),
+        }
+
+    def write(self, path: str) -> str:
+        """Write (or update) this run's entry in a usage report file; earlier runs are kept."""
+        with _report_lock(path):
+            runs = []
+            if os.path.exists(path):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        runs = json.load(f).get("runs", [])
+                except (json.JSONDecodeError, AttributeError) as e:
+                    # Keep the unreadable report for inspection instead of silently dropping its runs
+                    os.replace(path, path + ".corrupt")
+                    print(f"⚠️ Usage report {path} was unreadable ({e}); moved it to {path}.corrupt")
+                    runs = []
+            runs = [run for run in runs if run.get("run_id") != self.run_id]
+            with self._lock:
+                calls = list(self.calls)
+            runs.append({
+                "run_id": self.run_id,
+                "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+                "updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+                **self.rollup(calls),
+                "calls": calls,
+            })
+            payload = json.dumps({"runs": runs}, indent=2, ensure_ascii=False).encode("utf-8")
+            atomic_write_bytes(path, payload)
+        return path
+
+    def print_summary(self):
+        totals = _totals(self.calls)
+        print(f"\n💰 Token usage: {totals['api_calls']} calls, "
+              f"{totals['prompt_tokens']:,} prompt ({totals['cached_token_ratio']:.0%} cached), "
+              f"{totals['completion_tokens']:,} completion, ~${totals['cost_usd']:.4f}")
+        for stage, stage_totals in _group(self.calls, lambda c: c.get("stage")).items():
+            print(f"   {stage:<28} {stage_totals['api_calls']:>5} calls  "
+                  f"{stage_totals['prompt_tokens']:>10,} in  {stage_totals['completion_tokens']:>9,} out  "
+                  f"${stage_totals['cost_usd']:.4f}")
+
+
+_tracker: Optional[UsageTracker] = None
+
+
+def get_usage_tracker() -> UsageTracker:
+    """Process-wide tracker, so every wrapper in a run records into one place."""
+    global _tracker
+    if _tracker is None:
+        _tracker = UsageTracker()
+    return _tracker
+
+
+# ==================== PRE-FLIGHT ESTIMATE ====================
+class SpendEstimate:
+    """Predicted token spend of a run, built from the prompts it would send."""
+
+    def __init__(self):
+        self.items: List[Dict] = []
+
+    def add(self, stage: str, provider: str, model: str, prompt: str, expected_output_tokens: int,
+            system: Optional[str] = None, calls: int = 1):
+        """Count `calls` requests of this prompt (plus system prompt) at `expected_output_tokens` each."""
+        prompt_tokens = estimate_tokens(prompt) + (estimate_tokens(system) if system else 0)
+        self.items.append({
+            "stage": stage,
+            "provider": provider,
+            "model": model,
+            "prompt_tokens": prompt_tokens * calls,
+            "completion_tokens": expected_output_tokens * calls,
+            "cached_tokens": 0,
+            "cost_usd": call_cost(provider, model, prompt_tokens * calls, expected_output_tokens * calls),
+            "api_calls": calls,
+        })
+
+    def rollup(self) -> Dict:
+        totals = _totals(self.items)
+        totals["api_calls"] = sum(item["api_calls"] for item in self.items)
+        by_stage = {}
+        for stage in dict.fromkeys(item["stage"] for item in self.items):
+            items = [item for item in self.items if item["stage"] == stage]
+            by_stage[stage] = _totals(items)
+            by_stage[stage]["api_calls"] = sum(item["api_calls"] for item in items)
+        return {"totals": totals, "by_stage": by_stage}
+
+    def print_report(self):
+        report = self.rollup()
+        print(f"\n{'='*70}")
+        print("  PRE-FLIGHT TOKEN ESTIMATE (nothing sent)")
+        print(f"{'='*70}")
+        for stage, totals in report["by_stage"].items():
+            print(f"  {stage:<28} {totals['api_calls']:>5} calls  {totals['prompt_tokens']:>10,} in  "
+                  f"{totals['completion_tokens']:>9,} out  ${totals['cost_usd']:.4f}")
+        totals = report["totals"]
+        print(f"  {'TOTAL':<28} {totals['api_calls']:>5} calls  {totals['prompt_tokens']:>10,} in  "
+              f"{totals['completion_tokens']:>9,} out  ${totals['cost_usd']:.4f}")
+        if totals["unpriced_calls"]:
+            print(f"  ({totals['unpriced_calls']} line(s) use models without a known price)")
+        print(f"  Token counts are ~{CHARS_PER_TOKEN} chars/token; output counts are expected sizes per call.")
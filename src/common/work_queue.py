@@ -0,0 +1,258 @@
+"""
+SQLite-backed work queue for resumable per-item batch jobs.
+
+A batch job (e.g. backfilling one description per course) registers one task
+per item under a stable key. Workers claim tasks atomically under a SQLite
+write lock, so any number of threads and processes can drain the same queue
+without doing an item twice. Each result is committed on its own row as soon
+as it is ready, instead of rewriting a whole output file. The job's output
+file is exported from the finished rows on demand.
+
+Tasks move pending -> running -> done | failed. A running task whose worker
+has died (same host: its process is gone; other hosts: its lease has expired)
+is claimable again; that counts as an attempt, so a task that keeps killing
+its worker is marked failed once it has used max_attempts claims. Failed
+tasks stay failed for the rest of the run and go back to pending with
+retry_failed() on the next one, until max_attempts is reached. Attempts and
+claim/finish times are kept per task. `python -m common.work_queue PATH`
+prints a queue's status.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# ==================== CONFIGURATION ====================
+LEASE_TTL = float(os.getenv("WORK_QUEUE_LEASE_TTL", "3600"))   # Seconds before another host may take over a running task
+MAX_ATTEMPTS = int(os.getenv("WORK_QUEUE_MAX_ATTEMPTS", "3"))  # Claims per task before it stays failed
+
+STATUSES = ("pending", "running", "done", "failed")
+
+_HOST = socket.gethostname()
+
+
+def _owner_alive(owner: str) -> bool:
+    host, _, pid = owner.rpartition(":")
+    if host != _HOST:
+        return True  # Can't check another machine; rely on the lease
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        pass
+    return True
+
+
+# ==================== WORK QUEUE ====================
+class WorkQueue:
+    """Task table (key, payload, status, attempts, result, timings) shared by every worker that opens it."""
+
+    def __init__(self, db_path: str, lease_ttl: float = LEASE_TTL, max_attempts: int = MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.lease_ttl = lease_ttl
+        self.max_attempts = max_attempts
+        self.owner = f"{_HOST}:{os.getpid()}"
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    key TEXT NOT NULL UNIQUE,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    owner TEXT,
+                    enqueued REAL NOT NULL,
+                    claimed REAL,
+                    finished REAL,
+                    lease_expires REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status, seq)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None so that BEGIN IMMEDIATE below is the only transaction
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    # ---------- enqueueing ----------
+    def add_many(self, tasks: List[Tuple[str, Dict, Optional[str]]]) -> int:
+        """
+        Register (key, payload, result) tasks in one transaction; a task with a
+        result is recorded as done. Keys already present are left untouched.
+        Returns how many tasks were new.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO tasks (key, payload, status, result, enqueued, finished) VALUES (?, ?, ?, ?, ?, ?)",
+                [(key, json.dumps(payload, ensure_ascii=False), "done" if result is not None else "pending",
+                  result, now, now if result is not None else None) for key, payload, result in tasks]
+            )
+            added = conn.total_changes - before
+            conn.execute("COMMIT")
+        return added
+
+    def retry_failed(self) -> int:
+        """Put failed tasks with attempts left back to pending; returns how many."""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE tasks SET status = 'pending', owner = NULL WHERE status = 'failed' AND attempts < ?",
+                (self.max_attempts,)
+            ).rowcount
+
+    def discard_except(self, keys: List[str]) -> int:
+        """
+        Drop unfinished tasks whose key is not in `keys` (e.g. superseded by
+        edited inputs); finished results are kept. Returns how many were dropped.
+        """
+        keep = set(keys)
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            stale = [(key,) for (key,) in conn.execute("SELECT key FROM tasks WHERE status != 'done'").fetchall()
+                     if key not in keep]
+            conn.executemany("DELETE FROM tasks WHERE key = ?", stale)
+            conn.execute("COMMIT")
+        return len(stale)
+
+    # ---------- workers ----------
+    def claim(self) -> Optional[Tuple[str, Dict]]:
+        """
+        Atomically take the next pending (or abandoned) task: (key, payload), or
+        None when drained. An abandoned task whose claims are used up is failed instead.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT key, payload FROM tasks WHERE status = 'pending' ORDER BY seq LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    for key, payload, owner, expires, attempts in conn.execute(
+                        "SELECT key, payload, owner, lease_expires, attempts FROM tasks "
+                        "WHERE status = 'running' ORDER BY seq"
+                    ).fetchall():
+                        if expires >= now and _owner_alive(owner):
+                            continue
+                        if attempts >= self.max_attempts:
+                            conn.execute(
+                                "UPDATE tasks SET status = 'failed', error = ?, finished = ?, owner = NULL, "
+                                "lease_expires = NULL WHERE key = ?",
+                                (f"worker died on each of {attempts} attempts", now, key)
+                            )
+                            continue
+                        row = (key, payload)
+                        break
+                if row is None:
+                    return None
+                conn.execute(
+                    "UPDATE tasks SET status = 'running', owner = ?, attempts = attempts + 1, claimed = ?, "
+                    "lease_expires = ?, error = NULL WHERE key = ?",
+                    (self.owner, now, now + self.lease_ttl, row[0])
+                )
+                return row[0], json.loads(row[1])
+            finally:
+                conn.execute("COMMIT")
+
+    def complete(self, key: str, result: str):
+        """Commit one task's result."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE tasks SET status = 'done', result = ?, finished = ?, owner = NULL, lease_expires = NULL "
+                "WHERE key = ?",
+                (result, time.time(), key)
+            )
+
+    def fail(self, key: str, error: str):
+        """Mark one task failed; retry_failed() re-queues it on a later run."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE tasks SET status = 'failed', error = ?, finished = ?, owner = NULL, lease_expires = NULL "
+                "WHERE key = ?",
+                (error[:500], time.time(), key)
+            )
+
+    def release(self, key: str):
+        """Hand a claimed task back untried (e.g. the run is stopping), without using up an attempt."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE tasks SET status = 'pending', attempts = MAX(attempts - 1, 0), owner = NULL, "
+                "lease_expires = NULL WHERE key = ? AND status = 'running'",
+                (key,)
+            )
+
+    # ---------- reading ----------
+    def counts(self) -> Dict[str, int]:
+        """{status: tasks}."""
+        with self._connect() as conn:
+            rows = dict(conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
+        return {status: rows.get(status, 0) for status in STATUSES}
+
+    def pending(self) -> Iterator[Tuple[str, Dict]]:
+        """(key, payload) of tasks not done yet, in enqueue order."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT key, payload FROM tasks WHERE status != 'done' ORDER BY seq").fetchall()
+        for key, payload in rows:
+            yield key, json.loads(payload)
+
+    def results(self) -> Iterator[Tuple[str, Dict, Optional[str]]]:
+        """(key, payload, result or None) of every task, in enqueue order, e.g. for exporting."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT key, payload, result FROM tasks ORDER BY seq").fetchall()
+        for key, payload, result in rows:
+            yield key, json.loads(payload), result
+
+    def result_map(self) -> Dict[str, str]:
+        """{key: result} of every finished task."""
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT key, result FROM tasks WHERE status = 'done'").fetchall())
+
+    def status(self) -> Dict:
+        """Counts by status plus timings of finished claims, e.g. for run metadata."""
+        with self._connect() as conn:
+            n, mean, total = conn.execute(
+                "SELECT COUNT(*), AVG(finished - claimed), SUM(finished - claimed) FROM tasks "
+                "WHERE status = 'done' AND claimed IS NOT NULL"
+            ).fetchone()
+            errors = conn.execute(
+                "SELECT key, attempts, error FROM tasks WHERE status = 'failed' ORDER BY seq"
+            ).fetchall()
+        return {
+            **self.counts(),
+            "timed": n,
+            "mean_task_s": round(mean, 2) if mean is not None else None,
+            "total_task_s": round(total, 2) if total is not None else None,
+            "failures": [{"key": key, "attempts": attempts, "error": error} for key, attempts, error in errors],
+        }
+
+
+# ==================== CLI ====================
+def main():
+    parser = argparse.ArgumentParser(description="Show a work queue's task counts, timings and failures")
+    parser.add_argument("path", help="Queue database file")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        print(f"No queue at {args.path}")
+        return
+    status = WorkQueue(args.path).status()
+    print(f"📋 {args.path}")
+    print("   " + " | ".join(f"{s}: {status[s]}" for s in STATUSES))
+    if status["mean_task_s"] is not None:
+        print(f"   ⏱  {status['timed']} tasks timed, {status['mean_task_s']}s mean, {status['total_task_s']}s total")
+    for failure in status["failures"]:
+        print(f"   ❌ {failure['key']} (attempt {failure['attempts']}): {failure['error']}")
+
+
+if __name__ == "__main__":
+    main()
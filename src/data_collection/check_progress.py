@@ -1,50 +1,72 @@
 """
 Quick Statistics Generator for Dataset Collection
 
-Shows current progress across all data sources.
+Shows current progress across all data sources. Statistics are queried from
+the corpus database (common/corpus_store.py, CORPUS_DB) when it exists, without
+loading any course; batch files it hasn't imported yet are imported first.
+Otherwise the JSON batch files are read. Overall totals cover coursera, udemy
+and universities; other corpus partitions (e.g. kaggle) are listed separately.
+
+With --parquet, the statistics are instead vectorised scans over a Parquet
+export of the corpus (common/corpus_export.py).
 
 Usage:
-    python check_progress.py
+    python check_progress.py [--parquet [DIR]]
 """
 
-import json
+import argparse
 import os
+import sys
 from pathlib import Path
 from typing import Dict, List
 from datetime import datetime
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.checkpoint import atomic_write_json
+from common.corpus_export import DEFAULT_PARQUET_DIR, scan_stats
+from common.corpus_store import DEFAULT_CORPUS_DB, CorpusStore
+from common.records import Course, courses_from_dicts
+from common.serialization import read_output
+
 # Paths
 BASE_DIR = Path("../../datasets/large_scale_collection/raw")
 COURSERA_DIR = BASE_DIR / "coursera"
 UDEMY_DIR = BASE_DIR / "udemy"
 UNIVERSITIES_DIR = BASE_DIR / "universities"
 
-def load_json_files(directory: Path) -> List[Dict]:
-    """Load all JSON files from a directory"""
-    courses = []
-    
+# Collection partitions reported by source: (name, label, batch file directory)
+SOURCES = [
+    ("coursera", "🎓 COURSERA", COURSERA_DIR),
+    ("udemy", "💻 UDEMY", UDEMY_DIR),
+    ("universities", "🏫 UNIVERSITIES", UNIVERSITIES_DIR),
+]
+
+def data_files(directory: Path) -> List[Path]:
+    """Collected data files in a directory, in any output format (.json or .json.zst)"""
     if not directory.exists():
-        return courses
+        return []
+    files = list(directory.glob("*.json")) + list(directory.glob("*.json.zst"))
+    return [f for f in files if not f.name.endswith("_stats.json")]  # Skip stats files
+
+def load_json_files(directory: Path) -> List[Course]:
+    """Load all data files from a directory as slotted Course records (one file's dicts in memory at a time)"""
+    courses = []
     
-    for file_path in directory.glob("*.json"):
-        if file_path.name.endswith("_stats.json"):
-            continue  # Skip stats files
-        
+    for file_path in data_files(directory):
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                
-                if isinstance(data, list):
-                    courses.extend(data)
-                elif isinstance(data, dict) and 'courses' in data:
-                    courses.extend(data['courses'])
+            data = read_output(file_path)
+            
+            if isinstance(data, list):
+                courses.extend(courses_from_dicts(data))
+            elif isinstance(data, dict) and 'courses' in data:
+                courses.extend(courses_from_dicts(data['courses']))
                     
         except Exception as e:
             print(f"⚠️ Error loading {file_path.name}: {e}")
     
     return courses
 
-def calculate_stats(courses: List[Dict]) -> Dict:
+def calculate_stats(courses: List[Course]) -> Dict:
     """Calculate statistics for a list of courses"""
     if not courses:
         return {
@@ -56,10 +78,10 @@ def calculate_stats(courses: List[Dict]) -> Dict:
         }
     
     total = len(courses)
-    with_los = sum(1 for c in courses if c.get('learning_outcomes'))
-    with_description = sum(1 for c in courses if len(c.get('description', '')) > 50)
+    with_los = sum(1 for c in courses if c.learning_outcomes)
+    with_description = sum(1 for c in courses if len(c.description) > 50)
     
-    total_los = sum(len(c.get('learning_outcomes', [])) for c in courses)
+    total_los = sum(len(c.learning_outcomes) for c in courses)
     avg_los = total_los / total if total > 0 else 0
     
     return {
@@ -77,63 +99,84 @@ def print_banner(text: str):
     print("="*70)
 
 def main():
+    parser = argparse.ArgumentParser(description="Show dataset collection progress")
+    parser.add_argument("--parquet", nargs="?", const=DEFAULT_PARQUET_DIR, default=None,
+                        help="Scan a Parquet export of the corpus (default dir: CORPUS_PARQUET_DIR)")
+    args = parser.parse_args()
+
     print_banner("📊 DATASET COLLECTION PROGRESS")
     print(f"⏰ Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
-    # Load data from each source
-    print("\n🔄 Loading data...")
-    coursera_courses = load_json_files(COURSERA_DIR)
-    udemy_courses = load_json_files(UDEMY_DIR)
-    university_courses = load_json_files(UNIVERSITIES_DIR)
-    
-    # Calculate statistics
-    coursera_stats = calculate_stats(coursera_courses)
-    udemy_stats = calculate_stats(udemy_courses)
-    university_stats = calculate_stats(university_courses)
-    
-    # Overall statistics
-    all_courses = coursera_courses + udemy_courses + university_courses
-    overall_stats = calculate_stats(all_courses)
+    labels = {name: label for name, label, _ in SOURCES}
+    store = None
+    uni_sources = None
+    if args.parquet:
+        # Column scans over n_los / description_chars / dedup_key only
+        print(f"\n🗂️  Scanning Parquet export: {args.parquet}")
+        by_collection = scan_stats(args.parquet, by="collection")
+        source_stats = {name: by_collection.pop(name, None) or calculate_stats([]) for name in labels}
+        source_stats.update(by_collection)
+        overall_stats = scan_stats(args.parquet, collection=list(labels))
+        uni_sources = {source: stats['total'] for source, stats in
+                       scan_stats(args.parquet, by="source", collection="universities").items()}
+    elif os.path.exists(DEFAULT_CORPUS_DB):
+        store = CorpusStore(DEFAULT_CORPUS_DB)
+        # Batch files the corpus hasn't seen (collected before it existed, or by collectors
+        # that don't write to it); unchanged files are skipped
+        for name, _, directory in SOURCES:
+            imported = store.import_files(data_files(directory), name)
+            if imported["files"]:
+                print(f"📥 Imported {imported['files']} {name} batch files into the corpus "
+                      f"({imported['inserted']} new, {imported['updated']} updated courses)")
+        # Aggregates computed by SQLite over the corpus
+        print(f"\n🗄️  Querying corpus: {DEFAULT_CORPUS_DB}")
+        partitions = list(labels) + [p for p in store.counts() if p not in labels]
+        source_stats = {p: store.stats(p) for p in partitions}
+        overall_stats = store.stats(list(labels))
+        uni_sources = store.source_counts("universities")
+    else:
+        print("\n🔄 Loading data...")
+        source_stats = {}
+        all_courses = []
+        for name, _, directory in SOURCES:
+            courses = load_json_files(directory)
+            source_stats[name] = calculate_stats(courses)
+            all_courses.extend(courses)
+        overall_stats = calculate_stats(all_courses)
+        del all_courses
     
     # Display results
     print_banner("OVERALL STATISTICS")
     print(f"  📚 Total Courses:              {overall_stats['total']:,}")
+    if 'unique_titles' in overall_stats:
+        print(f"  🔑 Unique Titles:              {overall_stats['unique_titles']:,}")
     print(f"  ✅ With Learning Outcomes:     {overall_stats['with_los']:,} ({overall_stats['lo_coverage']:.1f}%)")
     print(f"  📝 With Descriptions:          {overall_stats['with_description']:,}")
     print(f"  📊 Avg LOs per Course:         {overall_stats['avg_los_per_course']:.2f}")
     
     print_banner("BY SOURCE")
     
-    # Coursera
-    print(f"\n  🎓 COURSERA:")
-    print(f"     Total:            {coursera_stats['total']:,}")
-    print(f"     With LOs:         {coursera_stats['with_los']:,} ({coursera_stats['lo_coverage']:.1f}%)")
-    print(f"     Avg LOs/Course:   {coursera_stats['avg_los_per_course']:.2f}")
-    
-    # Udemy
-    print(f"\n  💻 UDEMY:")
-    print(f"     Total:            {udemy_stats['total']:,}")
-    print(f"     With LOs:         {udemy_stats['with_los']:,} ({udemy_stats['lo_coverage']:.1f}%)")
-    print(f"     Avg LOs/Course:   {udemy_stats['avg_los_per_course']:.2f}")
-    
-    # Universities
-    print(f"\n  🏫 UNIVERSITIES:")
-    print(f"     Total:            {university_stats['total']:,}")
-    print(f"     With LOs:         {university_stats['with_los']:,} ({university_stats['lo_coverage']:.1f}%)")
-    print(f"     Avg LOs/Course:   {university_stats['avg_los_per_course']:.2f}")
-    
-    # List individual university files
-    if UNIVERSITIES_DIR.exists():
-        uni_files = [f for f in UNIVERSITIES_DIR.glob("*.json") if not f.name.endswith("_stats.json")]
+    for name, stats in source_stats.items():
+        print(f"\n  {labels.get(name, '📦 ' + name.upper() + ' (not in overall totals)')}:")
+        print(f"     Total:            {stats['total']:,}")
+        print(f"     With LOs:         {stats['with_los']:,} ({stats['lo_coverage']:.1f}%)")
+        print(f"     Avg LOs/Course:   {stats['avg_los_per_course']:.2f}")
+    
+    # List individual universities
+    if uni_sources is not None:
+        if uni_sources:
+            print(f"\n     Universities collected:")
+            for source, count in sorted(uni_sources.items()):
+                print(f"       • {source}: {count:,} courses")
+    elif UNIVERSITIES_DIR.exists():
+        uni_files = data_files(UNIVERSITIES_DIR)
         if uni_files:
             print(f"\n     Universities collected:")
             for file in sorted(uni_files):
-                file_courses = load_json_files(UNIVERSITIES_DIR.parent / UNIVERSITIES_DIR.name)
                 # Count courses in this specific file
-                with open(file, 'r') as f:
-                    data = json.load(f)
-                    count = len(data) if isinstance(data, list) else len(data.get('courses', []))
-                print(f"       • {file.stem}: {count:,} courses")
+                data = read_output(file)
+                count = len(data) if isinstance(data, list) else len(data.get('courses', []))
+                print(f"       • {file.name.split('.')[0]}: {count:,} courses")
     
     # Progress towards goals
     print_banner("PROGRESS TOWARDS GOALS")
@@ -206,23 +249,17 @@ def main():
     stats_output = {
         'timestamp': datetime.now().isoformat(),
         'overall': overall_stats,
-        'by_source': {
-            'coursera': coursera_stats,
-            'udemy': udemy_stats,
-            'universities': university_stats
-        },
+        'by_source': source_stats,
+        'corpus': args.parquet or (DEFAULT_CORPUS_DB if store is not None else None),
         'files': {
-            'coursera': len(list(COURSERA_DIR.glob("*.json"))) if COURSERA_DIR.exists() else 0,
-            'udemy': len(list(UDEMY_DIR.glob("*.json"))) if UDEMY_DIR.exists() else 0,
-            'universities': len(list(UNIVERSITIES_DIR.glob("*.json"))) if UNIVERSITIES_DIR.exists() else 0
+            'coursera': len(data_files(COURSERA_DIR)),
+            'udemy': len(data_files(UDEMY_DIR)),
+            'universities': len(data_files(UNIVERSITIES_DIR))
         }
     }
     
     stats_file = BASE_DIR.parent / "statistics" / "latest_stats.json"
-    stats_file.parent.mkdir(parents=True, exist_ok=True)
-    
-    with open(stats_file, 'w', encoding='utf-8') as f:
-        json.dump(stats_output, f, indent=2)
+    atomic_write_json(stats_file, stats_output, fmt="pretty")
     
     print(f"\n💾 Statistics saved to: {stats_file}")
     print("="*70 + "\n")
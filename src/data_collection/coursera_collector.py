@@ -19,13 +19,20 @@ import json
 import requests
 import time
 import os
+import sys
 import argparse
 from datetime import datetime
+from pathlib import Path
 from typing import List, Dict, Optional
 from bs4 import BeautifulSoup
 from tqdm import tqdm
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.checkpoint import CheckpointWriter, atomic_write_json
+from common.corpus_store import CorpusStore
+from common.serialization import FORMATS
+
 # Load environment variables
 load_dotenv()
 
@@ -39,8 +46,12 @@ RETRY_BACKOFF = 5
 class CourseraCollector:
     """Collects course data from Coursera"""
     
-    def __init__(self, output_file: str, use_api: bool = True):
+    def __init__(self, output_file: str, use_api: bool = True, output_format: Optional[str] = None,
+                 corpus: Optional[CorpusStore] = None):
         self.output_file = output_file
+        self.output_format = output_format  # See common/serialization.py; None = OUTPUT_FORMAT
+        self.corpus = corpus  # Courses are also upserted here (common/corpus_store.py); None = batch file only
+        self._stored = 0  # Courses of the current list already upserted
         self.use_api = use_api
         self.session = requests.Session()
         self.session.headers.update({
@@ -76,6 +87,8 @@ class CourseraCollector:
             print(f"❌ API endpoint unreachable: {e}")
             return []
 
+        # Checkpoint every CHECKPOINT_EVERY courses or CHECKPOINT_INTERVAL seconds (common/checkpoint.py)
+        checkpoint = CheckpointWriter(lambda: self.save_progress(all_courses))
         with tqdm(total=limit, desc="Collecting courses") as pbar:
             while len(all_courses) < limit:
                 fetch = min(page_size, limit - len(all_courses))
@@ -98,10 +111,7 @@ class CourseraCollector:
                     batch = self._parse_api_response(data)
                     all_courses.extend(batch)
                     pbar.update(len(batch))
-
-                    # Save progress every 500 courses
-                    if len(all_courses) % 500 == 0:
-                        self.save_progress(all_courses)
+                    checkpoint.add(len(batch))
 
                     # Check if there are more pages
                     paging = data.get('paging', {})
@@ -115,6 +125,7 @@ class CourseraCollector:
                     print(f"⚠️ Error at start={start}: {e}")
                     break
 
+        checkpoint.flush()
         print(f"✅ Collected {len(all_courses)} courses total")
         return all_courses
     
@@ -181,6 +192,7 @@ class CourseraCollector:
         print("⚠️ Note: Ensure this complies with Coursera's Terms of Service")
         
         courses = []
+        checkpoint = CheckpointWriter(lambda: self.save_progress(courses))
         
         for page in tqdm(range(start_page, start_page + num_pages)):
             try:
@@ -194,10 +206,7 @@ class CourseraCollector:
                     soup = BeautifulSoup(response.text, 'html.parser')
                     page_courses = self._extract_courses_from_page(soup)
                     courses.extend(page_courses)
-                    
-                    # Save progress
-                    if len(courses) % 100 == 0:
-                        self.save_progress(courses)
+                    checkpoint.add(len(page_courses))
                 
                 # Respect rate limits
                 time.sleep(RATE_LIMIT_DELAY)
@@ -206,6 +215,7 @@ class CourseraCollector:
                 print(f"⚠️ Error on page {page}: {e}")
                 continue
         
+        checkpoint.flush()
         return courses
     
     def _extract_courses_from_page(self, soup: BeautifulSoup) -> List[Dict]:
@@ -378,10 +388,16 @@ class CourseraCollector:
         return parts[-1] if parts else 'unknown'
     
     def save_progress(self, courses: List[Dict]):
-        """Save collected data incrementally"""
-        with open(self.output_file, 'w', encoding='utf-8') as f:
-            json.dump(courses, f, indent=2, ensure_ascii=False)
-        print(f"💾 Saved {len(courses)} courses to {self.output_file}")
+        """Save collected data incrementally (temp file + rename, never a truncated file)"""
+        written = atomic_write_json(self.output_file, courses, fmt=self.output_format)
+        print(f"💾 Saved {len(courses)} courses to {written}")
+        if self.corpus is not None:
+            # The list only grows during a run, so only courses added since the last save are upserted
+            if self._stored > len(courses):
+                self._stored = 0
+            counts = self.corpus.upsert(courses[self._stored:], partition="coursera")
+            self._stored = len(courses)
+            print(f"   🗄️  Corpus: {counts['inserted']} new, {counts['updated']} updated")
     
     def validate_data(self, courses: List[Dict]) -> Dict:
         """Validate collected data quality"""
@@ -408,10 +424,15 @@ def main():
                        help='Collection method')
     parser.add_argument('--input', help='Input file for provided data method')
     parser.add_argument('--limit', type=int, default=1000, help='Number of courses to collect')
+    parser.add_argument('--format', choices=sorted(FORMATS), default=None,
+                       help='Output format (default: OUTPUT_FORMAT or pretty); compact/zstd for large collections')
+    parser.add_argument('--no-corpus', action='store_true',
+                       help='Only write the batch file, not the corpus database (CORPUS_DB)')
     
     args = parser.parse_args()
     
-    collector = CourseraCollector(args.output)
+    corpus = None if args.no_corpus else CorpusStore()
+    collector = CourseraCollector(args.output, output_format=args.format, corpus=corpus)
     
     print("🚀 Starting Coursera data collection...")
     print(f"   Method: {args.method}")
@@ -443,8 +464,7 @@ def main():
         
         # Save statistics
         stats_file = args.output.replace('.json', '_stats.json')
-        with open(stats_file, 'w') as f:
-            json.dump(stats, f, indent=2)
+        atomic_write_json(stats_file, stats, fmt="pretty", ensure_ascii=True)
         print(f"\n✅ Statistics saved to: {stats_file}")
     else:
         print("\n❌ No courses collected. Check method and connectivity.")
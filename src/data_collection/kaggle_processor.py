@@ -11,10 +11,12 @@ Processes:
 - alison.csv             (5,725 records - Alison with skills)
 
 Usage:
-    python kaggle_processor.py
+    python kaggle_processor.py [--format compact]
 """
 
+import argparse
 import json
+import sys
 import pandas as pd
 import hashlib
 from datetime import datetime
@@ -22,6 +24,11 @@ from pathlib import Path
 from bs4 import BeautifulSoup
 from typing import List, Dict, Optional
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.checkpoint import atomic_write_json
+from common.corpus_store import CorpusStore
+from common.serialization import FORMATS
+
 SCRIPT_DIR = Path(__file__).parent
 KAGGLE_DIR = SCRIPT_DIR / "../../datasets/large_scale_collection/raw/kaggle"
 OUT_DIR = SCRIPT_DIR / "../../datasets/large_scale_collection/raw"
@@ -240,6 +247,13 @@ def validate(courses: List[Dict]) -> Dict:
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Standardize downloaded Kaggle course datasets")
+    parser.add_argument("--format", choices=sorted(FORMATS), default=None,
+                        help="Output format (default: OUTPUT_FORMAT or pretty); compact/zstd for large collections")
+    parser.add_argument("--no-corpus", action="store_true",
+                        help="Only write the JSON file, not the corpus database (CORPUS_DB)")
+    args = parser.parse_args()
+
     print("=" * 60)
     print("KAGGLE DATASET PROCESSOR")
     print("=" * 60)
@@ -267,9 +281,13 @@ def main():
 
     # Save one combined kaggle file
     out_path = OUT_DIR / "kaggle" / f"kaggle_processed_{datetime.now().strftime('%Y%m%d')}.json"
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(all_courses, f, indent=2, ensure_ascii=False)
+    written = atomic_write_json(out_path, all_courses, fmt=args.format)
+
+    if not args.no_corpus:
+        corpus = CorpusStore()
+        counts = corpus.upsert(all_courses, partition="kaggle")
+        print(f"Corpus ({corpus.db_path}): {counts['inserted']} new, {counts['updated']} updated, "
+              f"{counts['unchanged']} unchanged")
 
     stats = validate(all_courses)
     print("\n" + "=" * 60)
@@ -279,10 +297,9 @@ def main():
         print(f"  {k}: {v}")
 
     stats_path = out_path.with_suffix("").with_name(out_path.stem + "_stats.json")
-    with open(stats_path, "w") as f:
-        json.dump(stats, f, indent=2)
+    atomic_write_json(stats_path, stats, fmt="pretty")
 
-    print(f"\nSaved to: {out_path}")
+    print(f"\nSaved to: {written}")
 
 
 if __name__ == "__main__":
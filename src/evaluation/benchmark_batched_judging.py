@@ -0,0 +1,141 @@
+"""
+Benchmark: one LO per judge call vs. several LOs per call (ABCD / SMART)
+
+Scores the same learning objectives in both modes with the same judge and
+compares API call count, prompt/completion tokens, wall time, and how well the
+batched scores agree with the one-LO-per-call scores.
+"""
+
+import argparse
+import os
+import statistics
+import time
+from typing import Dict, List
+
+import llm_judge_evaluation as judge_eval
+from common.checkpoint import atomic_write_json
+from common.llm_cache import get_response_cache
+from common.serialization import read_output
+
+# ==================== CONFIGURATION ====================
+INPUTS = {
+    "ABCD": judge_eval.ABCD_INPUT,
+    "SMART": judge_eval.SMART_INPUT,
+}
+COURSE_CONTEXT = "Process scheduling, synchronization, memory management, file systems, deadlock, security"
+BENCHMARK_OUTPUT = os.path.join(judge_eval.OUTPUT_DIR, "benchmark_batched_judging.json")
+
+
+# ==================== BENCHMARK ====================
+def run_mode(framework: str, objectives: List[str], judge: str, batch_size: int, runs: int) -> Dict:
+    """Score all objectives `runs` times with one batch size; return results and cost."""
+    calls_before = len(judge_eval.USAGE.calls)
+    start = time.monotonic()
+    results = []
+    for run_num in range(1, runs + 1):
+        print(f"   Run {run_num}/{runs} (batch size {batch_size})...", end=" ")
+        results.append(judge_eval.evaluate_objectives(
+            framework, objectives, COURSE_CONTEXT, run_num, judge=judge, batch_size=batch_size
+        ))
+        print("✓")
+    elapsed = time.monotonic() - start
+
+    calls = judge_eval.USAGE.calls[calls_before:]
+    return {
+        "results": results,
+        "cost": {
+            "batch_size": batch_size,
+            "api_calls": len(calls),
+            "prompt_tokens": sum(c.get("prompt_tokens") or 0 for c in calls),
+            "completion_tokens": sum(c.get("completion_tokens") or 0 for c in calls),
+            "cost_usd": round(sum(c.get("cost_usd") or 0 for c in calls), 6),
+            # Includes RATE_LIMIT_DELAY sleeps, which also scale with call count
+            "wall_time_s": round(elapsed, 1),
+        },
+    }
+
+
+def compare_scores(single: List[List[Dict]], batched: List[List[Dict]]) -> Dict:
+    """Agreement between per-LO results of the two modes, paired by run and LO."""
+    composite_single, composite_batched = [], []
+    criteria_single, criteria_batched = {}, {}
+
+    for run_single, run_batched in zip(single, batched):
+        for a, b in zip(run_single, run_batched):
+            composite_single.append(a.get("composite_score", 0))
+            composite_batched.append(b.get("composite_score", 0))
+            for criterion, data in a.get("overall_scores", {}).items():
+                other = b.get("overall_scores", {}).get(criterion)
+                if other is None:
+                    continue
+                criteria_single.setdefault(criterion, []).append(int(data.get("score", 0)))
+                criteria_batched.setdefault(criterion, []).append(int(other.get("score", 0)))
+
+    pairs = list(zip(composite_single, composite_batched))
+    return {
+        "num_pairs": len(pairs),
+        "composite_exact_agreement_pct": (sum(1 for s, b in pairs if abs(s - b) < 0.1) / len(pairs)) * 100 if pairs else 0,
+        "composite_within_1_agreement_pct": (sum(1 for s, b in pairs if abs(s - b) <= 1.0) / len(pairs)) * 100 if pairs else 0,
+        "composite_mean_bias": statistics.mean([b - s for s, b in pairs]) if pairs else 0,
+        "composite_correlation": judge_eval.calculate_pearson_correlation(composite_single, composite_batched) if len(pairs) > 1 else 0,
+        "criteria_kappa": {
+            criterion: judge_eval.calculate_cohens_kappa_simple(scores, criteria_batched[criterion])
+            for criterion, scores in criteria_single.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare one-LO-per-call and batched ABCD/SMART judging")
+    parser.add_argument("--framework", choices=sorted(INPUTS), default="ABCD")
+    parser.add_argument("--judge", choices=["gemini", "groq"], default="gemini")
+    parser.add_argument("--batch-size", type=int, default=5, help="LOs per request in batched mode")
+    parser.add_argument("--runs", type=int, default=1, help="Evaluation rounds per mode")
+    parser.add_argument("--limit", type=int, default=None, help="Only score the first N LOs")
+    parser.add_argument("--output", default=BENCHMARK_OUTPUT)
+    args = parser.parse_args()
+
+    objectives = read_output(INPUTS[args.framework]).get("learning_objectives", [])[:args.limit]
+    if not objectives:
+        print(f"❌ No learning objectives found in {INPUTS[args.framework]}")
+        return
+
+    # Both modes must actually call the judge
+    get_response_cache().bypass = True
+
+    print(f"\n📚 {len(objectives)} {args.framework} LOs, judge={args.judge}, runs={args.runs}")
+    print("\n🔹 One LO per call")
+    single = run_mode(args.framework, objectives, args.judge, 1, args.runs)
+    print(f"\n🔹 {args.batch_size} LOs per call")
+    batched = run_mode(args.framework, objectives, args.judge, args.batch_size, args.runs)
+
+    agreement = compare_scores(single["results"], batched["results"])
+    report = {
+        "framework": args.framework,
+        "judge": args.judge,
+        "num_objectives": len(objectives),
+        "runs": args.runs,
+        "single": single["cost"],
+        "batched": batched["cost"],
+        "agreement": agreement,
+        "results": {"single": single["results"], "batched": batched["results"]},
+    }
+    atomic_write_json(args.output, report, fmt="pretty")
+
+    print(f"\n{'='*70}")
+    print(f"  BATCHED JUDGING BENCHMARK - {args.framework} ({args.judge})")
+    print(f"{'='*70}")
+    print(f"  {'':<20}{'single':>12}{'batched':>12}")
+    for key in ("api_calls", "prompt_tokens", "completion_tokens", "cost_usd", "wall_time_s"):
+        print(f"  {key:<20}{single['cost'][key]:>12}{batched['cost'][key]:>12}")
+    print(f"\n  Composite exact agreement:    {agreement['composite_exact_agreement_pct']:.1f}%")
+    print(f"  Composite within-±1:          {agreement['composite_within_1_agreement_pct']:.1f}%")
+    print(f"  Mean bias (batched - single): {agreement['composite_mean_bias']:+.2f}")
+    print(f"  Correlation:                  {agreement['composite_correlation']:.3f}")
+    for criterion, kappa in agreement["criteria_kappa"].items():
+        print(f"  κ {criterion:<27} {kappa:.3f}")
+    print(f"\n✅ Saved benchmark: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
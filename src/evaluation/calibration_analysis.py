@@ -5,9 +5,14 @@ Allows manual scoring of LOs, then compares with LLM judge scores
 
 import json
 import os
+import sys
+from pathlib import Path
 from typing import Dict, List
 import statistics
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.serialization import output_exists, read_output
+
 # ==================== CONFIGURATION ====================
 CALIBRATION_SET_FILE = "../../datasets/evaluation/calibration_set.json"
 LLM_EVALUATION_DIR = "../../datasets/evaluation"
@@ -139,11 +144,10 @@ def find_llm_scores(lo_id: str, framework: str) -> Dict:
     """Find corresponding LLM evaluation scores."""
     eval_file = os.path.join(LLM_EVALUATION_DIR, f"evaluation_{framework.lower()}.json")
     
-    if not os.path.exists(eval_file):
+    if not output_exists(eval_file):
         return None
     
-    with open(eval_file, 'r') as f:
-        eval_data = json.load(f)
+    eval_data = read_output(eval_file)
     
     # Extract LO number from ID (e.g., "ABCD_LO_1" -> 1)
     try:
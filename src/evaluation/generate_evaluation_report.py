@@ -3,10 +3,14 @@ Generate Human-Readable Evaluation Reports
 Creates formatted reports from LLM-as-judge evaluation results
 """
 
-import json
 import os
+import sys
+from pathlib import Path
 from typing import Dict, List, Any
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.serialization import output_exists, read_output
+
 # ==================== CONFIGURATION ====================
 EVALUATION_DIR = "../../datasets/evaluation"
 REPORT_DIR = "../../datasets/evaluation/reports"
@@ -352,11 +356,10 @@ def main():
     data_loaded = {}
     
     # ABCD Report
-    if os.path.exists(abcd_file):
+    if output_exists(abcd_file):
         print("\n📄 Generating ABCD report...")
-        with open(abcd_file, 'r') as f:
-            abcd_data = json.load(f)
-            data_loaded['abcd'] = abcd_data
+        abcd_data = read_output(abcd_file)
+        data_loaded['abcd'] = abcd_data
         
         report = generate_abcd_report(abcd_data)
         output_path = os.path.join(REPORT_DIR, "report_abcd.txt")
@@ -367,11 +370,10 @@ def main():
         print(f"\n⚠️  ABCD evaluation file not found: {abcd_file}")
     
     # SMART Report
-    if os.path.exists(smart_file):
+    if output_exists(smart_file):
         print("\n📄 Generating SMART report...")
-        with open(smart_file, 'r') as f:
-            smart_data = json.load(f)
-            data_loaded['smart'] = smart_data
+        smart_data = read_output(smart_file)
+        data_loaded['smart'] = smart_data
         
         report = generate_smart_report(smart_data)
         output_path = os.path.join(REPORT_DIR, "report_smart.txt")
@@ -382,11 +384,10 @@ def main():
         print(f"\n⚠️  SMART evaluation file not found: {smart_file}")
     
     # Bloom's Report
-    if os.path.exists(blooms_file):
+    if output_exists(blooms_file):
         print("\n📄 Generating Bloom's Taxonomy report...")
-        with open(blooms_file, 'r') as f:
-            blooms_data = json.load(f)
-            data_loaded['blooms'] = blooms_data
+        blooms_data = read_output(blooms_file)
+        data_loaded['blooms'] = blooms_data
         
         report = generate_blooms_report(blooms_data)
         output_path = os.path.join(REPORT_DIR, "report_blooms.txt")
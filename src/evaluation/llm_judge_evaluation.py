@@ -4,15 +4,33 @@ Evaluates LOs against ABCD, SMART, and Bloom's Taxonomy criteria
 with detailed rubrics and consistency checking
 """
 
+import copy
+import hashlib
 import json
+import math
 import os
+import sys
 import time
-from typing import Dict, List, Any
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
 from dotenv import load_dotenv
 import requests
 from collections import defaultdict
 import statistics
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.checkpoint import atomic_write_json
+from common.deadlines import request_timeout, set_stage_deadline
+from common.json_extract import extract_json
+from common.llm_cache import get_response_cache, make_cache_key
+from common.retry import BadOutputError, RetryNowError, call_with_retry, retry_report
+from common.scheduler import get_scheduler
+from common.schemas import (ABCD_JUDGEMENT_SCHEMA, BLOOMS_JUDGEMENT_SCHEMA, SMART_JUDGEMENT_SCHEMA,
+                            batched_judgement_schema, compiled, gemini_response_schema)
+from common.serialization import output_exists, read_output
+from common.single_flight import coalesce, single_flight_report
+from common.usage_tracker import SpendEstimate, get_usage_tracker
+
 # ==================== CONFIGURATION ====================
 load_dotenv()
 
@@ -23,12 +41,20 @@ load_dotenv()
 
 # Gemini API Configuration
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models"
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta").rstrip("/")
+GEMINI_API_URL = f"{GEMINI_BASE_URL}/models"
 GEMINI_MODEL = "gemini-2.0-flash-exp"
+GEMINI_CACHE_URL = f"{GEMINI_BASE_URL}/cachedContents"
+
+# Provider-side context caching of the static rubric system prompts
+# (Gemini: explicit cachedContents; Groq caches repeated prompt prefixes on its own)
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "1") != "0"
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))  # seconds
 
 # Groq API Configuration
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1").rstrip("/")
+GROQ_API_URL = f"{GROQ_BASE_URL}/chat/completions"
 GROQ_MODEL = "llama-3.3-70b-versatile"
 
 # Evaluation settings
@@ -39,15 +65,135 @@ ABCD_INPUT = "../../datasets/slide_based_los_simple_abcd.json"
 SMART_INPUT = "../../datasets/slide_based_los_simple_smart.json"
 BLOOMS_INPUT = "../../datasets/slide_based_los_simple_blooms.json"
 OUTPUT_DIR = "../../datasets/evaluation"
+USAGE_FILE = os.path.join(OUTPUT_DIR, "evaluation.usage.json")  # token/cost rollups per run
 
 # Evaluation settings
 NUM_EVALUATION_RUNS = 3  # Run each evaluation multiple times for consistency
+JUDGE_BATCH_SIZE = int(os.getenv("JUDGE_BATCH_SIZE", "1"))  # ABCD/SMART LOs scored per request (1 = one LO per call)
+# Independent samples a judge returns per request (Gemini candidateCount allows up to 8; Groq
+# only accepts n=1). Above 1, all NUM_EVALUATION_RUNS runs of a prompt come from one request.
+JUDGE_MAX_CANDIDATES = {
+    "gemini": int(os.getenv("GEMINI_MAX_CANDIDATES", "8")),
+    "groq": int(os.getenv("GROQ_MAX_CANDIDATES", "1")),
+}
+
+# Judgement response schemas: sent to Gemini as responseSchema, validated locally for both judges
+# (Groq's llama-3.3-70b only offers plain JSON mode)
+ABCD_JUDGEMENT = compiled(ABCD_JUDGEMENT_SCHEMA, "abcd_judgement")
+SMART_JUDGEMENT = compiled(SMART_JUDGEMENT_SCHEMA, "smart_judgement")
+BLOOMS_JUDGEMENT = compiled(BLOOMS_JUDGEMENT_SCHEMA, "blooms_judgement")
+ABCD_BATCH_JUDGEMENT = compiled(batched_judgement_schema(ABCD_JUDGEMENT_SCHEMA), "abcd_batch_judgement")
+SMART_BATCH_JUDGEMENT = compiled(batched_judgement_schema(SMART_JUDGEMENT_SCHEMA), "smart_batch_judgement")
+
+# Rough completion size of one per-LO judgement, used by the pre-flight estimate (--estimate)
+EXPECTED_OUTPUT_TOKENS_PER_LO = {"ABCD": 900, "SMART": 1100, "BLOOMS": 700}
+# Also sizes each judge call's read timeout (common/deadlines.py); calls covering N LOs expect N times as much
+JUDGE_EXPECTED_OUTPUT_TOKENS = max(EXPECTED_OUTPUT_TOKENS_PER_LO.values())
 
 
 # ==================== API HELPERS ====================
 
-def call_gemini_api(prompt: str, system_prompt: str = None, temperature: float = 0.3) -> Dict:
-    """Call Gemini 2.0 Flash API with JSON response parsing."""
+# One record per upstream judge call (cache hits excluded): provider, model, stage, tokens, latency, cost
+USAGE = get_usage_tracker()
+# Judge runs are batch work: interactive runs sharing the keys go first
+SCHEDULER = get_scheduler("batch")
+
+# System prompt hash -> (cachedContents name, expiry time), or None if caching it failed
+_gemini_context_caches: Dict[str, Any] = {}
+
+
+def get_gemini_cached_content(system_prompt: str) -> Optional[str]:
+    """Return a Gemini cachedContents name holding `system_prompt`, creating it if needed.
+    
+    Returns None (send the system prompt inline) when caching is disabled or the
+    model/prompt is not eligible, e.g. below the provider's minimum cacheable size.
+    """
+    if not GEMINI_CONTEXT_CACHE:
+        return None
+    
+    prompt_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+    if prompt_hash in _gemini_context_caches:
+        entry = _gemini_context_caches[prompt_hash]
+        # Refresh a minute early so an in-flight request never hits an expired cache
+        if entry is None or entry[1] - 60 > time.time():
+            return entry[0] if entry else None
+    
+    payload = {
+        "model": f"models/{GEMINI_MODEL}",
+        "displayName": f"judge-rubric-{prompt_hash[:12]}",
+        "systemInstruction": {"parts": [{"text": system_prompt}]},
+        "ttl": f"{GEMINI_CONTEXT_CACHE_TTL}s"
+    }
+    try:
+        response = requests.post(GEMINI_CACHE_URL, params={"key": GEMINI_API_KEY}, json=payload, timeout=60)
+        response.raise_for_status()
+        name = response.json()["name"]
+    except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+        print(f"   ⚠️  Gemini context cache unavailable ({type(e).__name__}); sending rubric inline")
+        _gemini_context_caches[prompt_hash] = None
+        return None
+    
+    _gemini_context_caches[prompt_hash] = (name, time.time() + GEMINI_CONTEXT_CACHE_TTL)
+    return name
+
+
+def summarize_judge_calls(calls: List[Dict]) -> Dict:
+    """Call count, token totals and cached-prompt-token ratio per judge."""
+    summary = {}
+    for call in calls:
+        totals = summary.setdefault(call["provider"], {
+            "api_calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0
+        })
+        totals["api_calls"] += 1
+        for field in ("prompt_tokens", "cached_tokens", "completion_tokens"):
+            totals[field] += call.get(field) or 0
+    for totals in summary.values():
+        totals["cached_token_ratio"] = totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0
+    return summary
+
+
+def parse_candidates(texts: List[str], schema=None) -> Tuple[List[Dict], List[str]]:
+    """(judgements, their texts) from a reply's candidates; candidates without a valid judgement are dropped."""
+    parsed, kept = [], []
+    for text in texts:
+        try:
+            value = extract_json(text, dict)
+            parsed.append(schema.validate(value) if schema is not None else value)
+            kept.append(text)
+        except BadOutputError as e:
+            print(f"(dropped candidate: {e})", end=" ")
+    if not parsed:
+        raise BadOutputError(f"None of {len(texts)} candidates held a valid judgement")
+    return parsed, kept
+
+
+def decode_candidates(cached: Optional[str], candidates: int, schema=None) -> Optional[List[Dict]]:
+    """Cached reply -> judgements: single replies are stored as text, multi-candidate ones as a JSON list of texts.
+    
+    Each judgement goes through the same validator as a fresh reply (so scores are
+    coerced and invalid items dropped alike). Returns None, a cache miss, when
+    there is nothing cached or a stored candidate no longer validates.
+    """
+    if cached is None:
+        return None
+    try:
+        texts = [cached] if candidates == 1 else json.loads(cached)
+        values = [extract_json(text, dict) for text in texts]
+        return [schema.validate(value) for value in values] if schema is not None else values
+    except (BadOutputError, ValueError, TypeError) as e:
+        print(f"(cached judgement invalid, re-requesting: {e})", end=" ")
+        return None
+
+
+def call_gemini_api(prompt: str, system_prompt: str = None, temperature: float = 0.3, schema=None,
+                    expected_tokens: int = JUDGE_EXPECTED_OUTPUT_TOKENS) -> Dict:
+    """Call Gemini 2.0 Flash API with JSON response parsing (constrained to `schema` if given)."""
+    return call_gemini_candidates(prompt, system_prompt, temperature, schema, expected_tokens)[0]
+
+
+def call_gemini_candidates(prompt: str, system_prompt: str = None, temperature: float = 0.3, schema=None,
+                           expected_tokens: int = JUDGE_EXPECTED_OUTPUT_TOKENS, candidates: int = 1) -> List[Dict]:
+    """Up to `candidates` independent Gemini judgements of one prompt from a single request (candidateCount)."""
     if not GEMINI_API_KEY:
         raise ValueError("GEMINI_API_KEY not found in .env file!")
     
@@ -55,56 +201,92 @@ def call_gemini_api(prompt: str, system_prompt: str = None, temperature: float =
         "Content-Type": "application/json"
     }
     
-    # Gemini uses different structure for system prompt
-    if system_prompt:
-        full_prompt = f"{system_prompt}\n\n{prompt}"
-    else:
-        full_prompt = prompt
-    
     payload = {
         "contents": [{
-            "parts": [{"text": full_prompt}]
+            "role": "user",
+            "parts": [{"text": prompt}]
         }],
         "generationConfig": {
             "temperature": temperature,
             "responseMimeType": "application/json"
         }
     }
+    if schema is not None:
+        payload["generationConfig"]["responseSchema"] = gemini_response_schema(schema.schema)
+    if candidates > 1:
+        payload["generationConfig"]["candidateCount"] = candidates
     
     url = f"{GEMINI_API_URL}/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}"
     
-    max_retries = 3
-    for attempt in range(max_retries):
+    cache = get_response_cache()
+    cache_key = make_cache_key("gemini", GEMINI_MODEL, prompt, system=system_prompt,
+                               params=payload["generationConfig"])
+    judgements = decode_candidates(cache.get(cache_key), candidates, schema)
+    if judgements is not None:
+        return judgements
+    
+    def request() -> List[Dict]:
+        # The rubric system prompt is the stable prefix: reference it from a
+        # provider-side context cache when possible, otherwise send it inline
+        payload.pop("cachedContent", None)
+        payload.pop("systemInstruction", None)
+        if system_prompt:
+            cached_content = get_gemini_cached_content(system_prompt)
+            if cached_content:
+                payload["cachedContent"] = cached_content
+            else:
+                payload["systemInstruction"] = {"parts": [{"text": system_prompt}]}
+        
+        SCHEDULER.acquire(f"gemini:{GEMINI_MODEL}")
+        start = time.monotonic()
+        response = requests.post(url, headers=headers, json=payload,
+                                 timeout=request_timeout(expected_tokens * candidates))
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=120)
             response.raise_for_status()
-            
-            result = response.json()
-            
-            # Extract text from Gemini response structure
-            if "candidates" in result and len(result["candidates"]) > 0:
-                text = result["candidates"][0]["content"]["parts"][0]["text"]
-                return json.loads(text)
-            else:
-                raise Exception("No candidates in Gemini response")
-                
         except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 429:
-                wait_time = 10 * (attempt + 1)
-                print(f"   ⚠️  Rate limit (Gemini). Waiting {wait_time}s...")
-                time.sleep(wait_time)
-            else:
-                raise
-        except Exception as e:
-            if attempt == max_retries - 1:
-                raise
-            time.sleep(5)
+            if "cachedContent" in payload and e.response.status_code in (400, 403, 404):
+                # Context cache expired or was deleted server-side; recreate it on the retry
+                _gemini_context_caches.pop(hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(), None)
+                raise RetryNowError(f"Gemini context cache rejected ({e.response.status_code})") from e
+            raise
+        
+        result = response.json()
+        
+        # Extract text from Gemini response structure
+        if not result.get("candidates"):
+            raise RetryNowError("No candidates in Gemini response")
+        texts = [candidate["content"]["parts"][0]["text"] for candidate in result["candidates"]
+                 if candidate.get("content", {}).get("parts")]
+        usage = result.get("usageMetadata", {})
+        USAGE.record(
+            "gemini", GEMINI_MODEL,
+            prompt_tokens=usage.get("promptTokenCount"),
+            completion_tokens=usage.get("candidatesTokenCount"),
+            cached_tokens=usage.get("cachedContentTokenCount", 0),
+            latency_s=time.monotonic() - start,
+            candidates=len(texts)
+        )
+        parsed, kept = parse_candidates(texts, schema)
+        cache.put(cache_key, kept[0] if candidates == 1 else json.dumps(kept))
+        return parsed
+    
+    def fetch() -> List[Dict]:
+        return call_with_retry(request, provider="gemini")
     
-    raise Exception("Max retries exceeded (Gemini)")
+    # Identical judge requests already in flight (other threads or processes) share one call;
+    # a peer's reply that doesn't validate here counts as a miss
+    return coalesce(cache_key, fetch, decode=lambda text: decode_candidates(text, candidates, schema) or fetch())
+
+
+def call_groq_api(prompt: str, system_prompt: str = None, temperature: float = 0.3, schema=None,
+                  expected_tokens: int = JUDGE_EXPECTED_OUTPUT_TOKENS) -> Dict:
+    """Call Llama 3.3 70B via Groq API with JSON response parsing (validated against `schema` if given)."""
+    return call_groq_candidates(prompt, system_prompt, temperature, schema, expected_tokens)[0]
 
 
-def call_groq_api(prompt: str, system_prompt: str = None, temperature: float = 0.3) -> Dict:
-    """Call Llama 3.3 70B via Groq API with JSON response parsing."""
+def call_groq_candidates(prompt: str, system_prompt: str = None, temperature: float = 0.3, schema=None,
+                         expected_tokens: int = JUDGE_EXPECTED_OUTPUT_TOKENS, candidates: int = 1) -> List[Dict]:
+    """Up to `candidates` independent judgements from one OpenAI-style request (`n`, where the endpoint allows it)."""
     if not GROQ_API_KEY:
         raise ValueError("GROQ_API_KEY not found in .env file!")
     
@@ -130,43 +312,120 @@ def call_groq_api(prompt: str, system_prompt: str = None, temperature: float = 0
         "temperature": temperature,
         "response_format": {"type": "json_object"}
     }
+    if candidates > 1:
+        payload["n"] = candidates
     
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            response = requests.post(GROQ_API_URL, headers=headers, json=payload, timeout=120)
-            response.raise_for_status()
-            
-            result = response.json()
-            text = result["choices"][0]["message"]["content"]
-            return json.loads(text)
-                
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 429:
-                wait_time = 10 * (attempt + 1)
-                print(f"   ⚠️  Rate limit (Groq). Waiting {wait_time}s...")
-                time.sleep(wait_time)
-            else:
-                raise
-        except Exception as e:
-            if attempt == max_retries - 1:
-                raise
-            time.sleep(5)
+    cache = get_response_cache()
+    cache_key = make_cache_key("groq", GROQ_MODEL, prompt, system=system_prompt,
+                               params={k: v for k, v in payload.items() if k not in ("model", "messages")})
+    judgements = decode_candidates(cache.get(cache_key), candidates, schema)
+    if judgements is not None:
+        return judgements
+    
+    def request() -> List[Dict]:
+        SCHEDULER.acquire(f"groq:{GROQ_MODEL}")
+        start = time.monotonic()
+        response = requests.post(GROQ_API_URL, headers=headers, json=payload,
+                                 timeout=request_timeout(expected_tokens * candidates))
+        response.raise_for_status()
+        
+        result = response.json()
+        texts = [choice["message"]["content"] for choice in result["choices"]]
+        usage = result.get("usage", {})
+        USAGE.record(
+            "groq", GROQ_MODEL,
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            cached_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0),
+            latency_s=time.monotonic() - start,
+            candidates=len(texts)
+        )
+        parsed, kept = parse_candidates(texts, schema)
+        cache.put(cache_key, kept[0] if candidates == 1 else json.dumps(kept))
+        return parsed
+    
+    def fetch() -> List[Dict]:
+        return call_with_retry(request, provider="groq")
     
-    raise Exception("Max retries exceeded (Groq)")
+    # Identical judge requests already in flight (other threads or processes) share one call;
+    # a peer's reply that doesn't validate here counts as a miss
+    return coalesce(cache_key, fetch, decode=lambda text: decode_candidates(text, candidates, schema) or fetch())
 
 
-def call_judge_api(prompt: str, system_prompt: str = None, temperature: float = 0.3, judge: str = "gemini") -> Dict:
+def call_judge_api(prompt: str, system_prompt: str = None, temperature: float = 0.3, judge: str = "gemini",
+                   schema=None, expected_tokens: int = JUDGE_EXPECTED_OUTPUT_TOKENS) -> Dict:
     """Call Ollama Cloud API with JSON response parsing."""
     """Unified API caller that routes to appropriate judge."""
     if judge == "gemini":
-        return call_gemini_api(prompt, system_prompt, temperature)
+        return call_gemini_api(prompt, system_prompt, temperature, schema=schema, expected_tokens=expected_tokens)
     elif judge == "groq":
-        return call_groq_api(prompt, system_prompt, temperature)
+        return call_groq_api(prompt, system_prompt, temperature, schema=schema, expected_tokens=expected_tokens)
     else:
         raise ValueError(f"Unknown judge: {judge}. Must be 'gemini' or 'groq'")
 
 
+def call_judge_candidates(prompt: str, system_prompt: str = None, temperature: float = 0.3, judge: str = "gemini",
+                          schema=None, expected_tokens: int = JUDGE_EXPECTED_OUTPUT_TOKENS,
+                          samples: int = NUM_EVALUATION_RUNS) -> List[Dict]:
+    """`samples` independent judgements of one prompt, in as few requests as the judge allows.
+    
+    Candidates that fail to parse are dropped and made up with a smaller follow-up request.
+    """
+    callers = {"gemini": call_gemini_candidates, "groq": call_groq_candidates}
+    if judge not in callers:
+        raise ValueError(f"Unknown judge: {judge}. Must be 'gemini' or 'groq'")
+    results = []
+    while len(results) < samples:
+        candidates = min(samples - len(results), JUDGE_MAX_CANDIDATES[judge])
+        results.extend(callers[judge](prompt, system_prompt, temperature, schema=schema,
+                                      expected_tokens=expected_tokens, candidates=candidates))
+    return results[:samples]
+
+
+def multi_candidate(judge: str) -> bool:
+    """Whether this judge's evaluation runs are sampled together as candidates of one request."""
+    return JUDGE_MAX_CANDIDATES.get(judge, 1) > 1 and NUM_EVALUATION_RUNS > 1
+
+
+def prompt_run_number(judge: str, run_number: int) -> int:
+    """Run number written into the prompt: sampled runs share run 1's prompt (and its request)."""
+    return 1 if multi_candidate(judge) else run_number
+
+
+# Sampled judgements not yet handed out, per (judge, rubric, prompt)
+_sampled_runs: Dict[str, List[Dict]] = {}
+
+
+def judge_run(prompt: str, system_prompt: str, judge: str, schema, run_number: int,
+              expected_tokens: int = JUDGE_EXPECTED_OUTPUT_TOKENS, single: bool = False) -> Dict:
+    """One evaluation run's judgement of a prompt.
+    
+    For multi-candidate judges the first run of a prompt requests all
+    NUM_EVALUATION_RUNS samples at once; later runs take theirs from it without
+    another request. Other judges make one request per run, and so does
+    `single` (a re-ask of one LO missing from a batched reply, which the other
+    runs' batches usually contain).
+    """
+    if single or not multi_candidate(judge):
+        result = call_judge_api(prompt, system_prompt=system_prompt, temperature=0.3, judge=judge, schema=schema,
+                                expected_tokens=expected_tokens)
+        time.sleep(RATE_LIMIT_DELAY)
+        return result
+    
+    key = hashlib.sha256(f"{judge}\0{system_prompt}\0{prompt}".encode("utf-8")).hexdigest()
+    samples = _sampled_runs.setdefault(key, [])
+    if run_number > len(samples):
+        samples.extend(call_judge_candidates(prompt, system_prompt, temperature=0.3, judge=judge, schema=schema,
+                                             expected_tokens=expected_tokens,
+                                             samples=max(NUM_EVALUATION_RUNS, run_number) - len(samples)))
+        time.sleep(RATE_LIMIT_DELAY)
+    result = copy.deepcopy(samples[run_number - 1])
+    result["candidate_index"] = run_number - 1
+    if run_number >= NUM_EVALUATION_RUNS:
+        _sampled_runs.pop(key, None)
+    return result
+
+
 # ==================== RUBRIC DEFINITIONS ====================
 
 ABCD_RUBRIC = """
@@ -430,14 +689,99 @@ BLOOMS_QUESTIONS = [
 
 # ==================== EVALUATION PROMPTS ====================
 
-def create_abcd_evaluation_prompt(learning_objective: str, run_number: int) -> tuple:
-    """Create system prompt (rubric) and user prompt (LO to evaluate) for ABCD framework."""
-    system_prompt = f"""You are an expert educational assessment specialist. You evaluate learning objectives against the ABCD framework with strict adherence to the rubric.
+# System prompts hold only static rubric text (nothing per-LO or per-run), so they
+# stay byte-identical across calls and can be served from provider prompt caches
+ABCD_SYSTEM_PROMPT = f"""You are an expert educational assessment specialist. You evaluate learning objectives against the ABCD framework with strict adherence to the rubric.
 
 {ABCD_RUBRIC}
 
 **YOUR ROLE**: Apply this rubric consistently. Use the binary checklist first, then assign scores. Provide specific evidence from the LO for every score."""
-    
+
+SMART_SYSTEM_PROMPT = f"""You are an expert educational assessment specialist. You evaluate learning objectives against the SMART framework with strict adherence to the rubric.
+
+{SMART_RUBRIC}
+
+**YOUR ROLE**: Apply this rubric consistently. Use the binary checklist first, then assign scores. Remember: SMART Measurable is DISTINCT from ABCD Behavior - focus on assessment criteria, not just observability."""
+
+BLOOMS_SYSTEM_PROMPT = f"""You are an expert educational assessment specialist. You evaluate learning objectives against Bloom's Taxonomy with strict adherence to the rubric.
+
+{BLOOMS_RUBRIC}
+
+**YOUR ROLE**: Apply this rubric consistently. Evaluate INDIVIDUAL LOs first (verb accuracy, cognitive demand, classification), then evaluate the SET (progression, coverage). Apply hard constraints rigorously."""
+
+# Per-LO judgement schemas, shared by the single-LO and batched prompts
+ABCD_OUTPUT_SCHEMA = """{
+  "overall_scores": {
+    "audience": {"score": <1-5>, "evidence": "specific quote or observation", "weakness": "what's missing or weak"},
+    "behavior": {"score": <1-5>, "evidence": "...", "weakness": "..."},
+    "condition": {"score": <1-5>, "evidence": "...", "weakness": "..."},
+    "degree": {"score": <1-5>, "evidence": "...", "weakness": "..."}
+  },
+  "granular_responses": [
+    {
+      "criterion": "Audience",
+      "question": "Is the intended learner explicitly or clearly implicitly stated?",
+      "score": <1-5>,
+      "justification": "specific reasoning"
+    },
+    ...
+  ],
+  "composite_score": <average of 4 component scores>,
+  "overall_assessment": "Brief 2-3 sentence summary of strengths and weaknesses",
+  "improvement_suggestions": ["specific suggestion 1", "suggestion 2"]
+}"""
+
+SMART_OUTPUT_SCHEMA = """{
+  "binary_checklist": [
+    {"question": "Student knows EXACTLY what to learn?", "answer": "YES/NO", "reasoning": "..."},
+    {"question": "Can write specific exam question?", "answer": "YES/NO", "reasoning": "..."},
+    {"question": "Achievable in one semester?", "answer": "YES/NO", "reasoning": "..."},
+    {"question": "Aligns with course goals?", "answer": "YES/NO", "reasoning": "..."},
+    {"question": "Clear timeframe?", "answer": "YES/NO", "reasoning": "..."}
+  ],
+  "hard_constraints_applied": {"uses_weak_verb": false, "too_generic": false, "unrealistic_scope": false},
+  "overall_scores": {
+    "specific": {"score": <1-5>, "evidence": "specific quote or observation", "weakness": "what's missing"},
+    "measurable": {"score": <1-5>, "evidence": "...", "weakness": "..."},
+    "achievable": {"score": <1-5>, "evidence": "...", "weakness": "..."},
+    "relevant": {"score": <1-5>, "evidence": "...", "weakness": "..."},
+    "time_bound": {"score": <1-5>, "evidence": "...", "weakness": "..."}
+  },
+  "granular_responses": [
+    {
+      "criterion": "Specific",
+      "question": "Does the LO clearly identify WHAT specific concept, skill, or knowledge will be learned?",
+      "score": <1-5>,
+      "justification": "specific reasoning"
+    },
+    ...
+  ],
+  "composite_score": <average of 5 component scores>,
+  "overall_assessment": "Brief 2-3 sentence summary",
+  "improvement_suggestions": ["specific suggestion 1", "suggestion 2"]
+}"""
+
+
+def _batched_output_format(per_lo_schema: str) -> str:
+    """Wrap a per-LO schema in the {"evaluations": [...]} array used by batched requests."""
+    indented = "\n".join("    " + line for line in per_lo_schema.splitlines()[1:-1])
+    return f"""{{
+  "evaluations": [
+    {{
+      "objective_number": <1-based number from the list above>,
+{indented}
+    }},
+    ...one entry per objective, in the same order as the list
+  ]
+}}"""
+
+
+def _numbered_objectives(objectives: List[str]) -> str:
+    return "\n".join(f'{i}. "{lo}"' for i, lo in enumerate(objectives, 1))
+
+
+def create_abcd_evaluation_prompt(learning_objective: str, run_number: int) -> tuple:
+    """Create system prompt (rubric) and user prompt (LO to evaluate) for ABCD framework."""
     user_prompt = f"""**EVALUATION RUN**: {run_number}/3 (Evaluate independently each time)
 
 **LEARNING OBJECTIVE TO EVALUATE**:
@@ -454,48 +798,54 @@ def create_abcd_evaluation_prompt(learning_objective: str, run_number: int) -> t
 {json.dumps(ABCD_QUESTIONS, indent=2)}
 
 **OUTPUT FORMAT** (JSON ONLY):
-{{
-{{
-  "overall_scores": {{
-    "audience": {{"score": <1-5>, "evidence": "specific quote or observation", "weakness": "what's missing or weak"}},
-    "behavior": {{"score": <1-5>, "evidence": "...", "weakness": "..."}},
-    "condition": {{"score": <1-5>, "evidence": "...", "weakness": "..."}},
-    "degree": {{"score": <1-5>, "evidence": "...", "weakness": "..."}}
-  }},
-  "granular_responses": [
-    {{
-      "criterion": "Audience",
-      "question": "Is the intended learner explicitly or clearly implicitly stated?",
-      "score": <1-5>,
-      "justification": "specific reasoning"
-    }},
-    ...
-  ],
-  "composite_score": <average of 4 component scores>,
-  "overall_assessment": "Brief 2-3 sentence summary of strengths and weaknesses",
-  "improvement_suggestions": ["specific suggestion 1", "suggestion 2"]
-}}
+{ABCD_OUTPUT_SCHEMA}
 
 Return ONLY valid JSON. Be rigorous and objective."""
+    
+    return ABCD_SYSTEM_PROMPT, user_prompt
 
 
-def create_smart_evaluation_prompt(learning_objective: str, course_context: str, run_number: int) -> tuple:
-    """Create system prompt (rubric) and user prompt (LO to evaluate) for SMART framework."""
-    system_prompt = f"""You are an expert educational assessment specialist. You evaluate learning objectives against the SMART framework with strict adherence to the rubric.
+def create_abcd_batch_evaluation_prompt(objectives: List[str], run_number: int) -> tuple:
+    """Create system prompt (rubric) and user prompt scoring several LOs in one ABCD request."""
+    user_prompt = f"""**EVALUATION RUN**: {run_number}/3 (Evaluate independently each time)
 
-{SMART_RUBRIC}
+**LEARNING OBJECTIVES TO EVALUATE** ({len(objectives)} objectives):
+{_numbered_objectives(objectives)}
 
-**YOUR ROLE**: Apply this rubric consistently. Use the binary checklist first, then assign scores. Remember: SMART Measurable is DISTINCT from ABCD Behavior - focus on assessment criteria, not just observability."""
+**INSTRUCTIONS**:
+Evaluate EACH objective on its own, exactly as if it were the only one you were given. Do not compare objectives or let one score influence another. For each objective:
+1. First, answer the 5 binary checklist questions (YES/NO)
+2. Then, for EACH component (A, B, C, D), assign a score from 1-5 based on the rubric
+3. Apply HARD CONSTRAINTS (check if LO uses 'understand'/'know' without demonstration → Behavior ≤2)
+4. Provide specific evidence from the LO that justifies your score
+5. Identify what's missing or weak
+
+**GRANULAR QUESTIONS** (answer these for each objective):
+{json.dumps(ABCD_QUESTIONS, indent=2)}
+
+**OUTPUT FORMAT** (JSON ONLY):
+{_batched_output_format(ABCD_OUTPUT_SCHEMA)}
+
+Return ONLY valid JSON with exactly {len(objectives)} entries in "evaluations". Be rigorous and objective."""
     
+    return ABCD_SYSTEM_PROMPT, user_prompt
+
+
+def _smart_course_context(course_context: str) -> str:
+    return f"""**COURSE CONTEXT**:
+- Course: Advanced Operating Systems (CS3.304)
+- Level: Senior undergraduate / Graduate  
+- Focus: {course_context}"""
+
+
+def create_smart_evaluation_prompt(learning_objective: str, course_context: str, run_number: int) -> tuple:
+    """Create system prompt (rubric) and user prompt (LO to evaluate) for SMART framework."""
     user_prompt = f"""**EVALUATION RUN**: {run_number}/3 (Evaluate independently each time)
 
 **LEARNING OBJECTIVE TO EVALUATE**:
 "{learning_objective}"
 
-**COURSE CONTEXT**:
-- Course: Advanced Operating Systems (CS3.304)
-- Level: Senior undergraduate / Graduate  
-- Focus: {course_context}
+{_smart_course_context(course_context)}
 
 **INSTRUCTIONS**:
 1. First, answer the 5 binary checklist questions (YES/NO)
@@ -508,50 +858,44 @@ def create_smart_evaluation_prompt(learning_objective: str, course_context: str,
 {json.dumps(SMART_QUESTIONS, indent=2)}
 
 **OUTPUT FORMAT** (JSON ONLY):
-{{
-  "binary_checklist": [
-    {{"question": "Student knows EXACTLY what to learn?", "answer": "YES/NO", "reasoning": "..."}},
-    {{"question": "Can write specific exam question?", "answer": "YES/NO", "reasoning": "..."}},
-    {{"question": "Achievable in one semester?", "answer": "YES/NO", "reasoning": "..."}},
-    {{"question": "Aligns with course goals?", "answer": "YES/NO", "reasoning": "..."}},
-    {{"question": "Clear timeframe?", "answer": "YES/NO", "reasoning": "..."}}
-  ],
-  "hard_constraints_applied": {{"uses_weak_verb": false, "too_generic": false, "unrealistic_scope": false}},
-  "overall_scores": {{
-    "specific": {{"score": <1-5>, "evidence": "specific quote or observation", "weakness": "what's missing"}},
-    "measurable": {{"score": <1-5>, "evidence": "...", "weakness": "..."}},
-    "achievable": {{"score": <1-5>, "evidence": "...", "weakness": "..."}},
-    "relevant": {{"score": <1-5>, "evidence": "...", "weakness": "..."}},
-    "time_bound": {{"score": <1-5>, "evidence": "...", "weakness": "..."}}
-  }},
-  "granular_responses": [
-    {{
-      "criterion": "Specific",
-      "question": "Does the LO clearly identify WHAT specific concept, skill, or knowledge will be learned?",
-      "score": <1-5>,
-      "justification": "specific reasoning"
-    }},
-    ...
-  ],
-  "composite_score": <average of 5 component scores>,
-  "overall_assessment": "Brief 2-3 sentence summary",
-  "improvement_suggestions": ["specific suggestion 1", "suggestion 2"]
-}}
+{SMART_OUTPUT_SCHEMA}
 
 Return ONLY valid JSON. Be rigorous and objective."""
     
-    return system_prompt, user_prompt
+    return SMART_SYSTEM_PROMPT, user_prompt
 
 
-def create_blooms_evaluation_prompt(all_objectives: List[str], run_number: int) -> tuple:
-    """Create system prompt (rubric) and user prompt (LOs to evaluate) for Bloom's Taxonomy."""
-    objectives_text = "\n".join([f"{i+1}. {lo}" for i, lo in enumerate(all_objectives)])
+def create_smart_batch_evaluation_prompt(objectives: List[str], course_context: str, run_number: int) -> tuple:
+    """Create system prompt (rubric) and user prompt scoring several LOs in one SMART request."""
+    user_prompt = f"""**EVALUATION RUN**: {run_number}/3 (Evaluate independently each time)
+
+**LEARNING OBJECTIVES TO EVALUATE** ({len(objectives)} objectives):
+{_numbered_objectives(objectives)}
+
+{_smart_course_context(course_context)}
+
+**INSTRUCTIONS**:
+Evaluate EACH objective on its own, exactly as if it were the only one you were given. Do not compare objectives or let one score influence another. For each objective:
+1. First, answer the 5 binary checklist questions (YES/NO)
+2. Then, for EACH component (S, M, A, R, T), assign a score from 1-5 based on the rubric
+3. Apply HARD CONSTRAINTS (check if uses 'understand'/'know' → Measurable ≤2; generic content → Specific ≤2)
+4. Consider course context for Achievable and Relevant scores
+5. Provide specific evidence and justification
+
+**GRANULAR QUESTIONS** (answer these for each objective):
+{json.dumps(SMART_QUESTIONS, indent=2)}
+
+**OUTPUT FORMAT** (JSON ONLY):
+{_batched_output_format(SMART_OUTPUT_SCHEMA)}
+
+Return ONLY valid JSON with exactly {len(objectives)} entries in "evaluations". Be rigorous and objective."""
     
-    system_prompt = f"""You are an expert educational assessment specialist. You evaluate learning objectives against Bloom's Taxonomy with strict adherence to the rubric.
+    return SMART_SYSTEM_PROMPT, user_prompt
 
-{BLOOMS_RUBRIC}
 
-**YOUR ROLE**: Apply this rubric consistently. Evaluate INDIVIDUAL LOs first (verb accuracy, cognitive demand, classification), then evaluate the SET (progression, coverage). Apply hard constraints rigorously."""
+def create_blooms_evaluation_prompt(all_objectives: List[str], run_number: int) -> tuple:
+    """Create system prompt (rubric) and user prompt (LOs to evaluate) for Bloom's Taxonomy."""
+    objectives_text = "\n".join([f"{i+1}. {lo}" for i, lo in enumerate(all_objectives)])
     
     user_prompt = f"""**EVALUATION RUN**: {run_number}/3 (Evaluate independently each time)
 
@@ -610,38 +954,107 @@ def create_blooms_evaluation_prompt(all_objectives: List[str], run_number: int)
 
 Return ONLY valid JSON. Be rigorous and objective."""
     
-    return system_prompt, user_prompt
+    return BLOOMS_SYSTEM_PROMPT, user_prompt
 
 
 # ==================== EVALUATION EXECUTION ====================
 
-def evaluate_abcd_learning_objective(lo: str, run_number: int, judge: str = "gemini") -> Dict:
+def evaluate_abcd_learning_objective(lo: str, run_number: int, judge: str = "gemini", single: bool = False) -> Dict:
     """Evaluate a single LO against ABCD framework."""
-    system_prompt, user_prompt = create_abcd_evaluation_prompt(lo, run_number)
-    result = call_judge_api(user_prompt, system_prompt=system_prompt, temperature=0.3, judge=judge)
+    prompt_run = run_number if single else prompt_run_number(judge, run_number)
+    system_prompt, user_prompt = create_abcd_evaluation_prompt(lo, prompt_run)
+    result = judge_run(user_prompt, system_prompt, judge, ABCD_JUDGEMENT, run_number, single=single)
     result["judge"] = judge
-    time.sleep(RATE_LIMIT_DELAY)
     return result
 
 
-def evaluate_smart_learning_objective(lo: str, course_context: str, run_number: int, judge: str = "gemini") -> Dict:
+def evaluate_smart_learning_objective(lo: str, course_context: str, run_number: int, judge: str = "gemini",
+                                     single: bool = False) -> Dict:
     """Evaluate a single LO against SMART framework."""
-    system_prompt, user_prompt = create_smart_evaluation_prompt(lo, course_context, run_number)
-    result = call_judge_api(user_prompt, system_prompt=system_prompt, temperature=0.3, judge=judge)
+    prompt_run = run_number if single else prompt_run_number(judge, run_number)
+    system_prompt, user_prompt = create_smart_evaluation_prompt(lo, course_context, prompt_run)
+    result = judge_run(user_prompt, system_prompt, judge, SMART_JUDGEMENT, run_number, single=single)
     result["judge"] = judge
-    time.sleep(RATE_LIMIT_DELAY)
     return result
 
 
 def evaluate_blooms_set(objectives: List[str], run_number: int, judge: str = "gemini") -> Dict:
     """Evaluate complete set of LOs against Bloom's Taxonomy."""
-    system_prompt, user_prompt = create_blooms_evaluation_prompt(objectives, run_number)
-    result = call_judge_api(user_prompt, system_prompt=system_prompt, temperature=0.3, judge=judge)
+    system_prompt, user_prompt = create_blooms_evaluation_prompt(objectives, prompt_run_number(judge, run_number))
+    result = judge_run(user_prompt, system_prompt, judge, BLOOMS_JUDGEMENT, run_number,
+                       expected_tokens=EXPECTED_OUTPUT_TOKENS_PER_LO["BLOOMS"] * len(objectives))
     result["judge"] = judge
-    time.sleep(RATE_LIMIT_DELAY)
     return result
 
 
+def evaluate_single_lo(framework_name: str, lo: str, course_context: str, run_number: int, judge: str = "gemini",
+                       single: bool = False) -> Dict:
+    """Evaluate one LO against ABCD or SMART in its own request.
+    
+    `single` asks for this run's judgement only (one sample), for re-asks from a batch.
+    """
+    if framework_name == "ABCD":
+        return evaluate_abcd_learning_objective(lo, run_number, judge=judge, single=single)
+    return evaluate_smart_learning_objective(lo, course_context, run_number, judge=judge, single=single)
+
+
+def evaluate_lo_batch(framework_name: str, objectives: List[str], course_context: str, run_number: int,
+                      judge: str = "gemini") -> List[Dict]:
+    """Evaluate several LOs against ABCD or SMART in one request.
+    
+    The per-objective array in the reply is split back into one result per LO,
+    in input order. Objectives missing from the reply are re-asked one at a
+    time, one sample per re-ask even for multi-candidate judges.
+    """
+    prompt_run = prompt_run_number(judge, run_number)
+    if framework_name == "ABCD":
+        system_prompt, user_prompt = create_abcd_batch_evaluation_prompt(objectives, prompt_run)
+        schema = ABCD_BATCH_JUDGEMENT
+    else:
+        system_prompt, user_prompt = create_smart_batch_evaluation_prompt(objectives, course_context, prompt_run)
+        schema = SMART_BATCH_JUDGEMENT
+    result = judge_run(user_prompt, system_prompt, judge, schema, run_number,
+                       expected_tokens=EXPECTED_OUTPUT_TOKENS_PER_LO[framework_name] * len(objectives))
+    
+    by_number = {}
+    for position, entry in enumerate(result.get("evaluations", []), 1):
+        if not isinstance(entry, dict):
+            continue
+        try:
+            number = int(entry.pop("objective_number", position))
+        except (TypeError, ValueError):
+            number = position
+        by_number.setdefault(number, entry)
+    
+    evaluations = []
+    for i, lo in enumerate(objectives, 1):
+        entry = by_number.get(i)
+        if entry is None or "overall_scores" not in entry:
+            print(f"(LO {i} missing from batch, re-asking singly)", end=" ")
+            entry = evaluate_single_lo(framework_name, lo, course_context, run_number, judge, single=True)
+        else:
+            entry["judge"] = judge
+            entry["batch_size"] = len(objectives)
+        evaluations.append(entry)
+    return evaluations
+
+
+def evaluate_objectives(framework_name: str, objectives: List[str], course_context: str, run_number: int,
+                        judge: str = "gemini", batch_size: int = None) -> List[Dict]:
+    """Run one ABCD/SMART evaluation round over all LOs with one judge.
+    
+    batch_size > 1 packs that many LOs into each request (default: JUDGE_BATCH_SIZE).
+    """
+    batch_size = JUDGE_BATCH_SIZE if batch_size is None else batch_size
+    if batch_size <= 1:
+        return [evaluate_single_lo(framework_name, lo, course_context, run_number, judge) for lo in objectives]
+    
+    results = []
+    for start in range(0, len(objectives), batch_size):
+        chunk = objectives[start:start + batch_size]
+        results.extend(evaluate_lo_batch(framework_name, chunk, course_context, run_number, judge))
+    return results
+
 # ==================== CONSISTENCY ANALYSIS ====================
 
 def analyze_consistency(multiple_runs: List[Dict], framework: str) -> Dict:
@@ -832,6 +1245,15 @@ def calculate_cohens_kappa_simple(scores1: List[int], scores2: List[int]) -> flo
 
 # ==================== MAIN EVALUATION PIPELINE ====================
 
+def record_run_token_usage(run_num: int, calls: List[Dict]) -> Dict:
+    """Summarize one run's judge calls and print its cached-prompt-token ratio."""
+    usage = summarize_judge_calls(calls)
+    if usage:
+        ratios = ", ".join(f"{judge} {totals['cached_token_ratio']:.0%}" for judge, totals in usage.items())
+        print(f"    Cached prompt tokens: {ratios}")
+    return {"run": run_num, "judges": usage}
+
+
 def evaluate_framework(framework_name: str, input_file: str, course_context: str = ""):
     """Evaluate LOs from a specific framework file using dual judges."""
     
@@ -841,8 +1263,7 @@ def evaluate_framework(framework_name: str, input_file: str, course_context: str
     print(f"{'='*70}")
     
     # Load learning objectives
-    with open(input_file, 'r') as f:
-        data = json.load(f)
+    data = read_output(input_file)
     
     learning_objectives = data.get("learning_objectives", [])
     
@@ -850,6 +1271,9 @@ def evaluate_framework(framework_name: str, input_file: str, course_context: str
         print(f"❌ No learning objectives found in {input_file}")
         return
     
+    USAGE.set_context(stage=f"judge_{framework_name.lower()}", course=data.get("course_code"))
+    set_stage_deadline(f"judge_{framework_name.lower()}")
+    
     print(f"\n📚 Found {len(learning_objectives)} learning objectives")
     print(f"🔄 Running {NUM_EVALUATION_RUNS} evaluation rounds × 2 judges for inter-judge agreement\n")
     
@@ -859,7 +1283,10 @@ def evaluate_framework(framework_name: str, input_file: str, course_context: str
         gemini_runs = []
         groq_runs = []
         
+        token_usage_by_run = []
+        
         for run_num in range(1, NUM_EVALUATION_RUNS + 1):
+            calls_before = len(USAGE.calls)
             print(f"  Run {run_num}/{NUM_EVALUATION_RUNS}...")
             print(f"    Gemini 2.0 Flash...", end=" ")
             gemini_eval = evaluate_blooms_set(learning_objectives, run_num, judge="gemini")
@@ -870,6 +1297,7 @@ def evaluate_framework(framework_name: str, input_file: str, course_context: str
             groq_eval = evaluate_blooms_set(learning_objectives, run_num, judge="groq")
             groq_runs.append(groq_eval)
             print("✓")
+            token_usage_by_run.append(record_run_token_usage(run_num, USAGE.calls[calls_before:]))
         
         # Analyze consistency for each judge
         gemini_consistency = analyze_consistency(gemini_runs, "BLOOMS")
@@ -899,39 +1327,46 @@ def evaluate_framework(framework_name: str, input_file: str, course_context: str
                 "primary_judge": GEMINI_MODEL,
                 "validation_judge": GROQ_MODEL,
                 "num_runs": NUM_EVALUATION_RUNS,
+                "judge_max_candidates": JUDGE_MAX_CANDIDATES,
+                "token_usage_by_run": token_usage_by_run,
+                "retries": retry_report(),
+                "single_flight": single_flight_report(),
+                "scheduler": SCHEDULER.report(),
                 "rubric": "Bloom's Taxonomy"
             }
         }
         
     else:
-        # Evaluate each LO individually with both judges, multiple times
+        # Evaluate every LO with both judges, multiple times
+        # (JUDGE_BATCH_SIZE > 1 scores several LOs per request)
+        if JUDGE_BATCH_SIZE > 1:
+            print(f"📦 Batched mode: {JUDGE_BATCH_SIZE} LOs per judge request\n")
+        
+        runs_by_lo = {
+            "gemini": [[] for _ in learning_objectives],
+            "groq": [[] for _ in learning_objectives]
+        }
+        token_usage_by_run = []
+        for run_num in range(1, NUM_EVALUATION_RUNS + 1):
+            calls_before = len(USAGE.calls)
+            print(f"  Run {run_num}/{NUM_EVALUATION_RUNS}:")
+            for judge, label in (("gemini", "Gemini"), ("groq", "Groq")):
+                print(f"    {label}...", end=" ")
+                run_results = evaluate_objectives(framework_name, learning_objectives, course_context, run_num, judge=judge)
+                for lo_runs, lo_result in zip(runs_by_lo[judge], run_results):
+                    lo_runs.append(lo_result)
+                scores = [r.get("composite_score", 0) for r in run_results]
+                print(f"✓ Mean score: {statistics.mean(scores):.2f}")
+            token_usage_by_run.append(record_run_token_usage(run_num, USAGE.calls[calls_before:]))
+        
         all_evaluations = []
         
         for i, lo in enumerate(learning_objectives, 1):
             print(f"\n  LO {i}/{len(learning_objectives)}: {lo[:80]}...")
-            gemini_runs = []
-            groq_runs = []
-            
-            for run_num in range(1, NUM_EVALUATION_RUNS + 1):
-                print(f"    Run {run_num}/{NUM_EVALUATION_RUNS}:")
-                
-                # Gemini evaluation
-                print(f"      Gemini...", end=" ")
-                if framework_name == "ABCD":
-                    gemini_eval = evaluate_abcd_learning_objective(lo, run_num, judge="gemini")
-                elif framework_name == "SMART":
-                    gemini_eval = evaluate_smart_learning_objective(lo, course_context, run_num, judge="gemini")
-                gemini_runs.append(gemini_eval)
-                print(f"✓ Score: {gemini_eval.get('composite_score', 0):.2f}")
-                
-                # Groq evaluation
-                print(f"      Groq...", end=" ")
-                if framework_name == "ABCD":
-                    groq_eval = evaluate_abcd_learning_objective(lo, run_num, judge="groq")
-                elif framework_name == "SMART":
-                    groq_eval = evaluate_smart_learning_objective(lo, course_context, run_num, judge="groq")
-                groq_runs.append(groq_eval)
-                print(f"✓ Score: {groq_eval.get('composite_score', 0):.2f}")
+            gemini_runs = runs_by_lo["gemini"][i - 1]
+            groq_runs = runs_by_lo["groq"][i - 1]
+            print(f"    Gemini scores: {[r.get('composite_score', 0) for r in gemini_runs]}")
+            print(f"    Groq scores:   {[r.get('composite_score', 0) for r in groq_runs]}")
             
             # Analyze consistency for each judge
             gemini_consistency = analyze_consistency(gemini_runs, framework_name)
@@ -980,17 +1415,22 @@ def evaluate_framework(framework_name: str, input_file: str, course_context: str
                 "primary_judge": GEMINI_MODEL,
                 "validation_judge": GROQ_MODEL,
                 "num_runs": NUM_EVALUATION_RUNS,
+                "judge_batch_size": JUDGE_BATCH_SIZE,
+                "judge_max_candidates": JUDGE_MAX_CANDIDATES,
+                "token_usage_by_run": token_usage_by_run,
+                "retries": retry_report(),
+                "single_flight": single_flight_report(),
+                "scheduler": SCHEDULER.report(),
                 "rubric": f"{framework_name} Framework"
             }
         }
     
     # Save output
     output_file = os.path.join(OUTPUT_DIR, f"evaluation_{framework_name.lower()}.json")
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    with open(output_file, 'w') as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
+    atomic_write_json(output_file, output)
     
     print(f"\n✅ Saved evaluation results: {output_file}")
+    USAGE.write(USAGE_FILE)
     
     # Print summary
     print(f"\n{'='*70}")
@@ -1027,6 +1467,47 @@ def evaluate_framework(framework_name: str, input_file: str, course_context: str
             print(f"\n  ❌ Weak inter-judge agreement (<60% within ±1) - consider rubric refinement")
 
 
+def estimate_evaluation_spend(course_context: str) -> SpendEstimate:
+    """Pre-flight estimate of a full run's token spend, built from the real prompts."""
+    estimate = SpendEstimate()
+    judges = (("gemini", GEMINI_MODEL), ("groq", GROQ_MODEL))
+    
+    for framework_name, input_file in (("ABCD", ABCD_INPUT), ("SMART", SMART_INPUT), ("BLOOMS", BLOOMS_INPUT)):
+        if not output_exists(input_file):
+            continue
+        objectives = read_output(input_file).get("learning_objectives", [])
+        if not objectives:
+            continue
+        
+        stage = f"judge_{framework_name.lower()}"
+        per_lo = EXPECTED_OUTPUT_TOKENS_PER_LO[framework_name]
+        if framework_name == "BLOOMS":
+            requests_to_send = [(create_blooms_evaluation_prompt(objectives, 1), len(objectives))]
+        elif JUDGE_BATCH_SIZE > 1:
+            build = create_abcd_batch_evaluation_prompt if framework_name == "ABCD" else (
+                lambda chunk, run: create_smart_batch_evaluation_prompt(chunk, course_context, run))
+            requests_to_send = [
+                (build(objectives[i:i + JUDGE_BATCH_SIZE], 1), len(objectives[i:i + JUDGE_BATCH_SIZE]))
+                for i in range(0, len(objectives), JUDGE_BATCH_SIZE)
+            ]
+        else:
+            build = create_abcd_evaluation_prompt if framework_name == "ABCD" else (
+                lambda lo, run: create_smart_evaluation_prompt(lo, course_context, run))
+            requests_to_send = [(build(lo, 1), 1) for lo in objectives]
+        
+        for (system_prompt, user_prompt), num_los in requests_to_send:
+            for provider, model in judges:
+                if multi_candidate(provider):
+                    # All runs as candidates: the prompt is sent (and billed) once per request
+                    calls = math.ceil(NUM_EVALUATION_RUNS / JUDGE_MAX_CANDIDATES[provider])
+                    estimate.add(stage, provider, model, user_prompt, per_lo * num_los * NUM_EVALUATION_RUNS // calls,
+                                 system=system_prompt, calls=calls)
+                else:
+                    estimate.add(stage, provider, model, user_prompt, per_lo * num_los,
+                                 system=system_prompt, calls=NUM_EVALUATION_RUNS)
+    return estimate
+
+
 def main():
     """Run complete evaluation pipeline with dual judges."""
     print("="*70)
@@ -1035,6 +1516,13 @@ def main():
     print("  Evaluating Learning Objectives with Detailed Rubrics")
     print("="*70)
     
+    course_context = "Process scheduling, synchronization, memory management, file systems, deadlock, security"
+    
+    # Pre-flight: predict token spend from prompt sizes without calling any API
+    if "--estimate" in sys.argv:
+        estimate_evaluation_spend(course_context).print_report()
+        return
+    
     # Check API keys
     if not GEMINI_API_KEY:
         print("\n❌ GEMINI_API_KEY not found in environment!")
@@ -1051,22 +1539,20 @@ def main():
     print(f"  Validation: {GROQ_MODEL}")
     
     # Evaluate each framework
-    course_context = "Process scheduling, synchronization, memory management, file systems, deadlock, security"
-    
     # 1. ABCD Framework
-    if os.path.exists(ABCD_INPUT):
+    if output_exists(ABCD_INPUT):
         evaluate_framework("ABCD", ABCD_INPUT, course_context)
     else:
         print(f"\n⚠️  ABCD input file not found: {ABCD_INPUT}")
     
     # 2. SMART Framework
-    if os.path.exists(SMART_INPUT):
+    if output_exists(SMART_INPUT):
         evaluate_framework("SMART", SMART_INPUT, course_context)
     else:
         print(f"\n⚠️  SMART input file not found: {SMART_INPUT}")
     
     # 3. Bloom's Taxonomy
-    if os.path.exists(BLOOMS_INPUT):
+    if output_exists(BLOOMS_INPUT):
         evaluate_framework("BLOOMS", BLOOMS_INPUT, course_context)
     else:
         print(f"\n⚠️  Blooms input file not found: {BLOOMS_INPUT}")
@@ -1078,6 +1564,8 @@ def main():
     print("   - evaluation_abcd.json")
     print("   - evaluation_smart.json")
     print("   - evaluation_blooms.json")
+    print(f"   - {os.path.basename(USAGE_FILE)} (tokens, latency and cost per call / stage)")
+    USAGE.print_summary()
 
 
 if __name__ == "__main__":
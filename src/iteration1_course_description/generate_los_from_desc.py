@@ -1,14 +1,29 @@
+import hashlib
 import json
 import time
 import os
-import re
+import sys
+from pathlib import Path
 from huggingface_hub import InferenceClient
 from tqdm import tqdm
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.checkpoint import atomic_write_json
+from common.deadlines import total_timeout
+from common.json_extract import extract_json
+from common.llm_cache import get_response_cache, make_cache_key
+from common.scheduler import get_scheduler
+from common.serialization import output_exists, read_output
+from common.token_budget import get_token_budget
+from common.usage_tracker import SpendEstimate, get_usage_tracker, usage_path_for
+from common.work_queue import WorkQueue
+
 # 1. Load Environment Variables
 load_dotenv()
 API_KEY = os.getenv("HUGGINGFACE_API_KEY")
+# Optional OpenAI-compatible endpoint override (e.g. a local common/mock_llm_server.py)
+BASE_URL = os.getenv("HUGGINGFACE_BASE_URL")
 
 if not API_KEY:
     raise ValueError("Hugging Face API Key not found! Please check your .env file.")
@@ -16,8 +31,24 @@ if not API_KEY:
 # --- CONFIGURATION ---
 INPUT_FILE = '../datasets/iiit_courses_without_los_iteration_1.json'
 OUTPUT_FILE = '../datasets/iiit_courses_generated_los_iteration_1.json'
+# Per-course results keyed by a hash of the prompt inputs (see common/work_queue.py); OUTPUT_FILE is exported from it
+TASKS_DB = os.getenv("LO_TASKS_DB", '../datasets/iiit_courses_generated_los_iteration_1.tasks.sqlite3')
 
 MODEL_NAME = "gemini-2.5-lite"
+# Bump whenever create_prompt() changes, so every course is regenerated with the new prompt
+PROMPT_VERSION = "v1"
+GENERATION_METHOD = "Llama3_70B_ZeroShot_v1"
+
+# Token / latency / cost accounting, written next to the output file
+USAGE = get_usage_tracker()
+USAGE_FILE = usage_path_for(OUTPUT_FILE)
+EXPECTED_OUTPUT_TOKENS = 300  # Rough size of one LO list (pre-flight estimate and call timeout)
+# Shared provider quotas: this backfill is batch work and yields to interactive runs
+SCHEDULER = get_scheduler("batch")
+# max_tokens tuned from observed LO-list lengths; MAX_TOKENS until enough are seen (common/token_budget.py)
+TOKEN_BUDGET = get_token_budget()
+MAX_TOKENS = 4096
+PROMPT_TYPE = "lo_from_description"
 
 def create_prompt(course_title, description, syllabus):
     return f"""You are an expert Educational Curriculum Designer.
@@ -38,100 +69,164 @@ Constraints:
 
 Respond with ONLY the JSON list, nothing else."""
 
-def load_existing_progress():
-    """Checks if output file exists and loads it to resume progress."""
-    if os.path.exists(OUTPUT_FILE):
-        try:
-            with open(OUTPUT_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            return []
-    return []
+def task_key(course):
+    """Identity of one generation: a hash of exactly what goes into its prompt, plus model and prompt version."""
+    inputs = {
+        "title": course.get("Course Title", "Unknown"),
+        "description": course.get("Course Description", ""),
+        "syllabus": course.get("Detailed Syllabus", []),
+        "model": MODEL_NAME,
+        "prompt_version": PROMPT_VERSION,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def import_existing_output(queue):
+    """Carry LOs from an output file written before the task table existed over as finished tasks."""
+    if not output_exists(OUTPUT_FILE):
+        return
+    try:
+        previous = read_output(OUTPUT_FILE)
+    except ValueError:
+        return
+    # Empty LO lists were failures (or courses without a description); those are simply redone
+    done = [(task_key(c), c, json.dumps({"Generated_LOs": c["Generated_LOs"], "Generation_Method": GENERATION_METHOD}))
+            for c in previous if c.get("Generated_LOs")]
+    print(f"Imported {queue.add_many(done)} finished courses from {OUTPUT_FILE}")
+
+def export_results(queue, all_courses):
+    """Write OUTPUT_FILE (atomically): input courses in order, each with the result for its current inputs"""
+    results = queue.result_map()
+    exported = []
+    for course in all_courses:
+        result = results.get(task_key(course))
+        if result is not None:
+            exported.append({**course, **json.loads(result)})
+    atomic_write_json(OUTPUT_FILE, exported)
+    return len(exported)
+
+def request_los(client, cache, course):
+    """Generate one course's LO list (cached); raises on API errors"""
+    title = course.get("Course Title", "Unknown")
+    prompt = create_prompt(title, course.get("Course Description", ""), course.get("Detailed Syllabus", []))
+    
+    # Call Hugging Face Inference API
+    messages = [
+        {"role": "user", "content": prompt}
+    ]
+    
+    max_tokens = TOKEN_BUDGET.max_tokens(PROMPT_TYPE, MAX_TOKENS)
+    # Keyed on the default budget, not the tuned or escalated one, so a budget change never orphans replies
+    cache_key = make_cache_key("huggingface", MODEL_NAME, messages,
+                               params={"max_tokens": MAX_TOKENS, "temperature": 0.7})
+    response_text = cache.get(cache_key)
+    while response_text is None:
+        SCHEDULER.acquire(f"huggingface:{MODEL_NAME}")
+        start = time.monotonic()
+        response = client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=0.7
+        )
+        response_text = response.choices[0].message.content.strip()
+        usage = getattr(response, "usage", None)
+        USAGE.record(
+            "huggingface", MODEL_NAME,
+            prompt_tokens=getattr(usage, "prompt_tokens", None),
+            completion_tokens=getattr(usage, "completion_tokens", None),
+            latency_s=time.monotonic() - start,
+            stage="lo_generation", course=title
+        )
+        # A reply cut off by the tuned budget is re-requested with a larger one
+        finish_reason = response.choices[0].finish_reason
+        truncated = TOKEN_BUDGET.observe(PROMPT_TYPE, getattr(usage, "completion_tokens", None), max_tokens,
+                                         truncated=finish_reason == "length" if finish_reason else None)
+        larger = TOKEN_BUDGET.escalate(max_tokens, MAX_TOKENS) if truncated else None
+        if larger:
+            print(f"  ✂️  '{title[:40]}' was cut off at {max_tokens} tokens; retrying with {larger}")
+            max_tokens, response_text = larger, None
+    
+    # First complete JSON array (handles markdown code blocks and surrounding text)
+    generated_los = extract_json(response_text, list)
+    cache.put(cache_key, response_text)
+    return generated_los
 
 def generate_learning_objectives():
     # 1. Load Input Data
     try:
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-            all_courses = json.load(f)
+        all_courses = read_output(INPUT_FILE)
     except FileNotFoundError:
         print(f"Error: {INPUT_FILE} not found.")
         return
 
     # 2. Resume Logic (Don't re-do work!)
-    processed_courses = load_existing_progress()
-    processed_titles = {c.get("Course Title") for c in processed_courses}
-    
-    courses_to_process = [c for c in all_courses if c.get("Course Title") not in processed_titles]
-    
+    # Each course is a task keyed by its prompt inputs: unchanged courses keep their
+    # result, and an edited title, description or syllabus makes a new task
+    queue = WorkQueue(TASKS_DB)
+    if not any(queue.counts().values()):
+        import_existing_output(queue)
+    keys = [task_key(course) for course in all_courses]
+    # Courses without a description get no LOs and need no call
+    queue.add_many([(key, course, None if course.get("Course Description") else json.dumps({"Generated_LOs": []}))
+                    for key, course in zip(keys, all_courses)])
+    superseded = queue.discard_except(keys)
+
+    # Export only: write OUTPUT_FILE from the task table without generating anything
+    if "--export" in sys.argv:
+        print(f"Exported {export_results(queue, all_courses)} courses to {OUTPUT_FILE}")
+        return
+
+    done = queue.result_map()
+    remaining = len(set(keys) - set(done))
     print(f"Total Courses: {len(all_courses)}")
-    print(f"Already Done: {len(processed_courses)}")
-    print(f"Remaining: {len(courses_to_process)}")
+    print(f"Already Done: {sum(key in done for key in keys)}")
+    print(f"Remaining: {remaining}" + (f" ({superseded} unfinished tasks for old inputs dropped)" if superseded else ""))
     print(f"Using Model: {MODEL_NAME}")
 
+    # Pre-flight: predict token spend from prompt sizes without calling any API
+    if "--estimate" in sys.argv:
+        estimate = SpendEstimate()
+        for _, course in queue.pending():
+            prompt = create_prompt(course.get("Course Title", "Unknown"), course["Course Description"],
+                                   course.get("Detailed Syllabus", []))
+            estimate.add("lo_generation", "huggingface", MODEL_NAME, prompt, EXPECTED_OUTPUT_TOKENS)
+        estimate.print_report()
+        return
+
+    queue.retry_failed()
+
     # 3. Initialize Hugging Face Inference Client
-    client = InferenceClient(api_key=API_KEY)
-    
-    # 4. Processing Loop
-    results = processed_courses # Start with what we already have
+    # Overall per-call timeout from the expected LO-list size, so a hung request can't stall the run
+    client = InferenceClient(base_url=BASE_URL, api_key=API_KEY, timeout=total_timeout(EXPECTED_OUTPUT_TOKENS, MAX_TOKENS))
+    cache = get_response_cache()
     
-    for course in tqdm(courses_to_process):
-        title = course.get("Course Title", "Unknown")
-        desc = course.get("Course Description", "")
-        syllabus = course.get("Detailed Syllabus", [])
-        
-        if not desc:
-            course["Generated_LOs"] = []
-            results.append(course)
-            continue
-
-        prompt = create_prompt(title, desc, syllabus)
-        
-        try:
-            # Call Hugging Face Inference API
-            messages = [
-                {"role": "user", "content": prompt}
-            ]
-            
-            response = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=messages,
-                max_tokens=4096,
-                temperature=0.7
-            )
-            
-            response_text = response.choices[0].message.content.strip()
-            
-            # Extract JSON from response (handle markdown code blocks if present)
-            json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                generated_los = json.loads(json_str)
+    # 4. Processing Loop: each result is committed under its key as soon as it is ready
+    with tqdm(total=remaining) as progress:
+        while (task := queue.claim()) is not None:
+            key, course = task
+            title = course.get("Course Title", "Unknown")
+            try:
+                generated_los = request_los(client, cache, course)
+            except Exception as e:
+                print(f"Error for {title}: {e}")
+                if "429" in str(e) or "400" in str(e):
+                    print("Quota hit or API Error. Saving progress and stopping.")
+                    queue.release(key)
+                    break
+                queue.fail(key, f"{type(e).__name__}: {e}")
             else:
-                generated_los = json.loads(response_text)
-            
-            course["Generated_LOs"] = generated_los
-            course["Generation_Method"] = "Llama3_70B_ZeroShot_v1"
+                queue.complete(key, json.dumps({"Generated_LOs": generated_los, "Generation_Method": GENERATION_METHOD},
+                                               ensure_ascii=False))
+                USAGE.write(USAGE_FILE)
+            progress.update(1)
             
-        except Exception as e:
-            print(f"Error for {title}: {e}")
-            course["Generated_LOs"] = [] # Empty list on failure
-            if "429" in str(e) or "400" in str(e):
-                print("Quota hit or API Error. Saving progress and stopping.")
-                break
-        
-        results.append(course)
-        
-        # Save every 5 items so you don't lose progress if it crashes
-        if len(results) % 5 == 0:
-            with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-                json.dump(results, f, indent=2, ensure_ascii=False)
-        
-        time.sleep(4) # Respect rate limits
+            time.sleep(4) # Respect rate limits
 
     # Final Save
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
-    print(f"Done! Final dataset saved to {OUTPUT_FILE}")
+    exported = export_results(queue, all_courses)
+    print(f"Done! Final dataset saved to {OUTPUT_FILE} ({exported}/{len(all_courses)} courses)")
+    USAGE.write(USAGE_FILE)
+    USAGE.print_summary()
 
 if __name__ == "__main__":
-    generate_learning_objectives()
\ No newline at end of file
+    generate_learning_objectives()
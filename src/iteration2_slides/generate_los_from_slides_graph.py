@@ -4,11 +4,14 @@ Extracts concepts → Builds knowledge graph → Generates LOs
 Using Together AI API
 """
 
+import hashlib
 import json
 import os
+import sys
 import glob
 import time
-from typing import List, Dict, Any
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
 import requests
 from dotenv import load_dotenv
 import pdfplumber
@@ -16,10 +19,29 @@ from tqdm import tqdm
 import networkx as nx
 from collections import defaultdict
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.checkpoint import atomic_write_json
+from common.deadlines import StageDeadlineExceeded, request_timeout, set_stage_deadline
+from common.journal import Journal
+from common.json_extract import JSONExtractionError, extract_json, extract_json_partial
+from common.llm_cache import get_response_cache, make_cache_key
+from common.llm_router import get_router
+from common.retry import CircuitOpenError, RetryBudgetExhausted, call_with_retry, retry_report
+from common.scheduler import get_scheduler
+from common.schemas import CONCEPT_BATCH_SCHEMA, SchemaValidationError, compiled, lo_list_schema, openai_response_format
+from common.single_flight import coalesce, single_flight_report
+from common.token_budget import get_token_budget, token_budget_report
+from common.usage_tracker import SpendEstimate, get_usage_tracker, usage_path_for
+
 # ==================== CONFIGURATION ====================
 load_dotenv()
 TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
-if not TOGETHER_API_KEY:
+
+# Optional: route across equivalent providers (see common/llm_router.py),
+# e.g. LLM_ROUTE_CLASS=llama-70b to use the fastest healthy of Together/Groq
+ROUTE_MODEL_CLASS = os.getenv("LLM_ROUTE_CLASS")
+
+if not TOGETHER_API_KEY and not ROUTE_MODEL_CLASS:
     raise ValueError("TOGETHER_API_KEY not found in .env file!")
 
 # Paths
@@ -28,17 +50,41 @@ COURSE_TITLE = "Advanced Operating Systems"
 COURSE_CODE = "CS3.304"
 OUTPUT_FILE = "../../datasets/slide_based_los_graph_method.json"
 GRAPH_OUTPUT = "../../datasets/graphs/slides_concept_graph.json"
-PROGRESS_FILE = "../../datasets/graphs/slides_graph_extraction_progress.json"
+JOURNAL_FILE = "../../datasets/graphs/slides_graph_extraction.journal.jsonl"  # one record per completed batch
+LEGACY_PROGRESS_FILE = "../../datasets/graphs/slides_graph_extraction_progress.json"  # resume file before the journal
+USAGE_FILE = usage_path_for(OUTPUT_FILE)  # token/cost rollups per run
 
 # Model
 MODEL_NAME = "meta-llama/Meta-Llama-3-70B-Instruct-Turbo"
 
+# Default max_tokens, used until enough replies have been seen to tune them (common/token_budget.py)
+CONCEPT_MAX_TOKENS = 3000
+LO_MAX_TOKENS = 1500
+# Concept batches cut off even at the largest budget keep their complete elements; this
+# many follow-up requests then ask only for the concepts/relationships still missing
+MAX_CONTINUATIONS = int(os.getenv("TRUNCATION_CONTINUATIONS", "1"))
+
 # Rate limiting settings
 SLIDES_PER_BATCH = 25
 DELAY_BETWEEN_CALLS = 2
 
 # API endpoint
-TOGETHER_API_URL = "https://api.together.xyz/v1/chat/completions"
+TOGETHER_BASE_URL = os.getenv("TOGETHER_BASE_URL", "https://api.together.xyz/v1").rstrip("/")
+TOGETHER_API_URL = f"{TOGETHER_BASE_URL}/chat/completions"
+
+# Per-call token / latency / cost records (see common/usage_tracker.py)
+USAGE = get_usage_tracker()
+# Single-course runs are interactive: they go ahead of queued batch jobs on shared quotas
+SCHEDULER = get_scheduler("interactive")
+# max_tokens per prompt type from observed reply lengths (see common/token_budget.py)
+TOKEN_BUDGET = get_token_budget()
+
+# Structured-output schemas (sent as constraints, validated locally; see common/schemas.py)
+CONCEPT_BATCH = compiled(CONCEPT_BATCH_SCHEMA, "concept_batch")
+LO_LIST = compiled(lo_list_schema(5, 8), "lo_list")
+
+# Breaker / retry accounting key for the upstream (see common/retry.py)
+LLM_PROVIDER = f"router:{ROUTE_MODEL_CLASS}" if ROUTE_MODEL_CLASS else "together"
 
 
 # ==================== SLIDE EXTRACTION ====================
@@ -74,30 +120,92 @@ def extract_all_slides(folder_path: str) -> List[Dict]:
 
 
 # ==================== RESUME CAPABILITY ====================
-def load_progress() -> Dict:
-    """Load progress from previous run."""
-    if os.path.exists(PROGRESS_FILE):
-        try:
-            with open(PROGRESS_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return {"concepts": [], "relationships": [], "batches_processed": 0}
-    return {"concepts": [], "relationships": [], "batches_processed": 0}
+# Each completed batch appends one record to the journal (see common/journal.py):
+# {"batch", "slides", "concepts", "relationships", "partial"}. A resumed run replays it
+# and only extracts the batches it doesn't have; compaction merges the records into the
+# concept graph, and the journal is removed once every batch is in the saved graph.
+def journal_header(slides: List[Dict]) -> Dict:
+    """Identifies the inputs a journal belongs to: the same slides, batched the same way."""
+    digest = hashlib.sha256()
+    for s in slides:
+        digest.update(f"{s['source_file']}\0{s['slide_number']}\0{s['content']}\0".encode("utf-8"))
+    return {"slides": len(slides), "slides_per_batch": SLIDES_PER_BATCH, "sha256": digest.hexdigest()}
 
 
-def save_progress(progress: Dict):
-    """Save progress for resume capability."""
-    os.makedirs(os.path.dirname(PROGRESS_FILE), exist_ok=True)
-    
-    with open(PROGRESS_FILE, 'w') as f:
-        json.dump(progress, f, indent=2)
+def record_batches(record: Dict) -> List[int]:
+    """Batch numbers a journal record covers."""
+    return record.get("batches") or [record["batch"]]
+
+
+def import_legacy_progress(journal: Journal) -> List[Dict]:
+    """Carry a progress file from before the journal over as one record for its batches."""
+    try:
+        with open(LEGACY_PROGRESS_FILE, 'r') as f:
+            progress = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"  ⚠️  Ignoring unreadable {LEGACY_PROGRESS_FILE}: {e}")
+        return []
+    done = progress.get("batches_processed", 0)
+    if not done:
+        return []
+    record = {
+        "batches": list(range(1, done + 1)),
+        "concepts": progress.get("concepts", []),
+        "relationships": progress.get("relationships", []),
+        "partial_batches": progress.get("partial_batches", [])
+    }
+    journal.append(record)
+    journal.sync()
+    os.remove(LEGACY_PROGRESS_FILE)
+    print(f"  ✓ Imported {done} batches from {os.path.basename(LEGACY_PROGRESS_FILE)}")
+    return [record]
+
+
+def load_progress(slides: List[Dict]) -> Tuple[Journal, List[Dict]]:
+    """Open the extraction journal for `slides` and replay the batches already completed."""
+    journal = Journal(JOURNAL_FILE, header=journal_header(slides))
+    records = journal.replay()
+    if not records and os.path.exists(LEGACY_PROGRESS_FILE):
+        records = import_legacy_progress(journal)
+    return journal, records
+
+
+def compact_progress(records: List[Dict]) -> Dict:
+    """Merge journal records, in batch order, into the concept graph."""
+    concepts, relationships, partial_batches = [], [], []
+    for record in sorted(records, key=lambda r: record_batches(r)[0]):
+        concepts.extend(record["concepts"])
+        relationships.extend(record["relationships"])
+        partial_batches.extend(record.get("partial_batches", []))
+        if record.get("partial"):
+            partial_batches.append(record["batch"])
+    return merge_concepts({
+        "concepts": concepts,
+        "relationships": relationships,
+        "partial_batches": partial_batches
+    })
+
+
+def save_concept_graph(graph: Dict):
+    """Write the concept graph via a temp file, so a crash never leaves a half-written graph."""
+    written = atomic_write_json(GRAPH_OUTPUT, graph, ensure_ascii=True)
+    print(f"\n✓ Saved concept graph: {written}")
 
 
 # ==================== TOGETHER AI API WRAPPER ====================
-def generate_with_llama(prompt: str, json_mode: bool = True, max_tokens: int = 3000) -> str:
+def generate_with_llama(prompt: str, json_mode: bool = True, max_tokens: int = 3000,
+                        schema=None, prompt_type: Optional[str] = None) -> str:
     """
-    Generate response using Llama 3 via Together AI.
+    Generate response using Llama 3 via Together AI
+    (or via the provider router when LLM_ROUTE_CLASS is set).
+    `schema` (a CompiledSchema) constrains the output where the backend supports it.
+    With a `prompt_type`, `max_tokens` is only the default: the budget is tuned
+    from that type's observed reply lengths, and a reply cut off by it is
+    re-requested with a larger one (up to twice the default).
     """
+    default_max_tokens = max_tokens
+    if prompt_type:
+        max_tokens = TOKEN_BUDGET.max_tokens(prompt_type, default_max_tokens)
     headers = {
         "Authorization": f"Bearer {TOGETHER_API_KEY}",
         "Content-Type": "application/json"
@@ -120,49 +228,89 @@ def generate_with_llama(prompt: str, json_mode: bool = True, max_tokens: int = 3
         "top_p": 0.9
     }
     
-    if json_mode:
+    if schema is not None:
+        # The router translates the OpenAI json_schema form per backend
+        data["response_format"] = openai_response_format(
+            schema.schema, schema.name, style="json_schema" if ROUTE_MODEL_CLASS else "together")
+    elif json_mode:
         data["response_format"] = {"type": "json_object"}
     
-    try:
-        response = requests.post(TOGETHER_API_URL, headers=headers, json=data)
-        response.raise_for_status()
-        
-        result = response.json()
-        return result["choices"][0]["message"]["content"]
-        
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Together AI API Error: {str(e)}")
-
+    params = {k: v for k, v in data.items() if k not in ("model", "messages")}
+    
+    # Serve identical requests from the local response cache
+    cache = get_response_cache()
 
-def extract_json_from_response(text: str) -> Dict:
-    """
-    Extract JSON from response (handles markdown code blocks).
-    """
-    # Try to find JSON in markdown code blocks
-    if "```json" in text:
-        start = text.find("```json") + 7
-        end = text.find("```", start)
-        json_str = text[start:end].strip()
-    elif "```" in text:
-        start = text.find("```") + 3
-        end = text.find("```", start)
-        json_str = text[start:end].strip()
+    # Keyed on the call site's default max_tokens, not the tuned or escalated one: a budget
+    # change never orphans cached replies, and an escalated reply lands where waiters look for it
+    key_params = {**params, "max_tokens": default_max_tokens}
+    if ROUTE_MODEL_CLASS:
+        cache_key = make_cache_key(f"router:{ROUTE_MODEL_CLASS}", ROUTE_MODEL_CLASS, data["messages"], params=key_params)
     else:
-        json_str = text.strip()
-    
-    # Remove any leading/trailing whitespace
-    json_str = json_str.strip()
+        cache_key = make_cache_key("together", MODEL_NAME, data["messages"], params=key_params)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    def request() -> str:
+        # A routed request draws on the route class's quota, whichever backend serves it
+        SCHEDULER.acquire(f"router:{ROUTE_MODEL_CLASS}" if ROUTE_MODEL_CLASS else f"together:{MODEL_NAME}")
+        if ROUTE_MODEL_CLASS:
+            content, route_info = get_router().chat(ROUTE_MODEL_CLASS, data["messages"], **params)
+            print(f"[{route_info['backend']}]", end=" ")
+            usage = route_info["usage"]
+            finish_reason = None
+            USAGE.record(
+                route_info["backend"], route_info["model"],
+                prompt_tokens=usage.get("prompt_tokens"),
+                completion_tokens=usage.get("completion_tokens"),
+                cached_tokens=usage.get("cached_tokens") or (usage.get("prompt_tokens_details") or {}).get("cached_tokens"),
+                latency_s=route_info["latency_s"]
+            )
+        else:
+            # HTTP errors propagate unchanged so the retry engine can classify them
+            start = time.monotonic()
+            # Connect / read timeouts sized from max_tokens and clipped to the stage deadline,
+            # so a hung connection is cancelled and retried rather than blocking the pipeline
+            response = requests.post(TOGETHER_API_URL, headers=headers, json=data,
+                                     timeout=request_timeout(data["max_tokens"], data["max_tokens"]))
+            response.raise_for_status()
+        
+            result = response.json()
+            content = result["choices"][0]["message"]["content"]
+            finish_reason = result["choices"][0].get("finish_reason")
+        
+            usage = result.get("usage", {})
+            USAGE.record(
+                "together", MODEL_NAME,
+                prompt_tokens=usage.get("prompt_tokens"),
+                completion_tokens=usage.get("completion_tokens"),
+                cached_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens"),
+                latency_s=time.monotonic() - start
+            )
+    
+        if prompt_type:
+            truncated = TOKEN_BUDGET.observe(prompt_type, usage.get("completion_tokens"), data["max_tokens"],
+                                             truncated=finish_reason == "length" if finish_reason else None)
+            larger = TOKEN_BUDGET.escalate(data["max_tokens"], default_max_tokens) if truncated else None
+            if larger:
+                print(f"[cut off at {data['max_tokens']} tokens, retrying with {larger}]", end=" ")
+                data["max_tokens"] = params["max_tokens"] = larger
+                return request()
+    
+        # Only cache JSON-mode responses that parse (and match the schema), so a bad reply is re-requested.
+        # Replies cut off by max_tokens are cached as they are; callers decide what to keep of them.
+        if json_mode:
+            try:
+                parsed, partial = extract_json_partial(content, schema.expected_type if schema is not None else None)
+                if schema is not None and not partial:
+                    schema.validate(parsed)
+            except (JSONExtractionError, SchemaValidationError):
+                return content
+        cache.put(cache_key, content)
+        return content
     
-    # Parse JSON
-    try:
-        return json.loads(json_str)
-    except json.JSONDecodeError as e:
-        # Try to find JSON object in text
-        start_idx = json_str.find('{')
-        end_idx = json_str.rfind('}') + 1
-        if start_idx != -1 and end_idx > start_idx:
-            return json.loads(json_str[start_idx:end_idx])
-        raise e
+    # Identical requests already in flight (other threads or processes) share one call
+    return coalesce(cache_key, request, decode=lambda text: text)
 
 
 # ==================== CONCEPT EXTRACTION ====================
@@ -229,103 +377,135 @@ def create_concept_extraction_prompt(slides_batch: List[Dict]) -> str:
 Return ONLY valid JSON."""
 
 
-def extract_concepts_with_retry(slides: List[Dict], max_retries: int = 3) -> Dict:
+def create_continuation_prompt(batch_prompt: str, received: Dict) -> str:
     """
-    Extract concepts from all slides with smart batching and retry logic.
+    Follow-up for a concept batch whose reply was cut off: ask only for what
+    is still missing instead of repeating the whole extraction.
+    """
+    concept_names = [c["name"] for c in received["concepts"]]
+    relationship_pairs = [f"{r['source']} -> {r['target']}" for r in received["relationships"]]
+    return f"""{batch_prompt}
+
+**Continuation**: Your previous answer was cut off. These are already recorded:
+- Concepts: {json.dumps(concept_names)}
+- Relationships: {json.dumps(relationship_pairs)}
+
+Return ONLY the concepts and relationships that are NOT listed above, in the same JSON format
+(use empty arrays if nothing is missing). Keep definitions short."""
+
+
+def request_concept_batch(prompt: str) -> Dict:
+    """
+    One concept-extraction request. A reply truncated by max_tokens is repaired
+    to its complete elements and the remainder requested with continuation
+    prompts; the result is flagged "partial" if something may still be missing.
+    """
+    content = generate_with_llama(prompt, json_mode=True, max_tokens=CONCEPT_MAX_TOKENS, schema=CONCEPT_BATCH,
+                                  prompt_type="concept_batch")
+    parsed, partial = extract_json_partial(content, dict)
+    if partial:
+        # A cut in "concepts" loses the "relationships" key altogether
+        parsed.setdefault("concepts", [])
+        parsed.setdefault("relationships", [])
+    result = CONCEPT_BATCH.validate(parsed)
+    
+    continuations = 0
+    while partial and continuations < MAX_CONTINUATIONS:
+        continuations += 1
+        print(f"[truncated: {len(result['concepts'])} concepts kept, requesting the rest]", end=" ")
+        content = generate_with_llama(create_continuation_prompt(prompt, result), json_mode=True,
+                                      max_tokens=CONCEPT_MAX_TOKENS, schema=CONCEPT_BATCH,
+                                      prompt_type="concept_continuation")
+        rest, partial = extract_json_partial(content, dict)
+        rest = CONCEPT_BATCH.validate({"concepts": [], "relationships": [], **rest})
+        known = {c["name"].lower() for c in result["concepts"]}
+        result["concepts"].extend(c for c in rest["concepts"] if c["name"].lower() not in known)
+        result["relationships"].extend(rest["relationships"])
+    
+    if partial:
+        result["partial"] = True
+    return result
+
+
+def extract_concepts_with_retry(slides: List[Dict]) -> Dict:
+    """
+    Extract concepts from all slides with smart batching.
+    Retries, backoff and fail-fast are handled by common/retry.py.
     """
     print(f"\n🧠 Extracting concepts from {len(slides)} slides using Llama 3 70B...")
+    USAGE.set_context(stage="concept_extraction")
+    set_stage_deadline("concept_extraction")
     
-    # Load previous progress
-    progress = load_progress()
-    all_concepts = progress.get("concepts", [])
-    all_relationships = progress.get("relationships", [])
-    batches_done = progress.get("batches_processed", 0)
+    # Replay previous progress
+    journal, records = load_progress(slides)
+    completed = {n for record in records for n in record_batches(record)}
     
     # Calculate batches
     total_batches = (len(slides) + SLIDES_PER_BATCH - 1) // SLIDES_PER_BATCH
     
     print(f"  Processing in {total_batches} batches ({SLIDES_PER_BATCH} slides each)")
-    print(f"  Resuming from batch {batches_done + 1}")
+    if completed:
+        print(f"  Resuming: {len(completed)} batches already in {os.path.basename(JOURNAL_FILE)}")
     
-    for batch_idx in range(batches_done, total_batches):
-        start_idx = batch_idx * SLIDES_PER_BATCH
-        end_idx = min(start_idx + SLIDES_PER_BATCH, len(slides))
-        batch = slides[start_idx:end_idx]
-        
-        prompt = create_concept_extraction_prompt(batch)
-        
-        # Retry logic
-        for attempt in range(max_retries):
+    try:
+        for batch_idx in range(total_batches):
+            if batch_idx + 1 in completed:
+                continue
+            start_idx = batch_idx * SLIDES_PER_BATCH
+            end_idx = min(start_idx + SLIDES_PER_BATCH, len(slides))
+            batch = slides[start_idx:end_idx]
+            
+            prompt = create_concept_extraction_prompt(batch)
+            
+            print(f"\n  Batch {batch_idx + 1}/{total_batches} (slides {start_idx+1}-{end_idx})...", end=" ")
             try:
-                print(f"\n  Batch {batch_idx + 1}/{total_batches} (slides {start_idx+1}-{end_idx})...", end=" ")
-                
-                response_text = generate_with_llama(prompt, json_mode=True, max_tokens=3000)
-                result = json.loads(response_text)
-                
-                batch_concepts = result.get("concepts", [])
-                batch_relationships = result.get("relationships", [])
-                
-                # Validate and fix slide_numbers format
-                for concept in batch_concepts:
-                    if "slide_numbers" in concept:
-                        slide_nums = concept["slide_numbers"]
-                        if isinstance(slide_nums, list):
-                            # Ensure all elements are integers
-                            concept["slide_numbers"] = [
-                                int(x) if isinstance(x, (int, float, str)) and str(x).isdigit() else x
-                                for x in slide_nums
-                                if isinstance(x, (int, float)) or (isinstance(x, str) and x.isdigit())
-                            ]
-                
-                all_concepts.extend(batch_concepts)
-                all_relationships.extend(batch_relationships)
-                
-                print(f"✓ (+{len(batch_concepts)} concepts)")
-                
-                # Save progress
-                progress = {
-                    "concepts": all_concepts,
-                    "relationships": all_relationships,
-                    "batches_processed": batch_idx + 1
-                }
-                save_progress(progress)
-                
-                # Rate limiting
-                time.sleep(DELAY_BETWEEN_CALLS)
+                result = call_with_retry(lambda: request_concept_batch(prompt), provider=LLM_PROVIDER)
+            except (CircuitOpenError, RetryBudgetExhausted, StageDeadlineExceeded) as e:
+                # Provider is down, the run's retries are spent or the stage ran out of time:
+                # stop, keep the journal for a resume
+                print(f"\n  ❌ {e}. Progress saved.")
+                print(f"  📊 Processed {len(completed)} of {total_batches} batches so far.")
+                print(f"\n  💡 Run the script again to resume from batch {batch_idx + 1}")
                 break
-                
             except Exception as e:
-                error_str = str(e)
-                
-                if "429" in error_str or "rate" in error_str.lower():
-                    wait_time = 60 * (attempt + 1)
-                    print(f"\n  ⚠️  Rate limit hit. Waiting {wait_time}s...")
-                    time.sleep(wait_time)
-                    
-                    if attempt == max_retries - 1:
-                        print(f"\n  ❌ Failed after {max_retries} attempts. Progress saved.")
-                        print(f"  📊 Processed {batch_idx} of {total_batches} batches so far.")
-                        print(f"\n  💡 Run the script again to resume from batch {batch_idx + 1}")
-                        return merge_concepts({
-                            "concepts": all_concepts,
-                            "relationships": all_relationships
-                        })
-                else:
-                    print(f"\n  ⚠️  Error: {error_str}")
-                    if attempt == max_retries - 1:
-                        print(f"\n  ⚠️  Skipping batch after {max_retries} attempts")
-                        continue
-    
-    print(f"\n✓ Concept extraction complete!")
-    
-    # Clean up progress file
-    if os.path.exists(PROGRESS_FILE):
-        os.remove(PROGRESS_FILE)
+                print(f"\n  ⚠️  Skipping batch: {type(e).__name__}: {str(e)[:200]}")
+                continue
+            
+            # Schema validation already coerced slide_numbers to integers and dropped malformed entries
+            record = {
+                "batch": batch_idx + 1,
+                "slides": [start_idx + 1, end_idx],
+                "concepts": result["concepts"],
+                "relationships": result["relationships"],
+                "partial": bool(result.get("partial"))
+            }
+            journal.append(record)
+            records.append(record)
+            completed.add(batch_idx + 1)
+            print(f"✓ (+{len(record['concepts'])} concepts{', partial' if record['partial'] else ''})")
+            USAGE.write(USAGE_FILE)
+            
+            # Rate limiting
+            time.sleep(DELAY_BETWEEN_CALLS)
+    finally:
+        journal.close()
+    
+    # Compaction: journal records -> merged concept graph
+    graph = compact_progress(records)
+    if graph["concepts"]:
+        save_concept_graph(graph)
+    
+    if len(completed) == total_batches:
+        print(f"\n✓ Concept extraction complete!")
+        journal.remove()  # Every batch is in the saved graph now
+    else:
+        missing = [n for n in range(1, total_batches + 1) if n not in completed]
+        print(f"\n  ⚠️  Batches {missing} not extracted yet; run the script again to retry them")
     
-    return merge_concepts({
-        "concepts": all_concepts,
-        "relationships": all_relationships
-    })
+    if graph["partial_batches"]:
+        print(f"  ⚠️  Batches {graph['partial_batches']} were cut off by max_tokens; their complete concepts were kept")
+    
+    return graph
 
 
 def merge_concepts(raw_graph: Dict) -> Dict:
@@ -362,7 +542,8 @@ def merge_concepts(raw_graph: Dict) -> Dict:
     
     return {
         "concepts": list(concept_map.values()),
-        "relationships": list(unique_rels.values())
+        "relationships": list(unique_rels.values()),
+        "partial_batches": raw_graph.get("partial_batches", [])
     }
 
 
@@ -499,29 +680,52 @@ def generate_los_from_graph(graph: Dict, analysis: Dict) -> List[str]:
     """Generate learning objectives from concept graph."""
     
     print("\n📝 Generating learning objectives from knowledge graph...")
+    USAGE.set_context(stage="lo_generation")
+    set_stage_deadline("lo_generation")
     
     prompt = create_lo_prompt_from_graph(graph, analysis)
+    last_los = []
+    
+    def request_los() -> List[str]:
+        nonlocal last_los
+        last_los = extract_json(generate_with_llama(prompt, json_mode=True, max_tokens=LO_MAX_TOKENS, schema=LO_LIST,
+                                                     prompt_type="graph_lo_generation"), list)
+        return LO_LIST.validate(last_los)
     
     try:
-        response_text = generate_with_llama(prompt, json_mode=True, max_tokens=1500)
-        los = json.loads(response_text)
-        
-        if isinstance(los, list) and 5 <= len(los) <= 8:
-            print(f"✓ Generated {len(los)} learning objectives")
-            return los
-        else:
-            print("⚠️  Invalid LO format, retrying...")
-            time.sleep(3)
-            response_text = generate_with_llama(prompt, json_mode=True, max_tokens=1500)
-            los = json.loads(response_text)
-            return los
-            
+        los = call_with_retry(request_los, provider=LLM_PROVIDER, max_attempts=2)
+        print(f"✓ Generated {len(los)} learning objectives")
+        return los
+    except SchemaValidationError:
+        # Keep the last reply rather than losing it
+        return last_los
     except Exception as e:
         print(f"❌ Error generating LOs: {e}")
         return []
 
 
 # ==================== MAIN PIPELINE ====================
+def estimate_pipeline_spend(slides: List[Dict]) -> SpendEstimate:
+    """Pre-flight estimate of the pipeline's token spend from the prompts it would send."""
+    estimate = SpendEstimate()
+    provider, model = ("together", MODEL_NAME) if not ROUTE_MODEL_CLASS else get_router().model_classes[ROUTE_MODEL_CLASS][0]
+    system_prompt = "You are an expert educational curriculum designer and concept extraction specialist."
+    
+    for start_idx in range(0, len(slides), SLIDES_PER_BATCH):
+        prompt = create_concept_extraction_prompt(slides[start_idx:start_idx + SLIDES_PER_BATCH])
+        estimate.add("concept_extraction", provider, model, prompt, CONCEPT_MAX_TOKENS, system=system_prompt)
+    
+    # The LO prompt lists the top 15-20 concepts; approximate it with placeholder names
+    placeholder = {"name": "Placeholder Concept Name", "bloom": "understand"}
+    analysis = {
+        "ranked_concepts": [placeholder] * 20,
+        "graph_stats": {"total_concepts": 0, "total_relationships": 0, "density": 0}
+    }
+    estimate.add("lo_generation", provider, model, create_lo_prompt_from_graph({}, analysis), 1500,
+                 system=system_prompt)
+    return estimate
+
+
 def main():
     print("="*70)
     print("  GRAPH-BASED LEARNING OBJECTIVE GENERATION")
@@ -529,10 +733,11 @@ def main():
     print("  Slides → Concept Graph → Learning Objectives")
     print("="*70)
     
+    USAGE.set_context(course=COURSE_CODE)
+    
     # CREATE REQUIRED DIRECTORIES
     os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
     os.makedirs(os.path.dirname(GRAPH_OUTPUT), exist_ok=True)
-    os.makedirs(os.path.dirname(PROGRESS_FILE), exist_ok=True)
     
     # Step 1: Extract slides
     all_slides = extract_all_slides(SLIDE_DECKS_FOLDER)
@@ -541,6 +746,11 @@ def main():
         print("❌ No slides extracted!")
         return
     
+    # Pre-flight: predict token spend from prompt sizes without calling any API
+    if "--estimate" in sys.argv:
+        estimate_pipeline_spend(all_slides).print_report()
+        return
+    
     # Step 2: Build concept graph (with resume capability)
     concept_graph = extract_concepts_with_retry(all_slides)
     
@@ -548,11 +758,6 @@ def main():
         print("\n❌ No concepts extracted. Check your API quota.")
         return
     
-    # Save graph
-    with open(GRAPH_OUTPUT, 'w') as f:
-        json.dump(concept_graph, f, indent=2)
-    print(f"\n✓ Saved concept graph: {GRAPH_OUTPUT}")
-    
     # Step 3: Analyze graph
     print("\n📊 Analyzing concept graph...")
     analysis = analyze_graph(concept_graph)
@@ -579,21 +784,32 @@ def main():
             "total_slides": len(all_slides),
             "source_folder": SLIDE_DECKS_FOLDER,
             "generation_method": "Hierarchical Concept Dependency Graph",
-            "model_used": MODEL_NAME
+            "model_used": MODEL_NAME,
+            "routing": {
+                "model_class": ROUTE_MODEL_CLASS,
+                "backends": get_router().report()
+            } if ROUTE_MODEL_CLASS else None,
+            "retries": retry_report(),
+            "single_flight": single_flight_report(),
+            "token_budget": token_budget_report(),
+            "scheduler": SCHEDULER.report()
         },
         "concept_graph_summary": {
             "total_concepts": len(concept_graph["concepts"]),
             "total_relationships": len(concept_graph["relationships"]),
             "top_10_concepts": [c["name"] for c in analysis["ranked_concepts"][:10]],
-            "graph_density": analysis["graph_stats"]["density"]
+            "graph_density": analysis["graph_stats"]["density"],
+            "partial_batches": concept_graph["partial_batches"]
         },
         "learning_objectives": learning_objectives
     }
     
-    with open(OUTPUT_FILE, 'w') as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
+    written = atomic_write_json(OUTPUT_FILE, output)
     
-    print(f"\n✓ Saved output: {OUTPUT_FILE}")
+    print(f"\n✓ Saved output: {written}")
+    USAGE.write(USAGE_FILE)
+    print(f"✓ Saved token usage: {USAGE_FILE}")
+    USAGE.print_summary()
     
     # Display results
     print("\n" + "="*70)
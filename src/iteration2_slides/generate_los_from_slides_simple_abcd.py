@@ -16,14 +16,27 @@ Requirements:
 
 import json
 import os
+import sys
 import glob
 import time
+from pathlib import Path
 from typing import Dict, Any, List
 
 import pdfplumber
 from tqdm import tqdm
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.checkpoint import atomic_write_json
+from common.deadlines import StageDeadlineExceeded, set_stage_deadline
+from common.ollama_client import OllamaGenerator
+from common.retry import BadOutputError, retry_report
+from common.scheduler import get_scheduler
+from common.schemas import DECK_SUMMARY_LIST_SCHEMA, DECK_SUMMARY_SCHEMA, compiled, lo_list_schema
+from common.single_flight import single_flight_report
+from common.token_budget import get_token_budget, token_budget_report
+from common.usage_tracker import CHARS_PER_TOKEN, SpendEstimate, get_usage_tracker, usage_path_for
+
 # ==================== CONFIGURATION ====================
 load_dotenv()
 
@@ -47,6 +60,14 @@ MAX_DECK_TEXT_CHARS = 45000              # Per-deck truncation to avoid huge pro
 MAX_RETRIES = 3
 RETRY_SLEEP_SECONDS = 2
 RATE_LIMIT_DELAY = 5                     # Seconds to wait between API calls
+STREAM_RESPONSES = True                  # Stream tokens; abort early if output is clearly not JSON
+EXPECTED_SUMMARY_TOKENS = 800            # Rough size of one deck summary (pre-flight estimate only)
+OLLAMA_MAX_TOKENS = 4096                 # Default num_predict until reply lengths are seen (common/token_budget.py)
+
+# Response schemas: sent as Ollama's `format` constraint and validated locally (common/schemas.py)
+DECK_SUMMARY = compiled(DECK_SUMMARY_SCHEMA, "deck_summary")
+DECK_SUMMARY_LIST = compiled(DECK_SUMMARY_LIST_SCHEMA, "deck_summary_list")
+LO_LIST = compiled(lo_list_schema(5, 8), "lo_list")  # Prompt asks for 6–7; same slack as the graph pipeline
 
 
 # ==================== PDF TEXT EXTRACTION (TEXT ONLY) ====================
@@ -148,115 +169,17 @@ Rules:
 
 
 # ==================== OLLAMA API CALL HELPER ====================
-def parse_json_response(text: str) -> Any:
-    """
-    Parse JSON from API response, handling markdown code blocks and preamble text.
-    """
-    text = text.strip()
-    
-    # If there's a markdown code block, extract it
-    if "```json" in text or "```" in text:
-        # Find the start of the code block
-        start_markers = ["```json", "```"]
-        start_idx = -1
-        for marker in start_markers:
-            idx = text.find(marker)
-            if idx != -1:
-                start_idx = idx
-                break
-        
-        if start_idx != -1:
-            # Skip past the opening marker
-            text = text[start_idx:]
-            lines = text.split("\n")
-            lines = lines[1:] if lines else lines  # Remove first line with ```
-            
-            # Find closing ``` and remove it
-            json_lines = []
-            for line in lines:
-                if line.strip() == "```":
-                    break
-                json_lines.append(line)
-            text = "\n".join(json_lines)
-    
-    # If still has issues, try to find JSON object boundaries
-    text = text.strip()
-    if not text.startswith("{") and not text.startswith("["):
-        # Find first { or [
-        for i, char in enumerate(text):
-            if char in ("{", "["):
-                text = text[i:]
-                break
-    
-    return json.loads(text.strip())
-
-
-def call_ollama_api(prompt: str) -> Any:
-    """
-    Call the Ollama API to generate a response based on the given prompt.
-    Uses Ollama's generate endpoint format.
-    """
-    import requests
-
-    headers = {
-        "Authorization": f"Bearer {OLLAMA_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
-    payload = {
-        "model": MODEL_NAME,
-        "prompt": prompt,
-        "stream": False,
-        "options": {
-            "temperature": 0.3,
-            "num_predict": 4096
-        }
-    }
-
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            print(f"      [API attempt {attempt}/{MAX_RETRIES}]")
-            response = requests.post(f"{OLLAMA_API_URL}/api/generate", headers=headers, json=payload, timeout=120)
-            response.raise_for_status()
-            result = response.json()
-
-            # Extract the generated text from Ollama's response format
-            generated_text = result.get("response", "")
-            if not generated_text:
-                raise ValueError("Empty response from Ollama API")
-
-            # Parse JSON, handling markdown code blocks and preamble text
-            return parse_json_response(generated_text)
-        except requests.exceptions.HTTPError as e:
-            error_detail = ""
-            wait_time = RETRY_SLEEP_SECONDS * attempt
-            try:
-                error_json = response.json()
-                error_detail = f" - {error_json}"
-                # If rate limit, extract the suggested wait time
-                if response.status_code == 429 and "error" in error_json:
-                    error_msg = error_json["error"].get("message", "")
-                    if "try again in" in error_msg.lower():
-                        # Extract wait time like "13.335s" from message
-                        import re
-                        match = re.search(r'try again in ([\d.]+)s', error_msg)
-                        if match:
-                            wait_time = max(wait_time, float(match.group(1)) + 1)
-            except:
-                error_detail = f" - {response.text[:300]}"
-            print(f"      ⚠️  Error: {type(e).__name__}: {str(e)[:200]}{error_detail}")
-            if attempt < MAX_RETRIES:
-                print(f"      → Retrying in {wait_time:.1f}s...")
-                time.sleep(wait_time)
-            else:
-                raise
-        except Exception as e:
-            print(f"      ⚠️  Error: {type(e).__name__}: {str(e)[:200]}")
-            if attempt < MAX_RETRIES:
-                print(f"      → Retrying in {RETRY_SLEEP_SECONDS * attempt}s...")
-                time.sleep(RETRY_SLEEP_SECONDS * attempt)
-            else:
-                raise
+# Per-call tokens, latency (incl. time-to-first-token) and cost; rolled up next to the output file
+USAGE = get_usage_tracker()
+# Single-course runs are interactive: they go ahead of queued batch jobs on shared quotas
+SCHEDULER = get_scheduler("interactive")
+# num_predict per prompt type (deck summary, compression, final LOs) from observed reply lengths
+TOKEN_BUDGET = get_token_budget()
+# Cache, single-flight, scheduler, token budget and schema validation: common/ollama_client.py
+OLLAMA = OllamaGenerator(OLLAMA_API_URL, OLLAMA_API_KEY, MODEL_NAME, usage=USAGE, scheduler=SCHEDULER,
+                         token_budget=TOKEN_BUDGET, stream=STREAM_RESPONSES, default_max_tokens=OLLAMA_MAX_TOKENS,
+                         expected_tokens=EXPECTED_SUMMARY_TOKENS, max_retries=MAX_RETRIES,
+                         retry_sleep=RETRY_SLEEP_SECONDS)
 
 
 # ==================== MAIN EXECUTION ====================
@@ -266,12 +189,32 @@ def main():
     print("  TEXT-ONLY INPUTS | MAP-REDUCE (DECK SUMMARY -> FINAL LOs)")
     print("=" * 70)
 
+    USAGE.set_context(stage="connectivity_test", course=COURSE_CODE)
+
+    # Pre-flight: predict token spend from prompt sizes without calling any API
+    if "--estimate" in sys.argv:
+        estimate = SpendEstimate()
+        deck_count = 0
+        for pdf_path in sorted(glob.glob(os.path.join(SLIDE_DECKS_FOLDER, "*.pdf"))):
+            raw_text = extract_pdf_text(pdf_path)
+            if len(raw_text) < MIN_EXTRACTED_CHARS_PER_PDF:
+                continue
+            deck_count += 1
+            prompt = create_deck_summary_prompt(COURSE_TITLE, os.path.basename(pdf_path),
+                                                safe_truncate(raw_text, MAX_DECK_TEXT_CHARS))
+            estimate.add("deck_summary", "ollama", MODEL_NAME, prompt, EXPECTED_SUMMARY_TOKENS)
+        summaries_placeholder = "x" * (EXPECTED_SUMMARY_TOKENS * CHARS_PER_TOKEN * deck_count)
+        final_prompt = create_final_lo_prompt_abcd(COURSE_TITLE, COURSE_CODE, summaries_placeholder)
+        estimate.add("final_los", "ollama", MODEL_NAME, final_prompt, 600)
+        estimate.print_report()
+        return
+
     # Test API connectivity
     print("\n🔑 Testing Ollama API connection...")
     try:
         # Test with a simple generation
         test_prompt = 'Reply with valid JSON: {"status": "OK"}'
-        test_response = call_ollama_api(test_prompt)
+        test_response = OLLAMA.generate(test_prompt, use_cache=False, expect=dict)
         print(f"   ✓ API connection successful (response: {test_response})")
     except Exception as e:
         print(f"   ❌ API connection failed: {type(e).__name__}: {str(e)}")
@@ -285,6 +228,8 @@ def main():
         return
 
     # -------- MAP: summarize each deck --------
+    USAGE.set_context(stage="deck_summary")
+    set_stage_deadline("deck_summary")
     deck_summaries: List[Dict[str, Any]] = []
     extraction_report: List[Dict[str, Any]] = []
 
@@ -312,7 +257,7 @@ def main():
 
             print(f"   → Calling Ollama API...")
             prompt = create_deck_summary_prompt(COURSE_TITLE, filename, deck_text)
-            deck_summary = call_ollama_api(prompt)
+            deck_summary = OLLAMA.generate(prompt, schema=DECK_SUMMARY)
             print(f"   ✓ Received summary")
             
             # Rate limit protection: wait between requests
@@ -335,6 +280,15 @@ def main():
                 "status": "summarized"
             })
 
+        except StageDeadlineExceeded as e:
+            # Keep the summaries so far; the remaining decks are left out
+            print(f"   ⏱  {e}; summarizing stops here")
+            extraction_report.append({
+                "deck": filename,
+                "extracted_chars": None,
+                "status": "skipped_stage_deadline"
+            })
+            break
         except Exception as e:
             print(f"   ❌ Error processing {filename}: {str(e)}")
             extraction_report.append({
@@ -358,6 +312,8 @@ def main():
     all_summaries_json = json.dumps(deck_summaries, ensure_ascii=False)
     # Soft cap; if too long, compress again by asking Ollama to merge summaries
     if len(all_summaries_json) > 120000:
+        USAGE.set_context(stage="compress_summaries")
+        set_stage_deadline("compress_summaries")
         compress_prompt = f"""
 You are an expert OS instructor.
 Compress the following JSON list of deck summaries into a smaller JSON list.
@@ -372,11 +328,20 @@ Return ONLY JSON list with same schema items:
 INPUT:
 {all_summaries_json}
 """
-        deck_summaries = call_ollama_api(compress_prompt)
+        # The merged list is expected to be about half the size of its input
+        deck_summaries = OLLAMA.generate(compress_prompt, schema=DECK_SUMMARY_LIST,
+                                         expected_tokens=len(deck_summaries) * EXPECTED_SUMMARY_TOKENS // 2)
         all_summaries_json = json.dumps(deck_summaries, ensure_ascii=False)
 
+    USAGE.set_context(stage="final_los")
+    set_stage_deadline("final_los")
     final_prompt = create_final_lo_prompt_abcd(COURSE_TITLE, COURSE_CODE, all_summaries_json)
-    learning_objectives = call_ollama_api(final_prompt)
+    try:
+        learning_objectives = OLLAMA.generate(final_prompt, schema=LO_LIST, prompt_type="final_los_abcd")
+    except BadOutputError as e:
+        # Still unusable after every retry; the deck summaries stay cached for the next run
+        print(f"❌ Final LOs failed validation: {e}")
+        learning_objectives = None
 
     if not isinstance(learning_objectives, list) or not all(isinstance(x, str) for x in learning_objectives):
         print("❌ Final LOs came back in an invalid format.")
@@ -394,18 +359,25 @@ INPUT:
             "num_pdfs_found": len(pdf_files),
             "num_decks_summarized": len(deck_summaries),
             "per_deck_text_truncation_chars": MAX_DECK_TEXT_CHARS,
-            "note": "Per-deck prompts may truncate very long extracted text, but every PDF contributes via per-deck summaries."
+            "note": "Per-deck prompts may truncate very long extracted text, but every PDF contributes via per-deck summaries.",
+            "streamed_responses": STREAM_RESPONSES,
+            "token_usage": USAGE.rollup()["totals"],
+            "retries": retry_report(),
+            "single_flight": single_flight_report(),
+            "token_budget": token_budget_report(),
+            "scheduler": SCHEDULER.report()
         },
         "extraction_report": extraction_report,
         "deck_summaries": deck_summaries,
         "learning_objectives": learning_objectives
     }
 
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
+    written = atomic_write_json(OUTPUT_FILE, output)
 
     # -------- DISPLAY RESULTS --------
-    print(f"\n✓ Saved output to: {OUTPUT_FILE}")
+    print(f"\n✓ Saved output to: {written}")
+    print(f"✓ Saved token usage to: {USAGE.write(usage_path_for(OUTPUT_FILE))}")
+    USAGE.print_summary()
     print("\n" + "=" * 70)
     print("  GENERATED LEARNING OUTCOMES (ABCD)")
     print("=" * 70)
@@ -2,9 +2,21 @@ import json
 import time
 import os
 import re
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 import google.generativeai as genai
-from google.api_core import retry
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.checkpoint import CheckpointWriter, atomic_write_json
+from common.deadlines import total_timeout
+from common.json_extract import extract_json
+from common.llm_cache import get_response_cache, make_cache_key
+from common.retry import call_with_retry
+from common.scheduler import get_scheduler
+from common.serialization import output_exists, read_output
+from common.single_flight import coalesce
+from common.usage_tracker import SpendEstimate, genai_token_counts, get_usage_tracker, usage_path_for
 
 # --- 1. SETUP ---
 load_dotenv()
@@ -17,11 +29,25 @@ OUT_BLOOMS = '../datasets/iiit_taxonomy_blooms.json'
 OUT_ABCD = '../datasets/iiit_taxonomy_abcd.json'
 OUT_SMART = '../datasets/iiit_taxonomy_smart.json'
 
+# Token / latency / cost accounting (one report for all three outputs)
+USAGE = get_usage_tracker()
+USAGE_FILE = usage_path_for('../datasets/iiit_taxonomy.json')
+EXPECTED_OUTPUT_TOKENS = 2000  # Rough size of one per-course analysis (pre-flight estimate and call timeout)
+
+# Shared provider quotas: taxonomy tagging is batch work and yields to interactive runs
+SCHEDULER = get_scheduler("batch")
+
 # Configure Gemini
 if os.getenv("GEMINI_API_KEY"):
-    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    if os.getenv("GEMINI_BASE_URL"):
+        # Local stand-in server (e.g. common/mock_llm_server.py); the SDK adds /v1beta itself
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"), transport="rest",
+                        client_options={"api_endpoint": os.getenv("GEMINI_BASE_URL").rstrip("/").removesuffix("/v1beta")})
+    else:
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
     # Using the specific Gemma model you requested
-    model = genai.GenerativeModel('models/gemma-3-27b-it')
+    MODEL_NAME = 'models/gemma-3-27b-it'
+    model = genai.GenerativeModel(MODEL_NAME)
 else:
     print("ERROR: GEMINI_API_KEY not found.")
     exit()
@@ -83,43 +109,62 @@ def get_user_content(course):
     LOs: {json.dumps(course.get('LOs/COs', []))}
     """
 
-def extract_json(text):
-    """Clean markdown code blocks from response."""
-    try:
-        # If response is wrapped in ```json ... ```, strip it
-        if "```json" in text:
-            text = text.split("```json")[1].split("```")[0]
-        elif "```" in text:
-            text = text.split("```")[1].split("```")[0]
-        return json.loads(text)
-    except Exception:
-        return None
-
-@retry.Retry(predicate=retry.if_exception_type(Exception))
 def generate_taxonomies(course):
-    try:
+    cache = get_response_cache()
+    user_content = get_user_content(course)
+    cache_key = make_cache_key("google-generativeai", MODEL_NAME, user_content, system=SYSTEM_PROMPT)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return extract_json(cached, dict)
+
+    def request():
+        SCHEDULER.acquire(f"gemini:{MODEL_NAME}")
         # Removed generation_config={"response_mime_type": "application/json"}
+        start = time.monotonic()
         response = model.generate_content(
-            contents=[SYSTEM_PROMPT, get_user_content(course)]
+            contents=[SYSTEM_PROMPT, user_content],
+            # Cancel a hung call (and retry it) instead of waiting on it indefinitely
+            request_options={"timeout": total_timeout(EXPECTED_OUTPUT_TOKENS)}
         )
-        return extract_json(response.text)
+        USAGE.record("gemini", MODEL_NAME, **genai_token_counts(response),
+                     latency_s=time.monotonic() - start, stage="taxonomy_analysis",
+                     course=course.get('Course Title', 'Unknown'))
+        # Raises JSONExtractionError (a BadOutputError) if there is no JSON object in the reply
+        result = extract_json(response.text, dict)
+        cache.put(cache_key, response.text)
+        return result
+
+    # Bounded retries with backoff (common/retry.py) instead of retrying forever
+    try:
+        return coalesce(cache_key, lambda: call_with_retry(request, provider="gemini"),
+                        decode=lambda text: extract_json(text, dict))
     except Exception as e:
         print(f"  [Error] {e}")
         return None
 
 def save_files(blooms_data, abcd_data, smart_data):
-    with open(OUT_BLOOMS, 'w') as f: json.dump(blooms_data, f, indent=2)
-    with open(OUT_ABCD, 'w') as f: json.dump(abcd_data, f, indent=2)
-    with open(OUT_SMART, 'w') as f: json.dump(smart_data, f, indent=2)
+    # Temp file + rename: an interrupt never leaves a truncated output (common/checkpoint.py)
+    atomic_write_json(OUT_BLOOMS, blooms_data, ensure_ascii=True)
+    atomic_write_json(OUT_ABCD, abcd_data, ensure_ascii=True)
+    atomic_write_json(OUT_SMART, smart_data, ensure_ascii=True)
+    USAGE.write(USAGE_FILE)
 
 # --- 4. MAIN PIPELINE ---
 def main():
-    if not os.path.exists(INPUT_FILE):
+    if not output_exists(INPUT_FILE):
         print(f"Error: {INPUT_FILE} not found.")
         return
 
-    with open(INPUT_FILE, 'r') as f:
-        courses = json.load(f)
+    courses = read_output(INPUT_FILE)
+
+    # Pre-flight: predict token spend from prompt sizes without calling any API
+    if "--estimate" in sys.argv:
+        estimate = SpendEstimate()
+        for course in courses:
+            estimate.add("taxonomy_analysis", "gemini", MODEL_NAME, get_user_content(course),
+                         EXPECTED_OUTPUT_TOKENS, system=SYSTEM_PROMPT)
+        estimate.print_report()
+        return
 
     # Initialize separate lists for each output file
     all_blooms = []
@@ -128,58 +173,56 @@ def main():
 
     print(f"--- Starting Taxonomy Analysis for {len(courses)} courses ---")
 
-    for i, course in enumerate(courses):
-        title = course.get('Course Title', 'Unknown')
-        print(f"[{i+1}/{len(courses)}] Analyzing: {title}")
+    # Save every CHECKPOINT_EVERY results or CHECKPOINT_INTERVAL seconds, and on exit (also on Ctrl-C)
+    with CheckpointWriter(lambda: save_files(all_blooms, all_abcd, all_smart)) as checkpoint:
+        for i, course in enumerate(courses):
+            title = course.get('Course Title', 'Unknown')
+            print(f"[{i+1}/{len(courses)}] Analyzing: {title}")
 
-        # Call Gemini
-        result = generate_taxonomies(course)
+            # Call Gemini
+            result = generate_taxonomies(course)
 
-        if result and 'analysis' in result:
-            # Process the results into separate structures
-            blooms_entry = {"Course Title": title, "LO_Analysis": []}
-            abcd_entry = {"Course Title": title, "LO_Analysis": []}
-            smart_entry = {"Course Title": title, "LO_Analysis": []}
+            if result and 'analysis' in result:
+                # Process the results into separate structures
+                blooms_entry = {"Course Title": title, "LO_Analysis": []}
+                abcd_entry = {"Course Title": title, "LO_Analysis": []}
+                smart_entry = {"Course Title": title, "LO_Analysis": []}
 
-            for item in result['analysis']:
-                lo_text = item.get('original_text', '')
+                for item in result['analysis']:
+                    lo_text = item.get('original_text', '')
                 
-                # Split the data
-                blooms_entry["LO_Analysis"].append({
-                    "original_lo": lo_text,
-                    "blooms_taxonomy": item.get('blooms_taxonomy')
-                })
-                abcd_entry["LO_Analysis"].append({
-                    "original_lo": lo_text,
-                    "abcd_model": item.get('abcd_model')
-                })
-                smart_entry["LO_Analysis"].append({
-                    "original_lo": lo_text,
-                    "smart_framework": item.get('smart_framework')
-                })
-
-            # Append to main lists
-            all_blooms.append(blooms_entry)
-            all_abcd.append(abcd_entry)
-            all_smart.append(smart_entry)
+                    # Split the data
+                    blooms_entry["LO_Analysis"].append({
+                        "original_lo": lo_text,
+                        "blooms_taxonomy": item.get('blooms_taxonomy')
+                    })
+                    abcd_entry["LO_Analysis"].append({
+                        "original_lo": lo_text,
+                        "abcd_model": item.get('abcd_model')
+                    })
+                    smart_entry["LO_Analysis"].append({
+                        "original_lo": lo_text,
+                        "smart_framework": item.get('smart_framework')
+                    })
+
+                # Append to main lists
+                all_blooms.append(blooms_entry)
+                all_abcd.append(abcd_entry)
+                all_smart.append(smart_entry)
             
-            print("  > Success")
-        else:
-            print("  > Failed or Empty Response")
-
-        # Save periodically (every 5 courses)
-        if i % 5 == 0:
-            save_files(all_blooms, all_abcd, all_smart)
-        
-        # Rate Limit Safety
-        time.sleep(2)
-
-    # Final Save
-    save_files(all_blooms, all_abcd, all_smart)
+                print("  > Success")
+                checkpoint.add()
+            else:
+                print("  > Failed or Empty Response")
+
+            # Rate Limit Safety
+            time.sleep(2)
+
     print("\nProcessing Complete!")
     print(f"1. Bloom's Data saved to: {OUT_BLOOMS}")
     print(f"2. ABCD Data saved to:   {OUT_ABCD}")
     print(f"3. SMART Data saved to:  {OUT_SMART}")
+    USAGE.print_summary()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
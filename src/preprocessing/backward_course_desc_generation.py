@@ -1,76 +1,58 @@
 import json
 import time
 import os
+import sys
+import threading
+from pathlib import Path
 from dotenv import load_dotenv
 import google.generativeai as genai
-from google.api_core import exceptions, retry
-from collections import deque
-from datetime import datetime, timedelta
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.checkpoint import atomic_write_json
+from common.deadlines import total_timeout
+from common.llm_cache import get_response_cache, make_cache_key
+from common.retry import call_with_retry
+from common.scheduler import get_scheduler
+from common.serialization import output_exists, read_output
+from common.usage_tracker import SpendEstimate, genai_token_counts, get_usage_tracker, usage_path_for
+from common.work_queue import WorkQueue
 
 # --- 1. CONFIGURATION ---
 load_dotenv()
 SOURCE_FILE = '../datasets/iiit_poc_monsoon_2024.json'
 OUTPUT_FILE = '../datasets/iiit_course_descriptions_generated.json'
+# Per-course task table (see common/work_queue.py); OUTPUT_FILE is exported from it
+QUEUE_DB = os.getenv("DESC_QUEUE_DB", '../datasets/iiit_course_descriptions.queue.sqlite3')
+WORKERS = int(os.getenv("DESC_WORKERS", "1"))  # Worker threads; more processes may run against the same queue
 
 MODEL_NAME = 'gemini-2.5-flash'
 
+# Token / latency / cost accounting, written next to the output file
+USAGE = get_usage_tracker()
+USAGE_FILE = usage_path_for(OUTPUT_FILE)
+EXPECTED_OUTPUT_TOKENS = 250  # Rough size of one description (pre-flight estimate and call timeout)
+
 if os.getenv("GEMINI_API_KEY"):
-    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    if os.getenv("GEMINI_BASE_URL"):
+        # Local stand-in server (e.g. common/mock_llm_server.py); the SDK adds /v1beta itself
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"), transport="rest",
+                        client_options={"api_endpoint": os.getenv("GEMINI_BASE_URL").rstrip("/").removesuffix("/v1beta")})
+    else:
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
     model = genai.GenerativeModel(MODEL_NAME)
 else:
     print("ERROR: GEMINI_API_KEY not found.")
     exit()
 
-# --- 2. ENHANCED RATE LIMITER ---
-class RateLimiter:
-    def __init__(self, requests_per_minute=4, requests_per_day=18):
-        """
-        Initialize rate limiter with BOTH per-minute and per-day limits.
-        """
-        self.rpm = requests_per_minute
-        self.rpd = requests_per_day
-        self.minute_requests = deque()
-        self.day_requests = deque()
-        self.total_requests_today = 0
-    
-    def wait_if_needed(self):
-        """Wait if EITHER rate limit would be exceeded"""
-        now = datetime.now()
-        
-        # Clean up old timestamps (>60s for minute, >24h for day)
-        while self.minute_requests and (now - self.minute_requests[0]).total_seconds() > 60:
-            self.minute_requests.popleft()
-        
-        while self.day_requests and (now - self.day_requests[0]).total_seconds() > 86400:
-            self.day_requests.popleft()
-        
-        # Check per-minute limit
-        if len(self.minute_requests) >= self.rpm:
-            sleep_time = 60 - (now - self.minute_requests[0]).total_seconds()
-            if sleep_time > 0:
-                print(f"  ⏳ Per-minute limit reached ({self.rpm} req/min). Waiting {sleep_time:.1f}s...")
-                time.sleep(sleep_time + 1)
-                now = datetime.now()
-                while self.minute_requests and (now - self.minute_requests[0]).total_seconds() > 60:
-                    self.minute_requests.popleft()
-        
-        # Check per-day limit
-        if len(self.day_requests) >= self.rpd:
-            sleep_time = 86400 - (now - self.day_requests[0]).total_seconds()
-            print(f"  ⚠️ DAILY LIMIT REACHED ({self.rpd} req/day)!")
-            print(f"  💤 Script will resume in {sleep_time/3600:.1f} hours...")
-            time.sleep(sleep_time + 60)
-            now = datetime.now()
-            while self.day_requests and (now - self.day_requests[0]).total_seconds() > 86400:
-                self.day_requests.popleft()
-        
-        # Record this request
-        self.minute_requests.append(now)
-        self.day_requests.append(now)
-        self.total_requests_today += 1
-
-# Initialize with BOTH limits (adjust as needed for your tier)
-rate_limiter = RateLimiter(requests_per_minute=4, requests_per_day=18)  # Conservative limits
+# --- 2. SHARED QUOTA SCHEDULER ---
+# Quotas, the waiting queue and the request log live in a shared SQLite store
+# (see common/scheduler.py), so restarts and concurrent scripts on this machine
+# all draw from one budget, and interactive runs go ahead of this batch job.
+QUOTA_BUCKET = f"gemini:{MODEL_NAME}"
+SCHEDULER = get_scheduler("batch")
+# Conservative default limits (adjust for your tier); a quota set with
+# `python -m common.scheduler set-quota` takes precedence
+SCHEDULER.set_quota(QUOTA_BUCKET, rpm=4, rpd=18, if_missing=True)
 
 # --- 3. PROMPT ---
 SYSTEM_PROMPT = """
@@ -99,96 +81,164 @@ def format_user_prompt(course):
     """
 
 def generate_description(course, max_retries=3):
-    """Generate with exponential backoff on rate limit errors"""
-    for attempt in range(max_retries):
-        try:
-            # Apply rate limiting BEFORE making the API call
-            rate_limiter.wait_if_needed()
-            
-            response = model.generate_content(
-                contents=[SYSTEM_PROMPT, format_user_prompt(course)]
-            )
-            return response.text.strip()
-            
-        except exceptions.ResourceExhausted as e:
-            # Parse retry_delay from error if available
-            retry_delay = 60  # default
-            if hasattr(e, 'retry_delay') and e.retry_delay:
-                retry_delay = e.retry_delay.seconds + 5  # Add buffer
-            
-            print(f"  ⚠️ Rate Limit Hit! (Attempt {attempt+1}/{max_retries})")
-            print(f"  💤 Waiting {retry_delay}s as suggested by API...")
-            time.sleep(retry_delay)
-            
-            if attempt == max_retries - 1:
-                print(f"  ❌ Failed after {max_retries} attempts")
-                return None
-                
-        except Exception as e:
-            print(f"  ❌ Error: {e}")
-            return None
-    
-    return None
-
-# --- 4. MAIN LOGIC ---
-def main():
-    # Load Data: Try to load the "work in progress" file first
-    if os.path.exists(OUTPUT_FILE):
-        print(f"Resuming from {OUTPUT_FILE}...")
-        with open(OUTPUT_FILE, 'r', encoding='utf-8') as f:
-            courses = json.load(f)
-    elif os.path.exists(SOURCE_FILE):
-        print(f"Starting fresh from {SOURCE_FILE}...")
-        with open(SOURCE_FILE, 'r', encoding='utf-8') as f:
-            courses = json.load(f)
-    else:
-        print("Error: No data file found.")
-        return
-
-    print(f"Total Courses: {len(courses)}")
-    print(f"Rate Limits: {rate_limiter.rpm} req/min, {rate_limiter.rpd} req/day\n")
-
-    # Loop through courses
-    processed = 0
-    skipped = 0
-    
-    for i, course in enumerate(courses):
-        title = course.get('Course Title', 'Unknown')
+    """Generate with jittered exponential backoff on rate limit / transient errors; raises once retries are spent"""
+    # Cache hits don't touch the API, so check before spending daily quota
+    cache = get_response_cache()
+    user_prompt = format_user_prompt(course)
+    cache_key = make_cache_key("google-generativeai", MODEL_NAME, user_prompt, system=SYSTEM_PROMPT)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    def request():
+        # Wait for a quota slot BEFORE making the API call
+        SCHEDULER.acquire(QUOTA_BUCKET)
         
+        start = time.monotonic()
+        response = model.generate_content(
+            contents=[SYSTEM_PROMPT, user_prompt],
+            # Cancel a hung call (and retry it) instead of waiting on it indefinitely
+            request_options={"timeout": total_timeout(EXPECTED_OUTPUT_TOKENS)}
+        )
+        USAGE.record("gemini", MODEL_NAME, **genai_token_counts(response),
+                     latency_s=time.monotonic() - start, stage="description_generation",
+                     course=course.get('Course Title', 'Unknown'))
+        text = response.text.strip()
+        if text:
+            cache.put(cache_key, text)  # An empty reply is a failure; don't replay it from the cache
+        return text
+    
+    # Backoff honours the API's suggested retry_delay on ResourceExhausted (common/retry.py)
+    return call_with_retry(request, provider="gemini", max_attempts=max_retries, base_delay=30)
+
+# --- 4. WORK QUEUE ---
+def course_keys(courses):
+    """Stable per-course task keys: code and title, numbered when a pair repeats"""
+    keys, seen = [], {}
+    for course in courses:
+        key = f"{course.get('Course Code', '')}|{course.get('Course Title', 'Unknown')}"
+        seen[key] = seen.get(key, 0) + 1
+        keys.append(key if seen[key] == 1 else f"{key}#{seen[key]}")
+    return keys
+
+def seed_queue(queue):
+    """Register every course as a task; courses that already have a description are recorded as done"""
+    # An exported OUTPUT_FILE carries descriptions from earlier runs (or from before the queue existed)
+    source = OUTPUT_FILE if output_exists(OUTPUT_FILE) else SOURCE_FILE
+    if not output_exists(source):
+        return False
+    courses = read_output(source)
+
+    tasks = []
+    for key, course in zip(course_keys(courses), courses):
         # Flatten structure
         if 'Description_Candidates' in course:
             candidates = course['Description_Candidates']
             if 'Gemini' in candidates and candidates['Gemini']:
                 course['Course Description'] = candidates['Gemini']
             del course['Description_Candidates']
-
-        # Resume logic
         current_desc = course.get('Course Description')
-        if current_desc and len(current_desc) > 20:
-            skipped += 1
-            print(f"[{i+1}/{len(courses)}] ✓ Skipping '{title[:40]}...' (Done)")
-            continue
+        tasks.append((key, course, current_desc if current_desc and len(current_desc) > 20 else None))
 
-        print(f"[{i+1}/{len(courses)}] 🔄 Generating: '{title[:40]}...'")
+    added = queue.add_many(tasks)
+    print(f"Queue: {QUEUE_DB} ({added} new courses from {source})")
+    return True
 
-        # Generate with retry logic
-        desc = generate_description(course, max_retries=3)
-        if desc:
+def export_results(queue):
+    """Write OUTPUT_FILE from the queue (temp file + rename, so readers never see a partial file)"""
+    courses = []
+    for _, course, desc in queue.results():
+        if desc is not None:
             course['Course Description'] = desc
-            processed += 1
-            print(f"  ✅ Success (Today: {rate_limiter.total_requests_today}/{rate_limiter.rpd})")
-            
-            # Save Progress IMMEDIATELY
-            with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-                json.dump(courses, f, indent=2, ensure_ascii=False)
-        else:
+        courses.append(course)
+    atomic_write_json(OUTPUT_FILE, courses)
+    return len(courses)
+
+def run_worker(queue, rpd, counts, lock):
+    """Claim and process courses until the queue is drained"""
+    while True:
+        task = queue.claim()
+        if task is None:
+            return
+        key, course = task
+        title = course.get('Course Title', 'Unknown')
+        print(f"🔄 Generating: '{title[:40]}...'")
+
+        try:
+            desc = generate_description(course, max_retries=3)
+        except Exception as e:
+            print(f"  ❌ Error: {type(e).__name__}: {e}")
             print(f"  ⚠️ Skipped due to persistent errors")
+            queue.fail(key, f"{type(e).__name__}: {e}")
+            with lock:
+                counts["failed"] += 1
+            continue
+
+        if not desc:
+            print(f"  ❌ Empty description returned")
+            queue.fail(key, "empty description")
+            with lock:
+                counts["failed"] += 1
+            continue
+
+        # Commit this course's result on its own row
+        queue.complete(key, desc)
+        with lock:
+            counts["processed"] += 1
+        print(f"  ✅ Success (Today: {SCHEDULER.requests_today(QUOTA_BUCKET)}/{rpd})")
+
+# --- 5. MAIN LOGIC ---
+def main():
+    queue = WorkQueue(QUEUE_DB)
+    if not seed_queue(queue):
+        print("Error: No data file found.")
+        return
+
+    # Export only: write OUTPUT_FILE from the queue without generating anything
+    if "--export" in sys.argv:
+        print(f"📁 Exported {export_results(queue)} courses to {OUTPUT_FILE}")
+        return
+
+    status = queue.counts()
+    print(f"Total Courses: {sum(status.values())} | Done: {status['done']} | "
+          f"To do: {status['pending'] + status['running']} | Failed: {status['failed']}")
+
+    # Pre-flight: predict token spend for the courses still missing a description
+    if "--estimate" in sys.argv:
+        estimate = SpendEstimate()
+        for _, course in queue.pending():
+            estimate.add("description_generation", "gemini", MODEL_NAME, format_user_prompt(course),
+                         EXPECTED_OUTPUT_TOKENS, system=SYSTEM_PROMPT)
+        estimate.print_report()
+        return
 
+    retried = queue.retry_failed()
+    if retried:
+        print(f"Retrying {retried} failed courses")
+    rpm, rpd = SCHEDULER.quota(QUOTA_BUCKET)
+    print(f"Rate Limits: {rpm} req/min, {rpd} req/day\n")
+
+    # Workers claim courses from the queue; other processes running this script share it
+    counts = {"processed": 0, "failed": 0}
+    lock = threading.Lock()
+    workers = [threading.Thread(target=run_worker, args=(queue, rpd, counts, lock), daemon=True)
+               for _ in range(max(1, WORKERS))]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    # Once per run, from the main thread (the report is shared with other processes on this queue)
+    USAGE.write(USAGE_FILE)
+    export_results(queue)
+    status = queue.counts()
     print(f"\n{'='*60}")
     print(f"✅ Batch Complete!")
-    print(f"📊 Processed: {processed} | Skipped: {skipped} | Failed: {len(courses)-processed-skipped}")
+    print(f"📊 Processed: {counts['processed']} | Failed: {counts['failed']} | "
+          f"Done overall: {status['done']}/{sum(status.values())}")
     print(f"📁 Output: {OUTPUT_FILE}")
     print(f"{'='*60}")
+    USAGE.print_summary()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()